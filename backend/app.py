@@ -1,16 +1,67 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response
+import json
+import logging
 import sqlite3
 import os
-from flask_cors import CORS
+from flask_mail import Mail, Message
 import secrets
 import requests
 import threading
 import time
-import base64
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
 from datetime import datetime
+from app_logging import init_request_logging, setup_logging
+from bookings import BookingStore, InvalidCursor
+from cache import LRUCache
+from cors import CorsPolicy
+from credentials import CredentialsBusy, PasswordHasher
+from db_pool import ConnectionPool
+from destinations import DestinationPages, DestinationStore
+from http_cache import ResponseCache, TableVersions
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, init_request_metrics
+import migrations
+from newsletter import NewsletterQueue
+from mpesa_auth import TokenManager
+from mpesa_callbacks import CallbackJournal, InvalidCallback, parse_callback
+from mpesa_client import MpesaClient, MpesaError, build_session
+from payment_events import PaymentStatusNotifier
+from pricing import PricingEngine, PricingError
+from reconcile import StkReconciler
+from reviews import DuplicateReview, InvalidReview, ReviewStore
+from search import DOCUMENTS as SEARCH_KINDS, SearchIndex
+from static_assets import StaticAssets
+from stk_store import StkRequestStore
+from token_store import MemoryTokenStore, SqliteTokenStore
+
+# ------------------- Logging -------------------
+# JSON lines via a background queue; LOG_SAMPLE_RATE thins INFO/DEBUG on the hot-path loggers
+setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    sample_rate=float(os.getenv('LOG_SAMPLE_RATE', '1.0')),
+    sampled_loggers=['viva.access', 'viva.mpesa', 'viva.auth']
+)
+log = logging.getLogger('viva.app')
+mpesa_log = logging.getLogger('viva.mpesa')
+auth_log = logging.getLogger('viva.auth')
+
+# ------------------- Metrics -------------------
+# Per-process registry served on /metrics; pool and cache gauges are read at scrape time
+metrics = Registry()
+db_wait_seconds = metrics.histogram('viva_db_pool_wait_seconds',
+                                    'Time spent waiting for a pooled database connection')
+db_hold_seconds = metrics.histogram('viva_db_connection_hold_seconds',
+                                    'Time a database connection is checked out (query + handler work)')
+mpesa_latency = metrics.histogram('viva_mpesa_request_duration_seconds',
+                                  'Daraja HTTP call latency by endpoint and outcome', ('endpoint', 'outcome'))
+
+def observe_mpesa_request(path, outcome, seconds):
+    mpesa_latency.labels(path, outcome).observe(seconds)
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'
+init_request_logging(app)
+init_request_metrics(app, metrics)
 
 # Session configuration
 app.config.update(
@@ -20,14 +71,36 @@ app.config.update(
     PERMANENT_SESSION_LIFETIME=3600
 )
 
+# Mail configuration (point MAIL_SERVER/MAIL_PORT at a local SMTP sink such as aiosmtpd for testing)
+app.config.update(
+    MAIL_SERVER=os.getenv('MAIL_SERVER', 'localhost'),
+    MAIL_PORT=int(os.getenv('MAIL_PORT', '25')),
+    MAIL_USE_TLS=os.getenv('MAIL_USE_TLS', 'False').lower() == 'true',
+    MAIL_USE_SSL=os.getenv('MAIL_USE_SSL', 'False').lower() == 'true',
+    MAIL_USERNAME=os.getenv('MAIL_USERNAME'),
+    MAIL_PASSWORD=os.getenv('MAIL_PASSWORD'),
+    MAIL_DEFAULT_SENDER=os.getenv('MAIL_DEFAULT_SENDER', 'newsletter@vivautalii.co.ke')
+)
+mail = Mail(app)
+
 DB = 'viva_utalii.db'
 
-# This setup allows everything and handles the 'preflight' OPTIONS request
-CORS(app, resources={r"/*": {
-    "origins": "*",
-    "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization"]
-}}, supports_credentials=True)
+# Shared SQLite connection pool (WAL + tuned pragmas applied once per connection)
+db_pool = ConnectionPool(
+    DB,
+    max_size=int(os.getenv('DB_POOL_SIZE', '8')),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+    cache_size_kb=int(os.getenv('DB_CACHE_SIZE_KB', '16384')),
+    mmap_size=int(os.getenv('DB_MMAP_SIZE', '268435456')),
+    synchronous=os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+    on_acquire=db_wait_seconds.observe,
+    on_release=db_hold_seconds.observe
+)
+
+# Any origin by default (reflected, with credentials); CORS_ORIGINS=https://a.example,http://localhost:* narrows it.
+# Preflights are answered before routing, so views never see OPTIONS.
+cors_policy = CorsPolicy.from_env(os.getenv('CORS_ORIGINS'), expose_headers=('X-Next-Cursor', 'X-Request-ID'))
+cors_policy.init_app(app)
 
 # ------------------- M-Pesa Daraja credentials (HARDCODED) -------------------
 CONSUMER_KEY = "MYO5kqmnAhdpKIbNlNoQnSweJ0KgxMImMGNiEG61Uc7XOAwD"
@@ -35,129 +108,269 @@ CONSUMER_SECRET = "VkrHkM3xur8GzLPklzxsKgE0DQx9H8FYnv08bFeCVjThl6kW3Q8hq2T13EQgm
 BUSINESS_SHORT_CODE = "174379"
 PASSKEY = "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919"
 CALLBACK_URL = "https://siphonal-corny-dawson.ngrok-free.dev/api/mpesa_callback"
+# Point at mock_daraja.py for local testing, e.g. MPESA_BASE_URL=http://127.0.0.1:8089
+MPESA_BASE_URL = os.getenv('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke').rstrip('/')
+
+# One keep-alive session for every Daraja call (OAuth and STK push)
+mpesa_session = build_session(int(os.getenv('MPESA_POOL_SIZE', '10')))
+
+# Daraja tokens live ~1 hour; reuse them instead of an OAuth round trip per STK push
+token_manager = TokenManager(
+    f"{MPESA_BASE_URL}/oauth/v1/generate?grant_type=client_credentials",
+    CONSUMER_KEY,
+    CONSUMER_SECRET,
+    session=mpesa_session,
+    refresh_margin=int(os.getenv('MPESA_TOKEN_REFRESH_MARGIN', '300')),
+    on_request=observe_mpesa_request
+)
 
-# ------------------- In-memory store for STK requests -------------------
-stk_requests = {}  # key: CheckoutRequestID, value: {'phone':..., 'amount':..., 'status':...}
+mpesa_client = MpesaClient(
+    MPESA_BASE_URL,
+    BUSINESS_SHORT_CODE,
+    PASSKEY,
+    CALLBACK_URL,
+    token_manager,
+    session=mpesa_session,
+    max_workers=int(os.getenv('MPESA_MAX_WORKERS', '8')),
+    max_pending=int(os.getenv('MPESA_MAX_PENDING', '32')),
+    deadline=float(os.getenv('MPESA_DEADLINE', '15')),
+    on_request=observe_mpesa_request
+)
 
 def get_db_connection():
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Checked out from the pool; conn.close() hands it back instead of closing it
+    return db_pool.acquire()
+
+# ------------------- Persistent store for STK requests -------------------
+# Lives in SQLite so every worker sees the same requests and restarts don't lose them
+stk_store = StkRequestStore(
+    lambda: get_db_connection(),
+    ttl_seconds=int(os.getenv('STK_REQUEST_TTL', '86400'))
+)
+
+# ------------------- Bookings -------------------
+booking_store = BookingStore(lambda: get_db_connection())
+
+# ------------------- Destinations -------------------
+# Content behind the templated destination/review pages (rendered in the Frontend section)
+destination_store = DestinationStore(lambda: get_db_connection())
+# Reviews, with per-destination rating aggregates kept up to date by triggers
+review_store = ReviewStore(lambda: get_db_connection())
+
+# ------------------- Trip pricing -------------------
+# Rate table loaded once; PRICING_RATES_FILE can point at a JSON file shaped like pricing.DEFAULT_RATES
+if os.getenv('PRICING_RATES_FILE'):
+    pricing_engine = PricingEngine.from_file(os.getenv('PRICING_RATES_FILE'))
+else:
+    pricing_engine = PricingEngine()
+# STK pushes and bookings must carry an itinerary the deposit is checked against;
+# PRICING_ENFORCE=false accepts an unpriced amount (only for clients that predate the itinerary field)
+PRICING_ENFORCE = os.getenv('PRICING_ENFORCE', 'True').lower() == 'true'
+MAX_BATCH_QUOTES = 10000
+
+# ------------------- HTTP response caching -------------------
+# Cached bodies/ETags for read-mostly endpoints, invalidated by per-table write counters
+table_versions = TableVersions(lambda: get_db_connection())
+response_cache = ResponseCache(table_versions)
+
+# ------------------- Search -------------------
+# FTS5 index over destinations, deals and reviews; results are cached per index version
+search_index = SearchIndex(
+    lambda: get_db_connection(),
+    table_versions,
+    cache_size=int(os.getenv('SEARCH_CACHE_SIZE', '512'))
+)
+MAX_SEARCH_QUERY = 200
+
+# ------------------- Newsletter dispatch -------------------
+class FlaskMailer:
+    # Adapts one Flask-Mail SMTP connection to the queue's send(to, subject, body) interface
+    def __init__(self, connection):
+        self.connection = connection
+
+    def send(self, to, subject, body):
+        self.connection.send(Message(subject=subject, recipients=[to], body=body))
+
+@contextmanager
+def connect_mailer():
+    with app.app_context():
+        with mail.connect() as connection:
+            yield FlaskMailer(connection)
+
+newsletter_queue = NewsletterQueue(
+    lambda: get_db_connection(),
+    connect_mailer,
+    batch_size=int(os.getenv('NEWSLETTER_BATCH_SIZE', '50')),
+    rate_per_second=float(os.getenv('NEWSLETTER_RATE_PER_SECOND', '5')),
+    max_attempts=int(os.getenv('NEWSLETTER_MAX_ATTEMPTS', '5'))
+)
+
+# ------------------- Bearer token store -------------------
+# SQLite-backed by default so a token issued by one worker is valid on all of them;
+# TOKEN_STORE=memory keeps tokens in-process (tests / single-process dev only)
+TOKEN_TTL = int(os.getenv('TOKEN_TTL', '86400'))
+if os.getenv('TOKEN_STORE', 'sqlite') == 'memory':
+    token_store = MemoryTokenStore(ttl=TOKEN_TTL)
+else:
+    token_store = SqliteTokenStore(lambda: get_db_connection(), ttl=TOKEN_TTL)
+
+# ------------------- Password hashing -------------------
+# bcrypt when installed, else stdlib scrypt; PASSWORD_COST is log2 rounds (bcrypt) or log2 N (scrypt).
+# Hashing runs on a small thread pool so a login flood can't occupy every request thread.
+password_hasher = PasswordHasher(
+    scheme=os.getenv('PASSWORD_SCHEME') or None,
+    cost=os.getenv('PASSWORD_COST') or None,
+    max_workers=int(os.getenv('PASSWORD_WORKERS', '0')) or None,
+    max_pending=int(os.getenv('PASSWORD_MAX_PENDING', '64'))
+)
+PASSWORD_TIMEOUT = float(os.getenv('PASSWORD_TIMEOUT', '10'))
+
+def rehash_password(user_id, old_stored, password):
+    # Upgrade a plaintext / weaker hash after a successful login, without holding up the response
+    def store(future):
+        try:
+            conn = get_db_connection()
+            try:
+                conn.execute("UPDATE users SET password=? WHERE id=? AND password=?",
+                             (future.result(), user_id, old_stored))
+                conn.commit()
+            finally:
+                conn.close()
+            auth_log.info("Password rehashed", extra={"user_id": user_id, "scheme": password_hasher.scheme})
+        except Exception:
+            auth_log.exception("Password rehash failed")
+    try:
+        password_hasher.hash_async(password).add_done_callback(store)
+    except CredentialsBusy:
+        # Retried on the next login
+        pass
+
+# Wakes long-poll / SSE clients as soon as a payment leaves 'pending'
+payment_notifier = PaymentStatusNotifier(
+    stk_store.finished_ids,
+    poll_interval=float(os.getenv('PAYMENT_STATUS_POLL_INTERVAL', '1')),
+    max_waiters=int(os.getenv('PAYMENT_STATUS_MAX_WAITERS', '500'))
+)
+PAYMENT_STATUS_MAX_WAIT = 30
+
+# ------------------- M-Pesa callback ingestion -------------------
+def callbacks_applied(results, updated):
+    # Runs after each batch commits: wake any clients waiting on these payments
+    updated = set(updated)
+    for checkout_id, result_code, result_desc, _ in results:
+        if checkout_id in updated:
+            payment_notifier.notify(checkout_id)
+            mpesa_log.info("M-Pesa callback processed", extra={
+                "checkout_request_id": checkout_id, "status": "success" if result_code == 0 else "failed",
+                "result_code": result_code, "result_desc": result_desc})
+        else:
+            mpesa_log.warning("M-Pesa callback for unknown CheckoutRequestID",
+                              extra={"checkout_request_id": checkout_id})
+
+callback_journal = CallbackJournal(
+    lambda: get_db_connection(),
+    StkRequestStore.apply_results,
+    on_applied=callbacks_applied,
+    batch_size=int(os.getenv('MPESA_CALLBACK_BATCH_SIZE', '100')),
+    retention_seconds=int(os.getenv('STK_REQUEST_TTL', '86400'))
+)
+
+# ------------------- STK reconciliation -------------------
+# Pending pushes older than RECONCILE_MIN_AGE seconds whose callback never came are checked with Daraja's STK Query
+def payments_reconciled(checkout_ids):
+    for checkout_id in checkout_ids:
+        payment_notifier.notify(checkout_id)
+
+RECONCILE_ENABLED = os.getenv('RECONCILE_ENABLED', 'True').lower() == 'true'
+stk_reconciler = StkReconciler(
+    stk_store,
+    mpesa_client.stk_query,
+    on_resolved=payments_reconciled,
+    min_age=int(os.getenv('RECONCILE_MIN_AGE', '120')),
+    interval=float(os.getenv('RECONCILE_INTERVAL', '60')),
+    batch_size=int(os.getenv('RECONCILE_BATCH_SIZE', '50')),
+    concurrency=int(os.getenv('RECONCILE_CONCURRENCY', '4')),
+    rate_per_second=float(os.getenv('RECONCILE_RATE_PER_SECOND', '2')),
+    max_attempts=int(os.getenv('RECONCILE_MAX_ATTEMPTS', '10'))
+)
 
 def init_db():
+    # Normally just a schema_version check; pending migrations run once, under a file lock
+    try:
+        version = migrations.ensure_schema(DB, lambda: get_db_connection(), auto_migrate=DB_AUTO_MIGRATE)
+        log.info("Database schema ready", extra={"schema_version": version})
+    except Exception:
+        log.exception("Database initialization error")
+
+# Set DB_AUTO_MIGRATE=false in production and run `python migrations.py migrate` once per deploy
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', 'True').lower() == 'true'
+init_db()
+# Drain callbacks journalled before a restart
+callback_journal.ensure_started()
+# Send newsletter deliveries still pending or due for retry from before a restart
+newsletter_queue.ensure_started()
+if RECONCILE_ENABLED:
+    stk_reconciler.ensure_started()
+
+# Short-lived per-process cache of user identity (id, name, email), keyed by ('user', id).
+# Bearer tokens are not cached: each request checks its token against token_store (one primary-key lookup),
+# so a logout or account deletion on any worker revokes the token everywhere at once. A name or email change
+# made on another worker can show here for up to USER_CACHE_TTL seconds.
+user_cache = LRUCache(
+    max_size=int(os.getenv('USER_CACHE_SIZE', '2048')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '30'))
+)
+
+def load_user(user_id):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL
-            )
-        ''')
-        
-        # Add deals table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS deals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                destination TEXT NOT NULL,
-                discount TEXT NOT NULL
-            )
-        ''')
-        
-        # Add bookings table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                destination_id TEXT NOT NULL,
-                dest_name TEXT NOT NULL,
-                arrive_date TEXT NOT NULL,
-                depart_date TEXT NOT NULL,
-                travelers INTEGER NOT NULL,
-                acc_tier TEXT NOT NULL,
-                total_cost INTEGER NOT NULL,
-                deposit_amount INTEGER NOT NULL,
-                paid_deposit BOOLEAN DEFAULT FALSE,
-                mpesa_phone TEXT,
-                mpesa_reference TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Add a test user if none exists
-        cur.execute("SELECT COUNT(*) FROM users")
-        if cur.fetchone()[0] == 0:
-            cur.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-                       ("John Doe", "john@example.com", "password123"))
-            print("✅ Test user created: john@example.com / password123")
-        
-        # Add sample deals
-        cur.execute("SELECT COUNT(*) FROM deals")
-        if cur.fetchone()[0] == 0:
-            sample_deals = [
-                ("Maasai Mara", "15% off for newsletter subscribers"),
-                ("Zanzibar", "All-inclusive package discount"),
-                ("Diani Beach", "30% OFF flash sale")
-            ]
-            cur.executemany("INSERT INTO deals (destination, discount) VALUES (?, ?)", sample_deals)
-            print("✅ Sample deals added")
-        
-        conn.commit()
+        cur.execute("SELECT id, name, email FROM users WHERE id=?", (user_id,))
+        row = cur.fetchone()
+    finally:
         conn.close()
-        print("✅ Database initialized successfully!")
-        
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
+    if row:
+        return {'id': row[0], 'name': row[1], 'email': row[2]}
+    return None
 
-# Initialize database
-print("🔄 Starting database initialization...")
-init_db()
+def invalidate_user_cache(user_id):
+    user_cache.delete(('user', user_id))
 
-# Store active sessions in memory
-active_sessions = {}
+def cached_user(user_id):
+    user = user_cache.get(('user', user_id))
+    if user is None:
+        user = load_user(user_id)
+        if user:
+            user_cache.set(('user', user_id), user)
+    return dict(user) if user else None
 
 def get_user():
     # Check session first
     if 'user_id' in session:
-        user_id = session['user_id']
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT id, name, email FROM users WHERE id=?", (user_id,))
-            row = cur.fetchone()
-            conn.close()
-            if row:
-                return {'id': row[0], 'name': row[1], 'email': row[2]}
+            user = cached_user(session['user_id'])
+            if user:
+                return user
         except Exception as e:
-            print(f"Error getting user from session: {e}")
+            auth_log.warning("Error getting user from session", exc_info=True)
     
     # Fallback to checking Authorization header
     auth_header = request.headers.get('Authorization')
     if auth_header and auth_header.startswith('Bearer '):
         token = auth_header.split(' ')[1]
-        if token in active_sessions:
-            user_id = active_sessions[token]
-            try:
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("SELECT id, name, email FROM users WHERE id=?", (user_id,))
-                row = cur.fetchone()
-                conn.close()
-                if row:
-                    return {'id': row[0], 'name': row[1], 'email': row[2]}
-            except Exception as e:
-                print(f"Error getting user from token: {e}")
+        try:
+            user_id = token_store.get_user_id(token)
+            if user_id is not None:
+                return cached_user(user_id)
+        except Exception as e:
+            auth_log.warning("Error getting user from token", exc_info=True)
     
     return None
 
 
 # Verify-token endpoint for client-side token validation (handles preflight)
 @app.route('/verify-token', methods=['GET', 'OPTIONS'])
+@response_cache.content_etag(cache_control='private, no-cache', vary=['Authorization', 'Cookie'])
 def verify_token():
     # Allow CORS preflight through without authentication
     if request.method == 'OPTIONS':
@@ -170,29 +383,17 @@ def verify_token():
 
 # ------------------- M-Pesa Functions -------------------
 def get_access_token():
-    url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    try:
-        r = requests.get(url, auth=(CONSUMER_KEY, CONSUMER_SECRET), timeout=30)
-        r.raise_for_status()
-        return r.json().get("access_token")
-    except requests.exceptions.RequestException as e:
-        print(f"Error getting access token: {e}")
-        return None
-
-def daraja_timestamp():
-    return datetime.now().strftime("%Y%m%d%H%M%S")
+    return token_manager.get_token()
 
 # ------------------- M-Pesa Routes -------------------
 @app.route("/api/mpesa/stkpush", methods=['POST', 'OPTIONS'])
 def stk_push():
-    print(f"🎯 STK Push request received from origin: {request.headers.get('Origin')}")
-    
     if request.method == 'OPTIONS':
         return '', 200
         
     try:
         data = request.get_json()
-        print(f"📦 STK Push data: {data}")
+        mpesa_log.debug("STK push request", extra={"origin": request.headers.get('Origin'), "payload": data})
         
         # Validate required fields
         if not data:
@@ -214,99 +415,65 @@ def stk_push():
         except (TypeError, ValueError):
             return jsonify({"success": False, "error": "Invalid amount"}), 400
 
-        # Get access token
-        print("🔑 Getting M-Pesa access token...")
-        access_token = get_access_token()
-        if not access_token:
-            return jsonify({"success": False, "error": "Failed to get access token"}), 500
-
-        headers = {
-            "Authorization": f"Bearer {access_token}", 
-            "Content-Type": "application/json"
-        }
-
-        # Prepare password
-        timestamp = daraja_timestamp()
-        password_str = BUSINESS_SHORT_CODE + PASSKEY + timestamp
-        password = base64.b64encode(password_str.encode()).decode()
-
-        # Prepare payload
-        payload = {
-            "BusinessShortCode": BUSINESS_SHORT_CODE,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": amount,
-            "PartyA": phone,
-            "PartyB": BUSINESS_SHORT_CODE,
-            "PhoneNumber": phone,
-            "CallBackURL": CALLBACK_URL,
-            "AccountReference": account_ref,
-            "TransactionDesc": desc
-        }
-
-        print(f"📤 Sending STK push to M-Pesa: {payload}")
+        # Don't trust the client's arithmetic: the deposit must match the server-side quote
+        itinerary = data.get("itinerary")
+        if itinerary:
+            try:
+                pricing_engine.check_deposit(itinerary, amount)
+            except PricingError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+        elif PRICING_ENFORCE:
+            return jsonify({"success": False, "error": "Itinerary is required to verify the deposit"}), 400
 
+        # Answer now and let the bounded M-Pesa worker pool make the Daraja call; the client follows
+        # the request on /api/mpesa/status/<request_id> (long-poll or SSE) instead of holding this thread
+        request_id = f"stk_{secrets.token_hex(12)}"
+        stk_store.add_submitting(request_id, phone, amount)
         try:
-            resp = requests.post(
-                "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest",
-                headers=headers, 
-                json=payload,
-                timeout=30
-            )
-            resp.raise_for_status()
-            result = resp.json()
-            print(f"📥 M-Pesa response: {result}")
-            
-            # Check if request was successful
-            if "ResponseCode" in result and result["ResponseCode"] == "0":
-                checkout_id = result.get("CheckoutRequestID")
-                merchant_id = result.get("MerchantRequestID")
-                
-                if checkout_id:
-                    stk_requests[checkout_id] = {
-                        "phone": phone, 
-                        "amount": amount, 
-                        "status": "pending",
-                        "merchant_request_id": merchant_id,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    
-                return jsonify({
-                    "success": True,
-                    "message": "STK push initiated successfully",
-                    "checkout_request_id": checkout_id,
-                    "merchant_request_id": merchant_id,
-                    "response": "Please check your phone to complete the payment"
-                })
-            else:
-                error_message = result.get("errorMessage", "STK push failed")
-                print(f"❌ M-Pesa error: {error_message}")
-                return jsonify({
-                    "success": False,
-                    "error": error_message
-                }), 400
-                
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Network error: {e}")
-            return jsonify({
-                "success": False, 
-                "error": f"Network error: {str(e)}"
-            }), 500
-        except Exception as e:
-            print(f"❌ Unexpected error: {e}")
-            return jsonify({
-                "success": False, 
-                "error": f"Unexpected error: {str(e)}"
-            }), 500
+            future = mpesa_client.submit_stk_push(phone, amount, account_ref, desc)
+        except MpesaError as e:
+            stk_store.submit_failed(request_id, str(e))
+            mpesa_log.warning("STK push rejected before submission", extra={"phone": phone, "error": str(e)})
+            return jsonify({"success": False, "error": str(e)}), e.status_code
+        future.add_done_callback(lambda done: stk_push_finished(request_id, phone, amount, done))
+
+        return jsonify({
+            "success": True,
+            "message": "STK push is being sent",
+            "request_id": request_id,
+            "status": "submitting",
+            "status_url": f"/api/mpesa/status/{request_id}"
+        }), 202
             
     except Exception as e:
-        print(f"❌ Request processing error: {e}")
+        mpesa_log.exception("STK push request processing error")
         return jsonify({
             "success": False, 
             "error": f"Request processing error: {str(e)}"
         }), 500
 
+def stk_push_finished(request_id, phone, amount, future):
+    # Runs on the M-Pesa worker thread once Daraja has answered (or the call failed)
+    try:
+        try:
+            result = future.result()
+            mpesa_log.info("STK push response", extra={"phone": phone, "amount": amount, "response": result})
+            if result.get("ResponseCode") == "0" and result.get("CheckoutRequestID"):
+                stk_store.accepted(request_id, result["CheckoutRequestID"], result.get("MerchantRequestID"))
+            else:
+                error_message = result.get("errorMessage", "STK push failed")
+                mpesa_log.warning("STK push rejected", extra={"phone": phone, "error": error_message})
+                stk_store.submit_failed(request_id, error_message)
+        except MpesaError as e:
+            mpesa_log.warning("STK push failed", extra={"phone": phone, "error": str(e), "status": e.status_code})
+            stk_store.submit_failed(request_id, str(e))
+        except Exception as e:
+            mpesa_log.exception("Unexpected STK push error")
+            stk_store.submit_failed(request_id, f"Unexpected error: {str(e)}")
+    except Exception:
+        mpesa_log.exception("Could not record STK push outcome", extra={"request_id": request_id})
+    payment_notifier.notify(request_id)
+
 @app.route("/api/mpesa/query", methods=['POST', 'OPTIONS'])
 def stk_query():
     if request.method == 'OPTIONS':
@@ -318,72 +485,241 @@ def stk_query():
     if not checkout_id:
         return jsonify({"success": False, "error": "Missing CheckoutRequestID"}), 400
 
-    status_info = stk_requests.get(checkout_id)
+    status_info = stk_store.get(checkout_id)
     if not status_info:
         return jsonify({"success": False, "error": "CheckoutRequestID not found"}), 404
 
     # Return current status
-    return jsonify({
+    return jsonify(payment_status_body(status_info))
+
+def payment_status_body(status_info):
+    body = {
         "success": True,
-        "checkout_request_id": checkout_id,
+        "request_id": status_info["request_id"],
+        "checkout_request_id": status_info["checkout_request_id"],
         "status": status_info["status"],
         "phone": status_info["phone"],
         "amount": status_info["amount"]
-    })
+    }
+    if status_info["status"] == "failed":
+        body["error"] = status_info["result_desc"]
+    return body
+
+def status_key(status_info):
+    # Waiters are woken by the ID the request is currently stored under: the request_id while the push is
+    # being submitted, Daraja's CheckoutRequestID once it is accepted
+    return status_info["checkout_request_id"] or status_info["request_id"]
+
+# Push-style alternative to polling /api/mpesa/query (<id> is the request_id from stkpush or a CheckoutRequestID):
+#   GET /api/mpesa/status/<id>?wait=25                    -> long-poll, returns once the status changes or on timeout
+#   GET /api/mpesa/status/<id>?wait=25&status=submitting  -> long-poll from a known status; returns at once if it has
+#                                                            already moved on (how stkpush clients pick up the checkout id)
+#   GET /api/mpesa/status/<id> (Accept: text/event-stream) -> SSE stream of status changes, ending with the final one
+@app.route("/api/mpesa/status/<checkout_id>", methods=['GET', 'OPTIONS'])
+def stk_status(checkout_id):
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    status_info = stk_store.get(checkout_id)
+    if not status_info:
+        return jsonify({"success": False, "error": "CheckoutRequestID not found"}), 404
+
+    wait = max(0.0, min(request.args.get('wait', 25, type=float), PAYMENT_STATUS_MAX_WAIT))
+
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        def stream(info):
+            yield f"retry: 3000\nevent: status\ndata: {json.dumps(payment_status_body(info))}\n\n"
+            deadline = time.monotonic() + wait
+            while info["status"] in StkRequestStore.OPEN_STATUSES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    woke = payment_notifier.wait(status_key(info), min(remaining, 15))
+                except OverflowError:
+                    break
+                if not woke:
+                    yield ": keep-alive\n\n"
+                    continue
+                info = stk_store.get(checkout_id) or info
+                yield f"event: status\ndata: {json.dumps(payment_status_body(info))}\n\n"
+
+        return Response(stream(status_info), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    # The status the client last saw; a change it missed between requests is answered without waiting
+    seen = request.args.get('status', status_info["status"])
+    if status_info["status"] == seen and seen in StkRequestStore.OPEN_STATUSES and wait > 0:
+        try:
+            if payment_notifier.wait(status_key(status_info), wait):
+                status_info = stk_store.get(checkout_id) or status_info
+        except OverflowError as e:
+            return jsonify({"success": False, "error": str(e)}), 503
+
+    return jsonify(payment_status_body(status_info))
 
 @app.route("/api/mpesa_callback", methods=['POST'])
 def stk_callback():
+    # Validate, journal and ack; callback_journal's consumer applies the result
+    data = request.get_json(silent=True)
+    mpesa_log.debug("M-Pesa callback received", extra={"payload": data})
     try:
-        data = request.get_json()
-        print(f"🎯 M-Pesa Callback received: {data}")
-        
-        if not data or "Body" not in data or "stkCallback" not in data["Body"]:
-            return jsonify({"ResultCode": 1, "ResultDesc": "Invalid callback format"}), 400
+        checkout_id, result_code, result_desc, receipt = parse_callback(data)
+    except InvalidCallback as e:
+        return jsonify({"ResultCode": 1, "ResultDesc": str(e)}), 400
 
-        callback = data["Body"]["stkCallback"]
-        checkout_id = callback.get("CheckoutRequestID")
-        result_code = callback.get("ResultCode")
-        
-        if not checkout_id:
-            return jsonify({"ResultCode": 1, "ResultDesc": "Missing CheckoutRequestID"}), 400
-
-        # Update status based on result code
-        if result_code == 0:
-            status = "success"
-            result_desc = "Payment completed successfully"
-            print(f"✅ Payment SUCCESS for {checkout_id}")
-        else:
-            status = "failed"
-            result_desc = callback.get("ResultDesc", "Payment failed")
-            print(f"❌ Payment FAILED for {checkout_id}: {result_desc}")
-
-        # Update in-memory store
-        if checkout_id in stk_requests:
-            stk_requests[checkout_id]["status"] = status
-            stk_requests[checkout_id]["callback_data"] = data
-            stk_requests[checkout_id]["updated_at"] = datetime.now().isoformat()
-            
-        print(f"📝 Callback processed: {checkout_id} -> {status}")
-        return jsonify({"ResultCode": 0, "ResultDesc": "Success"})
-        
+    try:
+        if not callback_journal.append(checkout_id, result_code, result_desc, receipt):
+            mpesa_log.info("Duplicate M-Pesa callback ignored", extra={"checkout_request_id": checkout_id})
     except Exception as e:
-        print(f"❌ Callback processing error: {e}")
+        # Not journalled: a non-zero ResultCode makes Daraja redeliver
+        mpesa_log.exception("M-Pesa callback journal error")
         return jsonify({"ResultCode": 1, "ResultDesc": f"Error: {str(e)}"}), 500
+    return jsonify({"ResultCode": 0, "ResultDesc": "Success"})
+
+# ------------------- Pricing Routes -------------------
+@app.route("/api/pricing/quote", methods=['POST', 'OPTIONS'])
+def pricing_quote():
+    if request.method == 'OPTIONS':
+        return '', 200
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"success": False, "error": "No JSON data provided"}), 400
+    try:
+        quote = pricing_engine.quote(data, breakdown=True)
+    except PricingError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, **quote})
+
+@app.route("/api/pricing/batch_quote", methods=['POST', 'OPTIONS'])
+def pricing_batch_quote():
+    if request.method == 'OPTIONS':
+        return '', 200
+    data = request.get_json(silent=True) or {}
+    itineraries = data.get("itineraries")
+    if not isinstance(itineraries, list):
+        return jsonify({"success": False, "error": "itineraries must be a list"}), 400
+    if len(itineraries) > MAX_BATCH_QUOTES:
+        return jsonify({"success": False, "error": f"At most {MAX_BATCH_QUOTES} itineraries per call"}), 400
+    if not all(isinstance(i, dict) for i in itineraries):
+        return jsonify({"success": False, "error": "Each itinerary must be an object"}), 400
+    return jsonify({"success": True, "quotes": pricing_engine.batch_quote(itineraries)})
+
+# ------------------- Destination Routes -------------------
+@app.route("/api/destinations", methods=['GET'])
+@response_cache.versioned('destinations', cache_control='public, max-age=60')
+def list_destinations():
+    return jsonify({"destinations": [{
+        "slug": d['slug'],
+        "name": d['name'],
+        "title": d['title'],
+        "summary": d['summary'],
+        "page": d['page'],
+        "reviews_page": d['reviews_page'],
+        "fragment": f"fragments/{d['slug']}.html"
+    } for d in destination_store.all()]})
+
+@app.route("/api/destinations/<slug>", methods=['GET'])
+@response_cache.versioned('destinations', cache_control='public, max-age=60')
+def get_destination(slug):
+    destination = destination_store.get(slug)
+    if destination is None:
+        return jsonify({"error": "Unknown destination"}), 404
+    destination.pop('updated_at')
+    return jsonify(destination)
+
+# ------------------- Review Routes -------------------
+@app.route("/api/destinations/<slug>/reviews", methods=['GET'])
+@response_cache.versioned('reviews', cache_control='public, max-age=60')
+def list_reviews(slug):
+    if not destination_store.exists(slug):
+        return jsonify({"error": "Unknown destination"}), 404
+    try:
+        reviews, next_cursor = review_store.page(
+            slug, request.args.get('sort', 'recent'), request.args.get('cursor'),
+            request.args.get('limit', type=int))
+    except ValueError as e:
+        # InvalidCursor, or an unknown sort
+        return jsonify({'error': str(e)}), 400
+    return paginated(reviews, next_cursor)
+
+@app.route("/api/destinations/<slug>/reviews", methods=['POST', 'OPTIONS'])
+def create_review(slug):
+    if request.method == 'OPTIONS':
+        return '', 200
+    user = get_user()
+    if not user:
+        return jsonify({'message': 'Not logged in'}), 401
+    if not destination_store.exists(slug):
+        return jsonify({"error": "Unknown destination"}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        review_id = review_store.create(slug, user['id'], user['name'], data.get('rating'), data.get('text'),
+                                        data.get('tags') or [])
+    except InvalidReview as e:
+        return jsonify({'error': str(e)}), 400
+    except DuplicateReview as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'message': 'Review added', 'review_id': review_id,
+                    'summary': review_store.summary(slug)}), 201
+
+@app.route("/api/destinations/<slug>/reviews/summary", methods=['GET'])
+@response_cache.versioned('reviews', cache_control='public, max-age=60')
+def review_summary(slug):
+    if not destination_store.exists(slug):
+        return jsonify({"error": "Unknown destination"}), 404
+    return jsonify(review_store.summary(slug))
+
+@app.route("/api/reviews/summary", methods=['GET'])
+@response_cache.versioned('reviews', cache_control='public, max-age=60')
+def review_summaries():
+    return jsonify(review_store.summaries())
+
+# ------------------- Search Routes -------------------
+@app.route("/api/search", methods=['GET'])
+@response_cache.content_etag(cache_control='public, max-age=60')
+def search_all():
+    query = request.args.get('q', '').strip()
+    if len(query) > MAX_SEARCH_QUERY:
+        return jsonify({'error': f"q must be at most {MAX_SEARCH_QUERY} characters"}), 400
+    kinds = [kind for kind in request.args.get('type', '').split(',') if kind]
+    unknown = [kind for kind in kinds if kind not in SEARCH_KINDS]
+    if unknown:
+        return jsonify({'error': f"type must be one or more of: {', '.join(SEARCH_KINDS)}"}), 400
+    return jsonify({
+        'query': query,
+        'results': search_index.search(query, kinds, request.args.get('limit', type=int))
+    })
+
+@app.route("/api/search/suggest", methods=['GET'])
+@response_cache.content_etag(cache_control='public, max-age=60')
+def search_suggest():
+    query = request.args.get('q', '').strip()
+    if len(query) > MAX_SEARCH_QUERY:
+        return jsonify({'error': f"q must be at most {MAX_SEARCH_QUERY} characters"}), 400
+    return jsonify({
+        'query': query,
+        'suggestions': search_index.suggest(query, request.args.get('limit', 8, type=int))
+    })
 
 @app.route("/api/mpesa/requests", methods=['GET'])
 def get_requests():
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    recent = stk_store.recent(limit)
     return jsonify({
         "success": True,
-        "total_requests": len(stk_requests),
-        "requests": stk_requests
+        "total_requests": stk_store.count(),
+        "requests": {status_key(r): r for r in recent}
     })
 
 @app.route("/api/health", methods=['GET'])
+@response_cache.short_lived(5)
 def health_check():
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "total_pending_requests": len([r for r in stk_requests.values() if r.get("status") == "pending"]),
+        "total_pending_requests": stk_store.pending_count(),
         "cors_enabled": True,
         "allowed_origins": "ALL PORTS"
     })
@@ -409,6 +745,11 @@ def signup():
         if not name or not email or not password:
             return jsonify({'error': 'All fields are required'}), 400
         
+        try:
+            password_hash = password_hasher.hash_async(password).result(timeout=PASSWORD_TIMEOUT)
+        except (CredentialsBusy, FutureTimeout):
+            return jsonify({'error': 'Too many requests, please try again'}), 503
+
         conn = get_db_connection()
         cur = conn.cursor()
         
@@ -418,7 +759,7 @@ def signup():
             return jsonify({'error': 'Email already registered'}), 400
         
         cur.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-                   (name, email, password))
+                   (name, email, password_hash))
         conn.commit()
         
         # Get the new user ID
@@ -431,10 +772,9 @@ def signup():
         session['email'] = email
         
         # Also create a token for alternative authentication
-        token = secrets.token_hex(16)
-        active_sessions[token] = user_id
+        token = token_store.issue(user_id)
         
-        print(f"✅ User created and logged in: {email} (ID: {user_id})")
+        auth_log.info("User created and logged in", extra={"user_id": user_id})
         
         return jsonify({
             'message': 'Account created successfully!',
@@ -443,7 +783,7 @@ def signup():
         }), 200
         
     except Exception as e:
-        print(f"❌ Signup error: {e}")
+        auth_log.exception("Signup error")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/login', methods=['POST', 'OPTIONS'])
@@ -456,25 +796,33 @@ def login():
         email = data.get('email', '').strip()
         password = data.get('password', '').strip()
         
-        print(f"🔐 Login attempt for: {email}")
-        
         conn = get_db_connection()
         cur = conn.cursor()
         
         cur.execute("SELECT id, name, email, password FROM users WHERE email=?", (email,))
         user = cur.fetchone()
         conn.close()
+
+        # Unknown emails are checked against a dummy hash so they take as long as wrong passwords
+        try:
+            ok, needs_rehash = password_hasher.verify_async(password, user[3] if user else None) \
+                .result(timeout=PASSWORD_TIMEOUT)
+        except (CredentialsBusy, FutureTimeout):
+            auth_log.warning("Login rejected, password hashing busy", extra={"email": email})
+            return jsonify({'error': 'Too many sign-in attempts, please try again'}), 503
         
-        if user and user[3] == password:
+        if ok:
+            if needs_rehash:
+                rehash_password(user[0], user[3], password)
+
             # Set session
             session['user_id'] = user[0]
             session['email'] = user[2]
             
             # Create token for alternative auth
-            token = secrets.token_hex(16)
-            active_sessions[token] = user[0]
+            token = token_store.issue(user[0])
             
-            print(f"✅ Login successful: {email} (ID: {user[0]})")
+            auth_log.info("Login successful", extra={"user_id": user[0]})
             
             return jsonify({
                 'message': 'Login successful!',
@@ -482,11 +830,11 @@ def login():
                 'user': {'name': user[1], 'email': user[2]}
             }), 200
         else:
-            print(f"❌ Login failed for: {email}")
+            auth_log.warning("Login failed", extra={"email": email})
             return jsonify({'error': 'Invalid email or password'}), 401
             
     except Exception as e:
-        print(f"❌ Login error: {e}")
+        auth_log.exception("Login error")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/check_login', methods=['GET'])
@@ -508,6 +856,13 @@ def get_user_info():
         })
     return jsonify({'error': 'Not logged in'}), 401
 
+def paginated(items, next_cursor):
+    # Pages stay plain JSON lists for the frontend; the next page is advertised in a header
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 @app.route('/get_travel_history', methods=['GET', 'OPTIONS'])
 def get_travel_history():
     if request.method == 'OPTIONS':
@@ -516,11 +871,15 @@ def get_travel_history():
     if not user:
         return jsonify([]), 401
     
-    sample_history = [
-        {'destination': 'Maasai Mara', 'start_date': '2024-01-15', 'end_date': '2024-01-20', 'status': 'Completed'},
-        {'destination': 'Diani Beach', 'start_date': '2024-03-10', 'end_date': '2024-03-17', 'status': 'Completed'}
-    ]
-    return jsonify(sample_history)
+    try:
+        trips, next_cursor = booking_store.history(
+            user['id'], request.args.get('cursor'), request.args.get('limit', type=int))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error:
+        log.exception("Travel history query error")
+        return jsonify({'error': 'Error loading travel history'}), 500
+    return paginated(trips, next_cursor)
 
 @app.route('/get_bookings', methods=['GET', 'OPTIONS'])
 def get_bookings():
@@ -530,13 +889,65 @@ def get_bookings():
     if not user:
         return jsonify([]), 401
     
-    sample_bookings = [
-        {'destination': 'Mount Kenya', 'date': '2024-12-15', 'status': 'Confirmed', 'fee_paid': True},
-        {'destination': 'Amboseli National Park', 'date': '2025-02-20', 'status': 'Pending', 'fee_paid': False}
-    ]
-    return jsonify(sample_bookings)
+    try:
+        bookings, next_cursor = booking_store.upcoming(
+            user['id'], request.args.get('cursor'), request.args.get('limit', type=int))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error:
+        log.exception("Bookings query error")
+        return jsonify({'error': 'Error loading bookings'}), 500
+    return paginated(bookings, next_cursor)
+
+@app.route('/create_booking', methods=['POST', 'OPTIONS'])
+def create_booking():
+    if request.method == 'OPTIONS':
+        return '', 200
+    user = get_user()
+    if not user:
+        return jsonify({'message': 'Not logged in'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    required = ['destination_id', 'dest_name', 'arrive_date', 'depart_date',
+                'travelers', 'acc_tier', 'total_cost', 'deposit_amount']
+    missing = [field for field in required if data.get(field) in (None, '')]
+    if missing:
+        return jsonify({'error': f"Missing fields: {', '.join(missing)}"}), 400
+    
+    try:
+        travelers = int(data['travelers'])
+        total_cost = int(data['total_cost'])
+        deposit_amount = int(data['deposit_amount'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'travelers, total_cost and deposit_amount must be integers'}), 400
+    if travelers <= 0 or total_cost <= 0 or not 0 < deposit_amount <= total_cost:
+        return jsonify({'error': 'Invalid travelers, total_cost or deposit_amount'}), 400
+    if data['depart_date'] < data['arrive_date']:
+        return jsonify({'error': 'depart_date must not be before arrive_date'}), 400
+    
+    itinerary = data.get('itinerary')
+    if itinerary:
+        try:
+            quote = pricing_engine.check_deposit(itinerary, deposit_amount)
+        except PricingError as e:
+            return jsonify({'error': str(e)}), 400
+        if total_cost != quote['total']:
+            return jsonify({'error': f"Total cost must be KES {quote['total']} for this itinerary"}), 400
+    elif PRICING_ENFORCE:
+        return jsonify({'error': 'Itinerary is required to verify the booking cost'}), 400
+    
+    try:
+        booking_id = booking_store.create(
+            user['id'], data['destination_id'], data['dest_name'], data['arrive_date'],
+            data['depart_date'], travelers, data['acc_tier'], total_cost, deposit_amount,
+            data.get('mpesa_phone'), data.get('mpesa_reference'))
+    except Exception as e:
+        log.exception("Booking creation error")
+        return jsonify({'error': 'Error creating booking'}), 500
+    return jsonify({'message': 'Booking created successfully!', 'booking_id': booking_id}), 201
 
 @app.route('/get_deals', methods=['GET', 'OPTIONS'])
+@response_cache.versioned('deals', cache_control='public, max-age=60')
 def get_deals():
     if request.method == 'OPTIONS':
         return '', 200
@@ -549,13 +960,13 @@ def get_deals():
         deals = [{'destination': row[0], 'discount': row[1]} for row in rows]
         return jsonify(deals)
     except Exception as e:
-        print(f"Error getting deals: {e}")
-        # Return sample deals if database error
+        log.exception("Error getting deals")
+        # Return sample deals if database error (never cached)
         return jsonify([
             {'destination': 'Maasai Mara', 'discount': '15% off for newsletter subscribers'},
             {'destination': 'Zanzibar', 'discount': 'All-inclusive package discount'},
             {'destination': 'Diani Beach', 'discount': '30% OFF flash sale'}
-        ])
+        ]), 200, {'Cache-Control': 'no-store'}
 
 @app.route('/generate_newsletter', methods=['POST', 'OPTIONS'])
 def generate_newsletter():
@@ -564,7 +975,30 @@ def generate_newsletter():
     user = get_user()
     if not user:
         return jsonify({'message': 'Please log in first'}), 401
-    return jsonify({'message': 'Monthly newsletter has been sent to your email!'})
+    
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT destination, discount FROM deals")
+        deals = cur.fetchall()
+        conn.close()
+        
+        month = datetime.now().strftime("%B %Y")
+        lines = [f"Hi {user['name']},", "", f"Here are this month's Viva Utalii deals ({month}):", ""]
+        lines += [f"  - {row[0]}: {row[1]}" for row in deals]
+        lines += ["", "Karibu tena,", "The Viva Utalii team"]
+        
+        # One newsletter per user per month: repeated clicks don't queue a second email
+        newsletter_queue.enqueue(
+            f"monthly-{datetime.now().strftime('%Y-%m')}-user-{user['id']}",
+            f"Viva Utalii Monthly Newsletter - {month}",
+            "\n".join(lines),
+            [user['email']]
+        )
+    except Exception as e:
+        log.exception("Newsletter queue error")
+        return jsonify({'message': 'Error queueing newsletter'}), 500
+    return jsonify({'message': 'Monthly newsletter is on its way to your email!'}), 202
 
 @app.route('/cancel_booking', methods=['POST', 'OPTIONS'])
 def cancel_booking():
@@ -573,11 +1007,19 @@ def cancel_booking():
     try:
         data = request.get_json()
         destination = data.get('destination')
+        booking_id = data.get('booking_id')
         user = get_user()
         if not user:
             return jsonify({'message': 'Not logged in'}), 401
-        return jsonify({'message': f'Booking for {destination} cancelled successfully!'})
+        if booking_id is None and not destination:
+            return jsonify({'message': 'booking_id or destination is required'}), 400
+        cancelled = booking_store.cancel(user['id'], booking_id, destination)
+        if cancelled is None:
+            return jsonify({'message': 'No active booking found to cancel'}), 404
+        return jsonify({'message': f'Booking for {destination or "your trip"} cancelled successfully!',
+                        'booking_id': cancelled})
     except Exception as e:
+        log.exception("Booking cancellation error")
         return jsonify({'message': 'Error cancelling booking'}), 500
 
 @app.route('/update_password', methods=['POST', 'OPTIONS'])
@@ -590,12 +1032,19 @@ def update_password():
         user = get_user()
         if not user:
             return jsonify({'message': 'Not logged in'}), 401
+        if not new_password:
+            return jsonify({'message': 'New password is required'}), 400
+        try:
+            password_hash = password_hasher.hash_async(new_password).result(timeout=PASSWORD_TIMEOUT)
+        except (CredentialsBusy, FutureTimeout):
+            return jsonify({'message': 'Too many requests, please try again'}), 503
         
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("UPDATE users SET password=? WHERE id=?", (new_password, user['id']))
+        cur.execute("UPDATE users SET password=? WHERE id=?", (password_hash, user['id']))
         conn.commit()
         conn.close()
+        invalidate_user_cache(user['id'])
         return jsonify({'message': 'Password updated successfully!'})
     except Exception as e:
         return jsonify({'message': 'Error updating password'}), 500
@@ -623,6 +1072,7 @@ def update_email():
         cur.execute("UPDATE users SET email=? WHERE id=?", (new_email, user['id']))
         conn.commit()
         conn.close()
+        invalidate_user_cache(user['id'])
         session['email'] = new_email
         return jsonify({'message': 'Email updated successfully!'})
     except Exception as e:
@@ -639,9 +1089,12 @@ def delete_account():
         
         conn = get_db_connection()
         cur = conn.cursor()
+        cur.execute("DELETE FROM reviews WHERE user_id=?", (user['id'],))
         cur.execute("DELETE FROM users WHERE id=?", (user['id'],))
         conn.commit()
         conn.close()
+        token_store.revoke_user(user['id'])
+        invalidate_user_cache(user['id'])
         session.clear()
         return jsonify({'message': 'Account deleted successfully!'})
     except Exception as e:
@@ -662,24 +1115,135 @@ def test():
 def debug():
     return jsonify({
         'session': dict(session),
-        'active_sessions_count': len(active_sessions),
+        'active_sessions_count': token_store.count(),
         'cors_enabled': True,
-        'stk_requests_count': len(stk_requests)
+        'stk_requests_count': stk_store.count(),
+        'db_pool': db_pool.stats(),
+        'mpesa_token': token_manager.stats(),
+        'mpesa_client': mpesa_client.stats(),
+        'payment_status_waiters': payment_notifier.stats(),
+        'user_cache': user_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'newsletter': newsletter_queue.stats(),
+        'mpesa_callbacks': callback_journal.stats(),
+        'stk_reconciler': stk_reconciler.stats(),
+        'passwords': password_hasher.stats(),
+        'search': search_index.stats(),
+        'static_assets': static_assets.stats() if static_assets else None,
+        'destination_pages': destination_pages.stats() if destination_pages else None
     })
 
+# ------------------- Metrics gauges -------------------
+def pick(stats, keys):
+    return {key: stats[key] for key in keys}
+
+metrics.gauge_callback('viva_db_pool_connections', 'Pooled database connections by state',
+                       lambda: pick(db_pool.stats(), ('size', 'idle', 'in_use', 'max_size')), ('state',))
+metrics.counter_callback('viva_db_pool_events_total', 'Connection pool checkouts, waits and failures',
+                         lambda: pick(db_pool.stats(), ('hits', 'misses', 'waits', 'timeouts', 'discarded')),
+                         ('event',))
+metrics.gauge_callback('viva_cache_entries', 'Entries held by in-process caches', lambda: {
+    'user': user_cache.stats()['size'], 'response': response_cache.stats()['size'],
+    'search': search_index.cache.stats()['size']}, ('cache',))
+metrics.counter_callback('viva_cache_lookups_total', 'In-process cache lookups', lambda: {
+    (name, result): stats[result]
+    for name, stats in (('user', user_cache.stats()), ('response', response_cache.stats()),
+                        ('search', search_index.cache.stats()))
+    for result in ('hits', 'misses')}, ('cache', 'result'))
+metrics.counter_callback('viva_http_not_modified_total', '304 responses served from ETags',
+                         lambda: response_cache.stats()['not_modified'])
+metrics.gauge_callback('viva_mpesa_token_expires_in_seconds', 'Seconds until the cached Daraja token expires',
+                       lambda: token_manager.stats()['expires_in'])
+metrics.counter_callback('viva_mpesa_token_events_total', 'Daraja OAuth token cache events',
+                         lambda: pick(token_manager.stats(), ('hits', 'refreshes', 'background_refreshes', 'failures')),
+                         ('event',))
+metrics.counter_callback('viva_mpesa_client_events_total', 'Daraja calls, retries, errors and busy rejections',
+                         lambda: mpesa_client.stats(), ('event',))
+metrics.gauge_callback('viva_stk_requests', 'Stored STK push requests by status',
+                       lambda: stk_store.count_by_status(), ('status',))
+metrics.gauge_callback('viva_payment_status_waiters', 'Clients blocked on a payment status long-poll/SSE',
+                       lambda: payment_notifier.stats()['waiting'])
+metrics.gauge_callback('viva_newsletter_deliveries', 'Newsletter deliveries by status',
+                       lambda: newsletter_queue.stats()['deliveries'], ('status',))
+metrics.gauge_callback('viva_mpesa_callback_backlog', 'Journalled M-Pesa callbacks not yet applied',
+                       lambda: callback_journal.backlog())
+metrics.counter_callback('viva_mpesa_callbacks_total', 'M-Pesa callbacks journalled, deduplicated and applied',
+                         lambda: pick(callback_journal.stats(), ('appended', 'duplicates', 'applied', 'errors')),
+                         ('event',))
+metrics.gauge_callback('viva_stk_reconcile_pending', 'Stale pending STK requests awaiting or past reconciliation',
+                       lambda: dict(zip(('due', 'abandoned'),
+                                        stk_store.stale_pending_counts(stk_reconciler.min_age,
+                                                                       stk_reconciler.max_attempts))),
+                       ('state',))
+metrics.counter_callback('viva_stk_reconcile_events_total', 'STK Query reconciliation runs, queries and outcomes',
+                         lambda: pick(stk_reconciler.stats(),
+                                      ('runs', 'queried', 'resolved', 'still_processing', 'errors')),
+                         ('event',))
+metrics.gauge_callback('viva_stk_reconcile_last_run_seconds', 'Duration of the last reconciliation run',
+                       lambda: stk_reconciler.last_run_seconds or 0)
+metrics.counter_callback('viva_password_hash_events_total', 'Password hashes, verifies, rehashes and busy rejections',
+                         lambda: pick(password_hasher.stats(), ('hashed', 'verified', 'rehashes_needed', 'rejected')),
+                         ('event',))
+metrics.counter_callback('viva_search_requests_total', 'Search and autocomplete requests, and FTS5 queries run',
+                         lambda: pick(search_index.stats(), ('searches', 'suggestions', 'index_queries')),
+                         ('event',))
+metrics.gauge_callback('viva_auth_tokens_active', 'Unexpired bearer tokens', lambda: token_store.count())
+
+# ------------------- Frontend -------------------
+# Serves ../frontend (set FRONTEND_DIR, or SERVE_FRONTEND=false when Netlify/nginx serves it).
+# USE_X_SENDFILE=true hands file bodies to a fronting nginx/Apache instead of gunicorn's sendfile().
+FRONTEND_DIR = os.getenv('FRONTEND_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend'))
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'False').lower() == 'true'
+static_assets = None
+destination_pages = None
+if os.getenv('SERVE_FRONTEND', 'True').lower() == 'true' and os.path.isdir(FRONTEND_DIR):
+    static_assets = StaticAssets(FRONTEND_DIR, reload=os.getenv('STATIC_RELOAD', 'False').lower() == 'true').build()
+    # Destination and review pages are rendered from the destinations and reviews tables and served from
+    # memory; a change to either table is picked up within DESTINATION_REFRESH_INTERVAL seconds
+    destination_pages = DestinationPages(
+        destination_store,
+        table_versions,
+        static_assets,
+        image_manifest=os.path.join(FRONTEND_DIR, 'images', 'optimized', 'manifest.json'),
+        refresh_interval=float(os.getenv('DESTINATION_REFRESH_INTERVAL', '30')),
+        review_store=review_store
+    )
+    destination_pages.refresh()
+    static_assets.init_app(app)
+
+    @app.before_request
+    def refresh_destination_pages():
+        if request.blueprint == 'frontend':
+            destination_pages.refresh()
+
+    metrics.counter_callback('viva_static_responses_total', 'Frontend files served, by content encoding',
+                             lambda: {'identity': static_assets.served - sum(static_assets.encoded_hits.values()),
+                                      **static_assets.encoded_hits}, ('encoding',))
+    metrics.counter_callback('viva_static_not_modified_total', 'Frontend 304 responses',
+                             lambda: static_assets.not_modified)
+    metrics.counter_callback('viva_destination_page_renders_total', 'Full re-renders of the destination pages',
+                             lambda: destination_pages.renders)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/logout', methods=['POST', 'OPTIONS'])
 def logout():
     if request.method == 'OPTIONS':
         return '', 200
         
     # Clear session
+    user_id = session.get('user_id')
     session.clear()
+    if user_id is not None:
+        invalidate_user_cache(user_id)
     
     # Clear token if provided
     auth_header = request.headers.get('Authorization')
     if auth_header and auth_header.startswith('Bearer '):
         token = auth_header.split(' ')[1]
-        active_sessions.pop(token, None)
+        token_store.revoke(token)
     
     return jsonify({'message': 'Logged out successfully'})
 
@@ -697,9 +1261,9 @@ if __name__ == "__main__":
         while True:
             try:
                 requests.get(url, timeout=10)
-                print("Self-ping successful: Backend is awake.")
+                log.debug("Self-ping successful")
             except Exception as e:
-                print(f"Self-ping failed: {e}")
+                log.warning("Self-ping failed", extra={"error": str(e)})
             # Wait 14 minutes (Render sleeps after ~15 minutes)
             time.sleep(840)
 
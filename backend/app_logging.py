@@ -0,0 +1,174 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+# Kenyan mobile numbers in any of the forms Daraja and the frontend use (2547..., +2547..., 07..., 7...)
+PHONE_RE = re.compile(r'(?<!\d)(\+?254|0)?([17]\d{2})\d{4}(\d{2})(?!\d)')
+SECRET_KEY_RE = re.compile(r'pass|secret|token|authorization|cookie|credential|api_?key|consumer_?key', re.I)
+PHONE_KEY_RE = re.compile(r'phone|msisdn|partya|partyb', re.I)
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'request_id'}
+
+
+def mask_phone(text):
+    return PHONE_RE.sub(lambda m: f"{m.group(1) or ''}{m.group(2)}****{m.group(3)}", text)
+
+
+def redact(value, key=None):
+    """Mask credentials and phone numbers anywhere in a log payload."""
+    if key is not None and SECRET_KEY_RE.search(key):
+        return '[REDACTED]'
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Daraja callback metadata is a list of {"Name": ..., "Value": ...} pairs
+        if all(isinstance(v, dict) and 'Name' in v and 'Value' in v for v in value) and value:
+            return [{**v, 'Value': redact(v['Value'], str(v['Name']))} for v in value]
+        return [redact(v) for v in value]
+    if key is not None and PHONE_KEY_RE.search(key) and isinstance(value, (int, str)):
+        return mask_phone(str(value))
+    if isinstance(value, str):
+        return mask_phone(value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': mask_phone(record.getMessage()),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = redact(value, key)
+        # exc_text is set instead of exc_info once a record has crossed the queue
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            entry['exc'] = mask_phone(exc)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    # Runs in the request thread, before the record is queued, while flask.g is still reachable
+    def filter(self, record):
+        if not hasattr(record, 'request_id') and has_request_context():
+            record.request_id = g.get('request_id')
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of DEBUG/INFO records; WARNING and above always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class _ForkSafeQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, start_listener):
+        super().__init__(log_queue)
+        self.start_listener = start_listener
+        self.pid = os.getpid()
+
+    def prepare(self, record):
+        # Keep extra fields intact for the JSON formatter; only resolve msg % args here
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            # The listener thread does not survive a gunicorn fork
+            self.pid = os.getpid()
+            self.start_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging(level='INFO', sample_rate=1.0, sampled_loggers=(), stream=None, max_queue=10000):
+    """Route the 'viva' logger tree through a bounded queue to a JSON stream handler.
+
+    Request threads only enqueue; formatting, redaction and the stdout write
+    happen on a listener thread. When the queue is full records are dropped
+    rather than blocking a request. Loggers named in sampled_loggers keep only
+    sample_rate of their DEBUG/INFO records.
+    """
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(maxsize=max_queue)
+    state = {}
+
+    def start_listener():
+        state['listener'] = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+        state['listener'].start()
+
+    handler = _ForkSafeQueueHandler(log_queue, start_listener)
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger('viva')
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
+    for name in sampled_loggers:
+        logger = logging.getLogger(name)
+        logger.filters[:] = [f for f in logger.filters if not isinstance(f, SamplingFilter)]
+        logger.addFilter(SamplingFilter(sample_rate))
+
+    start_listener()
+    atexit.register(lambda: state['listener'].stop())
+    return handler
+
+
+def init_request_logging(app, access_logger='viva.access'):
+    """Give each request a correlation id (X-Request-ID in and out) and an access log line."""
+    access_log = logging.getLogger(access_logger)
+
+    @app.before_request
+    def assign_request_id():
+        # Reuse the caller's id (e.g. from a proxy) only if it is safe to echo back and log
+        incoming = request.headers.get('X-Request-ID', '')
+        g.request_id = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        started = g.get('request_started')
+        if started is not None:
+            access_log.info("request", extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            })
+        return response
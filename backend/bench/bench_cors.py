@@ -0,0 +1,131 @@
+"""Per-response CORS overhead: legacy vivautalii.py hooks vs flask_cors vs CorsPolicy.
+
+Each variant is installed on a bare Flask app with the same origins (the
+vivautalii.py defaults plus a few exact origins). The after_request path is
+timed for an exact origin, a wildcard-port origin and a refused origin, and
+the preflight path for a wildcard-port origin. Results are microseconds per
+response, plus how many Access-Control-Allow-Origin headers each variant emits.
+
+    python bench/bench_cors.py --output cors.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+
+from flask import Flask, jsonify, request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from cors import CorsPolicy  # noqa: E402
+
+ORIGINS = ['http://127.0.0.1:*', 'http://localhost:*', 'https://vivautalii.co.ke',
+           'https://www.vivautalii.co.ke', 'https://viva-utalii.netlify.app']
+REQUESTS = {
+    'exact_origin': 'https://viva-utalii.netlify.app',
+    'wildcard_port': 'http://localhost:5500',
+    'refused_origin': 'https://evil.example',
+}
+
+
+def legacy_app():
+    # The hooks vivautalii.py shipped with, stacked on flask_cors as it was configured there
+    from flask_cors import CORS
+    app = Flask('legacy')
+    allowed_origins = ORIGINS
+    CORS(app, origins=allowed_origins, supports_credentials=True, allow_headers=['*'], methods=['*'])
+
+    @app.before_request
+    def handle_options():
+        if request.method == 'OPTIONS':
+            response = jsonify({'status': 'preflight'})
+            origin = request.headers.get('Origin')
+            if origin in allowed_origins or any(origin.startswith(allowed.replace(':*', ''))
+                                                for allowed in allowed_origins if ':*' in allowed):
+                response.headers.add('Access-Control-Allow-Origin', origin)
+            response.headers.add('Access-Control-Allow-Headers', '*')
+            response.headers.add('Access-Control-Allow-Methods', '*')
+            response.headers.add('Access-Control-Allow-Credentials', 'true')
+            return response
+
+    @app.after_request
+    def after_request(response):
+        origin = request.headers.get('Origin')
+        if origin in allowed_origins or any(origin and origin.startswith(allowed.replace(':*', ''))
+                                            for allowed in allowed_origins if ':*' in allowed):
+            response.headers.add('Access-Control-Allow-Origin', origin)
+        response.headers.add('Access-Control-Allow-Headers', '*')
+        response.headers.add('Access-Control-Allow-Methods', '*')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        response.headers.add('Access-Control-Max-Age', '86400')
+        return response
+    return app
+
+
+def flask_cors_app():
+    from flask_cors import CORS
+    app = Flask('flask_cors')
+    CORS(app, origins=[o.replace(':*', r'(:\d+)?') for o in ORIGINS], supports_credentials=True,
+         allow_headers=['Content-Type', 'Authorization'])
+    return app
+
+
+def policy_app():
+    app = Flask('policy')
+    CorsPolicy(ORIGINS).init_app(app)
+    return app
+
+
+def time_variant(app, origin, method, number, repeat):
+    headers = {'Origin': origin, 'Access-Control-Request-Method': 'POST'}
+
+    def run():
+        response = app.preprocess_request()
+        if response is None:
+            response = app.response_class('{}', mimetype='application/json')
+        return app.process_response(app.make_response(response))
+
+    def baseline():
+        return app.response_class('{}', mimetype='application/json')
+
+    # One pushed request context: only the hooks (plus building a response) are timed
+    with app.test_request_context('/api/mpesa/stkpush', method=method, headers=headers):
+        timings = timeit.repeat(run, number=number, repeat=repeat)
+        base = timeit.repeat(baseline, number=number, repeat=repeat)
+        response = run()
+
+    per_call = [t / number * 1e6 for t in timings]
+    return {
+        'best_us': round(min(per_call), 2),
+        'median_us': round(statistics.median(per_call), 2),
+        'cors_overhead_us': round(min(per_call) - min(t / number * 1e6 for t in base), 2),
+        'allow_origin_headers': len(response.headers.getlist('Access-Control-Allow-Origin')),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    variants = {'legacy_hooks': legacy_app(), 'flask_cors': flask_cors_app(), 'cors_policy': policy_app()}
+    results = {}
+    for name, app in variants.items():
+        results[name] = {case: time_variant(app, origin, 'POST', args.number, args.repeat)
+                         for case, origin in REQUESTS.items()}
+        results[name]['preflight'] = time_variant(app, REQUESTS['wildcard_port'], 'OPTIONS',
+                                                  args.number, args.repeat)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
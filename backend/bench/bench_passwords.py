@@ -0,0 +1,152 @@
+"""Password hashing throughput per cost factor, and what a login flood does to other requests.
+
+For each --costs value of the chosen scheme (bcrypt when installed, else scrypt):
+
+    hash_ms / verify_ms    median single-call latency
+    verifies_per_second    throughput with --flood threads verifying through the pool
+                           (PasswordHasher with --workers threads)
+
+Then, at --flood-cost, --flood threads verify passwords for --seconds while a
+probe times a small pure-Python task standing in for a cheap route, every 10ms.
+This runs twice: with verify() inline on every flooding thread (one hash per
+request thread, as an unpooled login would) and through the bounded pool.
+Reports the probe's p50/p99 latency and the verifies completed.
+
+    python bench/bench_passwords.py --scheme scrypt --costs 12,13,14,15 --output passwords.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from credentials import PasswordHasher  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 2)
+
+
+def flood(verify, threads, seconds):
+    done = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+
+    def worker():
+        while time.monotonic() < stop_at:
+            verify()
+            with lock:
+                done[0] += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    return workers, done
+
+
+def probe(seconds):
+    # Stand-in for a cheap route: a little pure-Python work, timed every 10ms
+    latencies = []
+    stop_at = time.monotonic() + seconds
+    payload = {'deals': [{'id': i, 'destination': 'Maasai Mara', 'discount': '15%'} for i in range(20)]}
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        json.dumps(payload)
+        sorted(range(2000), key=lambda x: -x)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+    return latencies
+
+
+def cost_table(scheme, costs, workers, threads, seconds):
+    rows = []
+    for cost in costs:
+        hasher = PasswordHasher(scheme, cost, max_workers=workers, max_pending=threads * 2)
+        stored = hasher.hash(PASSWORD)
+        row = {
+            'cost': cost,
+            'hash_ms': timed(lambda: hasher.hash(PASSWORD), 3),
+            'verify_ms': timed(lambda: hasher.verify(PASSWORD, stored), 3),
+        }
+        started = time.monotonic()
+        pool_threads, done = flood(lambda: hasher.verify_async(PASSWORD, stored).result(), threads, seconds)
+        for t in pool_threads:
+            t.join()
+        row['verifies_per_second'] = round(done[0] / (time.monotonic() - started), 1)
+        rows.append(row)
+    return rows
+
+
+def stall_test(scheme, cost, workers, threads, seconds):
+    results = {}
+    hasher = PasswordHasher(scheme, cost, max_workers=workers, max_pending=threads * 2)
+    stored = hasher.hash(PASSWORD)
+    baseline = probe(min(seconds, 2))
+    results['idle'] = {'probe_p50_ms': round(percentile(baseline, 50) * 1000, 3),
+                       'probe_p99_ms': round(percentile(baseline, 99) * 1000, 3)}
+    for mode, verify in (('inline', lambda: hasher.verify(PASSWORD, stored)),
+                         ('pool', lambda: hasher.verify_async(PASSWORD, stored).result())):
+        flood_threads, done = flood(verify, threads, seconds)
+        latencies = probe(seconds)
+        for t in flood_threads:
+            t.join()
+        results[mode] = {
+            'verifies': done[0],
+            'probe_p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'probe_p99_ms': round(percentile(latencies, 99) * 1000, 3)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scheme', choices=['bcrypt', 'scrypt'], help='default: bcrypt if installed')
+    parser.add_argument('--costs', help='comma-separated cost factors (default 10-13 bcrypt, 12-16 scrypt)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='hashing pool threads')
+    parser.add_argument('--flood', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--flood-cost', type=int, help='cost for the stall test (default: the app default)')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    scheme = PasswordHasher(args.scheme).scheme
+    default_costs = '10,11,12,13' if scheme == 'bcrypt' else '12,13,14,15,16'
+    costs = [int(c) for c in (args.costs or default_costs).split(',')]
+    flood_cost = args.flood_cost or PasswordHasher(scheme).cost
+
+    results = {
+        'scheme': scheme,
+        'cpus': os.cpu_count(),
+        'workers': args.workers,
+        'flood_threads': args.flood,
+        'costs': cost_table(scheme, costs, args.workers, args.flood, args.seconds),
+        'login_flood': {'cost': flood_cost, **stall_test(scheme, flood_cost, args.workers, args.flood, args.seconds)}
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Compare client polling of /api/mpesa/query against the long-poll status endpoint.
+
+Each simulated customer starts an STK push against the mock Daraja server.
+A fake Safaricom callback then lands after a random delay. The customer
+waits for the final status either by polling every --poll-interval seconds
+or through /api/mpesa/status/<id>?wait=N. Reports the HTTP requests spent and
+how long after the callback the customer noticed it.
+
+    python bench/bench_payment_status.py --clients 50
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from pricing import PricingEngine  # noqa: E402
+
+# STK pushes must carry an itinerary the deposit is checked against
+ITINERARY = {'destination': 'Amboseli', 'accommodation': 'Budget', 'transport': 'Bus',
+             'start_date': '2030-03-01', 'end_date': '2030-03-03', 'adults': 1, 'children': 0}
+DEPOSIT = PricingEngine().quote(ITINERARY)['booking_fee']
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def run_mode(base, mode, clients, poll_interval, min_delay, max_delay):
+    lags, request_counts = [], []
+    lock = threading.Lock()
+
+    def customer():
+        session = requests.Session()
+        r = session.post(f"{base}/api/mpesa/stkpush",
+                         json={"phone": "254700000000", "amount": DEPOSIT, "itinerary": ITINERARY})
+        # stkpush answers 202 before Daraja is called; the CheckoutRequestID arrives with the first status
+        request_id = r.json()["request_id"]
+        status = {"status": "submitting"}
+        while status["status"] == "submitting":
+            status = session.get(f"{base}/api/mpesa/status/{request_id}",
+                                 params={"wait": 25, "status": "submitting"}).json()
+        checkout_id = status["checkout_request_id"]
+        fired = {}
+
+        def callback():
+            time.sleep(random.uniform(min_delay, max_delay))
+            fired['at'] = time.monotonic()
+            requests.post(f"{base}/api/mpesa_callback", json={
+                "Body": {"stkCallback": {"CheckoutRequestID": checkout_id, "ResultCode": 0}}
+            })
+
+        threading.Thread(target=callback, daemon=True).start()
+
+        count = 0
+        while True:
+            count += 1
+            if mode == 'poll':
+                body = session.post(f"{base}/api/mpesa/query", json={"CheckoutRequestID": checkout_id}).json()
+            else:
+                body = session.get(f"{base}/api/mpesa/status/{checkout_id}", params={"wait": 25}).json()
+            if body["status"] != "pending":
+                break
+            if mode == 'poll':
+                time.sleep(poll_interval)
+
+        with lock:
+            lags.append(time.monotonic() - fired['at'])
+            request_counts.append(count)
+
+    threads = [threading.Thread(target=customer) for _ in range(clients)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return {
+        'mode': mode,
+        'clients': clients,
+        'wall_seconds': round(time.monotonic() - started, 3),
+        'status_requests_total': sum(request_counts),
+        'status_requests_per_client': round(statistics.mean(request_counts), 2),
+        'notify_lag_p50_ms': round(percentile(lags, 50) * 1000, 1),
+        'notify_lag_p95_ms': round(percentile(lags, 95) * 1000, 1),
+        'notify_lag_max_ms': round(max(lags) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=30)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--min-delay', type=float, default=1.0)
+    parser.add_argument('--max-delay', type=float, default=5.0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    from mock_daraja import start_mock_server
+    _, daraja_url = start_mock_server()
+    os.environ['MPESA_BASE_URL'] = daraja_url
+    os.environ.setdefault('MPESA_MAX_PENDING', str(args.clients * 2))
+
+    # app.py keeps its SQLite file in the working directory
+    os.chdir(tempfile.mkdtemp(prefix='viva-bench-'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as backend
+
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    # Keep the app's request prints and access logs out of the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [run_mode(base, mode, args.clients, args.poll_interval, args.min_delay, args.max_delay)
+                   for mode in ('poll', 'longpoll')]
+    server.shutdown()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Run the STK reconciler against the mock Daraja server and check what it wrote.
+
+Seeds --requests pending STK requests whose callbacks never arrived. The mock
+is told how each one ended: paid, cancelled (1032), or still being processed.
+app.stk_reconciler.run_once() then queries them with the configured
+concurrency and rate limit. Reports wall time, achieved query rate, peak
+concurrent queries, and whether every stored status matches the mock. A
+second run checks that still-processing requests are backed off rather than
+queried again straight away.
+
+    python bench/bench_reconcile.py --requests 200 --rate 50 --concurrency 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+OUTCOMES = {'paid': 0.6, 'cancelled': 0.25, 'processing': 0.15}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=50.0, help='STK queries per second')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--daraja-latency', type=float, default=0.05, help='mock Daraja delay per call (s)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    from mock_daraja import start_mock_server
+    daraja, daraja_url = start_mock_server(latency=args.daraja_latency)
+    os.environ.update(MPESA_BASE_URL=daraja_url, LOG_LEVEL='WARNING', RECONCILE_ENABLED='false',
+                      RECONCILE_MIN_AGE='0', RECONCILE_RATE_PER_SECOND=str(args.rate),
+                      RECONCILE_CONCURRENCY=str(args.concurrency), RECONCILE_BATCH_SIZE=str(args.batch_size))
+
+    # app.py keeps its SQLite file in the working directory
+    os.chdir(tempfile.mkdtemp(prefix='viva-reconcile-'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as backend
+    reconciler = backend.stk_reconciler
+
+    expected = {}
+    for i in range(args.requests):
+        checkout_id = f"ws_CO_bench{i:06d}"
+        outcome = random.choices(list(OUTCOMES), list(OUTCOMES.values()))[0]
+        if outcome == 'processing':
+            daraja.state.set_processing(checkout_id)
+        else:
+            daraja.state.set_result(checkout_id, 0 if outcome == 'paid' else 1032)
+        expected[checkout_id] = {'paid': 'success', 'cancelled': 'failed', 'processing': 'pending'}[outcome]
+        backend.stk_store.add(checkout_id, '254700000000', 100)
+    time.sleep(0.01)
+
+    # Track how many STK queries are in flight at once
+    in_flight, peak, lock = [0], [0], threading.Lock()
+    query = reconciler.query
+
+    def tracked_query(checkout_id):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            return query(checkout_id)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+    reconciler.query = tracked_query
+
+    started = time.monotonic()
+    resolved = reconciler.run_once()
+    wall = time.monotonic() - started
+    queries = daraja.state.counts['stkquery']
+    mismatched = [c for c, status in expected.items() if backend.stk_store.get(c)['status'] != status]
+
+    resolved_again = reconciler.run_once()
+    results = {
+        'requests': args.requests,
+        'resolved': resolved,
+        'still_pending': sum(1 for s in expected.values() if s == 'pending'),
+        'mismatched': len(mismatched),
+        'wall_seconds': round(wall, 3),
+        'stk_queries': queries,
+        'queries_per_second': round(queries / wall, 1),
+        'rate_limit': args.rate,
+        'peak_concurrent_queries': peak[0],
+        'concurrency_limit': args.concurrency,
+        'second_run_queries': daraja.state.counts['stkquery'] - queries,
+        'second_run_resolved': resolved_again,
+        'stats': reconciler.stats()
+    }
+    daraja.shutdown()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Search latency as the review corpus grows.
+
+Migrates a fresh database (which indexes the seeded destinations, deals and
+reviews), then grows the reviews table to each --sizes total by inserting
+synthetic reviews built from the seed texts. The triggers index them as they
+go, so the insert rate includes index maintenance. At each size, every
+--queries query is run uncached (the result cache is cleared first), then
+repeated from the cache. The same is done for autocomplete prefixes.
+
+    index_rows_per_second    reviews inserted and indexed per second
+    search_p50_ms / p95_ms   uncached /api/search work (FTS5 MATCH + BM25 + snippets)
+    suggest_p50_ms / p95_ms  uncached autocomplete
+    cached_us                median cached search
+
+    python bench/bench_search.py --sizes 1000,10000,100000 --output search.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import migrations  # noqa: E402
+from http_cache import TableVersions  # noqa: E402
+from reviews import load_seed  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+QUERIES = ['rhino', 'elephants kilimanjaro', 'beach hotel', 'great migration river', 'guides', 'diani',
+           'hot air balloon', 'snorkeling reef', 'mount kenya climb', 'zanzibar']
+PREFIXES = ['ma', 'amb', 'dia', 'ol p', 'nair', 'mt k', 'saf']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def grow(conn, seed, target, rng):
+    have = conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+    if target <= have:
+        return 0, 0.0
+    words = [w for items in seed.values() for r in items for w in r['text'].split()]
+    rows = []
+    for _ in range(target - have):
+        slug = rng.choice(list(seed))
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(25, 60)))
+        rows.append((slug, 'Bench Traveler', rng.randint(1, 5), text, json.dumps(rng.sample(['wildlife', 'beach', 'lodges'], 1)),
+                     'Google Reviews', f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"))
+    started = time.perf_counter()
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO reviews (destination, name, rating, text, tags, source, created_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.execute("COMMIT")
+    return len(rows), time.perf_counter() - started
+
+
+def time_calls(call, args_list, repeat):
+    timings = []
+    for _ in range(repeat):
+        for args in args_list:
+            started = time.perf_counter()
+            call(*args)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='total reviews to measure at')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    database = os.path.join(tempfile.mkdtemp(prefix='viva-search-'), 'search.db')
+    migrations.migrate(database)
+
+    def connect():
+        conn = sqlite3.connect(database, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+    # One long-lived connection standing in for the pool; close() is a no-op like a pooled checkout
+    shared = connect()
+
+    class Pooled:
+        def __getattr__(self, name):
+            return getattr(shared, name)
+
+        def close(self):
+            pass
+    search = SearchIndex(lambda: Pooled(), TableVersions(lambda: Pooled()))
+    seed = load_seed()
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        inserted, seconds = grow(shared, seed, size, rng)
+        uncached, suggest = [], []
+        for _ in range(args.repeat):
+            for query in QUERIES:
+                search.cache.clear()
+                started = time.perf_counter()
+                search.search(query)
+                uncached.append((time.perf_counter() - started) * 1000)
+            for prefix in PREFIXES:
+                search.cache.clear()
+                started = time.perf_counter()
+                search.suggest(prefix)
+                suggest.append((time.perf_counter() - started) * 1000)
+        cached = time_calls(search.search, [(q,) for q in QUERIES], args.repeat)
+        results.append({
+            'reviews': size,
+            'index_rows_per_second': round(inserted / seconds) if inserted else None,
+            'search_p50_ms': round(statistics.median(uncached), 2),
+            'search_p95_ms': round(percentile(uncached, 0.95), 2),
+            'suggest_p50_ms': round(statistics.median(suggest), 2),
+            'suggest_p95_ms': round(percentile(suggest, 0.95), 2),
+            'cached_us': round(statistics.median(cached) * 1000, 1),
+            'database_mb': round(os.path.getsize(database) / 1e6, 1),
+        })
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
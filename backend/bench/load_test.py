@@ -0,0 +1,265 @@
+"""Closed-loop load test of the backend under gunicorn against the mock Daraja server.
+
+Starts mock_daraja.py in-process and app.py under gunicorn in a throwaway
+working directory, then runs --concurrency virtual users for --duration
+seconds. Each iteration picks a scenario from a weighted mix:
+
+    login          POST /login
+    verify_token   GET  /verify-token with a bearer token
+    get_deals      GET  /get_deals
+    stk_push       POST /api/mpesa/stkpush, GET /api/mpesa/status until Daraja accepts it,
+                   then the Safaricom callback
+    query_poll     POST /api/mpesa/query on a recent checkout id
+
+Throughput and p50/p90/p95/p99 latency per scenario are written as JSON.
+
+    python bench/load_test.py --workers 2 --threads 4 --concurrency 32 --duration 30
+    python bench/load_test.py --mix login=1,get_deals=5 --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from pricing import PricingEngine  # noqa: E402
+
+# STK pushes must carry an itinerary the deposit is checked against
+ITINERARY = {'destination': 'Amboseli', 'accommodation': 'Budget', 'transport': 'Bus',
+             'start_date': '2030-03-01', 'end_date': '2030-03-03', 'adults': 1, 'children': 0}
+DEPOSIT = PricingEngine().quote(ITINERARY)['booking_fee']
+
+DEFAULT_MIX = {'login': 10, 'verify_token': 30, 'get_deals': 30, 'stk_push': 10, 'query_poll': 20}
+TEST_USER = {'email': 'john@example.com', 'password': 'password123'}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ------------------- Server under test -------------------
+def start_gunicorn(workdir, env, workers, threads):
+    port = free_port()
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--chdir', workdir, '--pythonpath', BACKEND_DIR,
+         '-w', str(workers), '--threads', str(threads), '-b', f'127.0.0.1:{port}',
+         '--graceful-timeout', '5', 'app:app'],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn exited early; see {log.name}")
+        try:
+            requests.get(f"{base}/health", timeout=1)
+            return proc, base
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"gunicorn did not come up; see {log.name}")
+
+
+def stop_gunicorn(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        proc.kill()
+
+
+# ------------------- Virtual users -------------------
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, base, recorder, checkout_ids):
+        self.base = base
+        self.recorder = recorder
+        self.checkout_ids = checkout_ids
+        self.session = requests.Session()
+        self.token = None
+
+    def timed(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = self.session.request(method, f"{self.base}{path}", timeout=30, **kwargs)
+            ok = resp.status_code < 500
+        except requests.exceptions.RequestException:
+            resp, ok = None, False
+        self.recorder.record(name, time.perf_counter() - started, ok)
+        return resp
+
+    def login(self):
+        resp = self.timed('login', 'POST', '/login', json=TEST_USER)
+        if resp is not None and resp.status_code == 200:
+            self.token = resp.json().get('token')
+
+    def verify_token(self):
+        if not self.token:
+            return self.login()
+        self.timed('verify_token', 'GET', '/verify-token', headers={'Authorization': f"Bearer {self.token}"})
+
+    def get_deals(self):
+        self.timed('get_deals', 'GET', '/get_deals')
+
+    def stk_push(self):
+        resp = self.timed('stk_push', 'POST', '/api/mpesa/stkpush',
+                          json={'phone': f"2547{random.randint(0, 99999999):08d}", 'amount': DEPOSIT,
+                                'itinerary': ITINERARY})
+        if resp is None or resp.status_code != 202:
+            return
+        # The push is answered before Daraja is called; wait for the CheckoutRequestID it is given
+        status = self.timed('stk_status', 'GET', f"/api/mpesa/status/{resp.json()['request_id']}",
+                            params={'wait': 25, 'status': 'submitting'})
+        if status is None or status.status_code != 200 or status.json().get('status') != 'pending':
+            return
+        checkout_id = status.json()['checkout_request_id']
+        self.checkout_ids.append(checkout_id)
+        self.timed('callback', 'POST', '/api/mpesa_callback', json={
+            'Body': {'stkCallback': {'CheckoutRequestID': checkout_id, 'ResultCode': 0,
+                                     'ResultDesc': 'The service request is processed successfully.'}}
+        })
+
+    def query_poll(self):
+        if not self.checkout_ids:
+            return self.stk_push()
+        checkout_id = self.checkout_ids[random.randrange(len(self.checkout_ids))]
+        self.timed('query_poll', 'POST', '/api/mpesa/query', json={'CheckoutRequestID': checkout_id})
+
+
+def run_load(base, mix, concurrency, duration, warmup):
+    recorder = Recorder()
+    checkout_ids = []
+    names, weights = list(mix), list(mix.values())
+    stop_at = time.monotonic() + warmup + duration
+    measure_from = time.monotonic() + warmup
+
+    def user():
+        vu = VirtualUser(base, Recorder(), checkout_ids)
+        vu.login()
+        while time.monotonic() < stop_at:
+            # Warm-up iterations go to a throwaway recorder
+            vu.recorder = recorder if time.monotonic() >= measure_from else Recorder()
+            getattr(vu, random.choices(names, weights)[0])()
+
+    threads = [threading.Thread(target=user) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    scenarios = {}
+    for name, values in sorted(recorder.latencies.items()):
+        scenarios[name] = {
+            'requests': len(values),
+            'errors': recorder.errors.get(name, 0),
+            'rps': round(len(values) / duration, 1),
+            **{f'p{p}_ms': round(percentile(values, p) * 1000, 2) for p in (50, 90, 95, 99)},
+            'max_ms': round(max(values) * 1000, 2)
+        }
+    total = sum(s['requests'] for s in scenarios.values())
+    return {
+        'total_requests': total,
+        'total_errors': sum(s['errors'] for s in scenarios.values()),
+        'rps': round(total / duration, 1),
+        'scenarios': scenarios
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual users')
+    parser.add_argument('--duration', type=float, default=20.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--mix', help='weights, e.g. login=10,get_deals=30 (default: %s)' %
+                        ','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()))
+    parser.add_argument('--daraja-latency', type=float, default=0.05, help='mock Daraja delay per call (s)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep-workdir', action='store_true')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+
+    from mock_daraja import start_mock_server
+    daraja, daraja_url = start_mock_server(latency=args.daraja_latency)
+
+    workdir = tempfile.mkdtemp(prefix='viva-load-')
+    env = dict(os.environ, MPESA_BASE_URL=daraja_url, LOG_LEVEL='WARNING',
+               MPESA_MAX_PENDING=str(max(32, args.concurrency * 2)))
+    # Migrate once up front, as a deploy would; workers then only check schema_version
+    subprocess.run([sys.executable, os.path.join(BACKEND_DIR, 'migrations.py'), 'migrate'], cwd=workdir,
+                   stdout=subprocess.DEVNULL, env=env, check=True)
+    env['DB_AUTO_MIGRATE'] = 'false'
+
+    proc, base = start_gunicorn(workdir, env, args.workers, args.threads)
+    try:
+        results = run_load(base, mix, args.concurrency, args.duration, args.warmup)
+    finally:
+        stop_gunicorn(proc)
+        daraja.shutdown()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results['config'] = {
+        'workers': args.workers, 'threads': args.threads, 'concurrency': args.concurrency,
+        'duration': args.duration, 'mix': mix, 'daraja_latency': args.daraja_latency, 'seed': args.seed
+    }
+    results['daraja_calls'] = daraja.state.counts
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
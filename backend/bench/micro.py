@@ -0,0 +1,158 @@
+"""Micro-benchmarks for per-request helpers in app.py.
+
+    get_user_session / get_user_token    get_user() with a warm user cache
+    get_user_token_uncached              get_user() that has to hit the token store and users table
+    init_db                              init_db() against an already-initialised database (every boot)
+    cors_after_request                   the CorsPolicy after_request hook for an allowed Origin
+    after_request_all                    every before/after_request hook (CORS, logging, metrics)
+    vivautalii_after_request             the same hook as configured in vivautalii.py (wildcard ports)
+
+Hooks are timed inside one pushed request context, including building a
+fresh response each call (see response_baseline). Results are in
+microseconds per call. Pass --baseline with an earlier --output
+file to exit non-zero when any benchmark is slower than --threshold times the
+baseline:
+
+    python bench/micro.py --output before.json
+    python bench/micro.py --baseline before.json --threshold 1.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import timeit
+
+from flask import session
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ORIGIN = 'http://localhost:5500'
+
+
+def measure(fn, number, repeat, context=None):
+    # The request context is pushed once, so only the helper itself is timed
+    with context if context is not None else contextlib.nullcontext():
+        timings = timeit.repeat(fn, number=number, repeat=repeat)
+    per_call = [t / number * 1e6 for t in timings]
+    return {'best_us': round(min(per_call), 3), 'median_us': round(statistics.median(per_call), 3)}
+
+
+def load_apps():
+    # Both modules create their SQLite file in the working directory and log to stdout on import
+    os.chdir(tempfile.mkdtemp(prefix='viva-micro-'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as backend
+        import vivautalii
+    return backend, vivautalii
+
+
+class SessionUser:
+    # Request context with a logged-in Flask session
+    def __init__(self, context):
+        self.context = context
+
+    def __enter__(self):
+        self.context.__enter__()
+        session['user_id'] = 1
+
+    def __exit__(self, *exc):
+        return self.context.__exit__(*exc)
+
+
+def benchmarks(backend, vivautalii):
+    """name -> (callable, iterations, request context factory or None)."""
+    app = backend.app
+    token = backend.token_store.issue(1)
+    bearer = {'Authorization': f'Bearer {token}'}
+
+    def cors_request(flask_app):
+        return lambda: flask_app.test_request_context('/api/mpesa/stkpush', method='POST',
+                                                      headers={'Origin': ORIGIN})
+
+    def hook(flask_app, predicate):
+        hooks = [f for f in flask_app.after_request_funcs.get(None, []) if predicate(f)]
+        if not hooks:
+            return None
+        return lambda: hooks[0](flask_app.response_class('{}', mimetype='application/json'))
+
+    def all_hooks():
+        app.preprocess_request()
+        app.process_response(app.response_class('[]', mimetype='application/json'))
+
+    def uncached_token_user():
+        backend.user_cache.clear()
+        backend.get_user()
+
+    def init_db():
+        with contextlib.redirect_stdout(io.StringIO()):
+            backend.init_db()
+
+    return {
+        'response_baseline': (lambda: app.response_class('{}', mimetype='application/json'), 20000,
+                              cors_request(app)),
+        'get_user_session': (backend.get_user, 20000,
+                             lambda: SessionUser(app.test_request_context('/get_user_info'))),
+        'get_user_token': (backend.get_user, 20000,
+                           lambda: app.test_request_context('/get_user_info', headers=bearer)),
+        'get_user_token_uncached': (uncached_token_user, 5000,
+                                    lambda: app.test_request_context('/get_user_info', headers=bearer)),
+        'init_db': (init_db, 200, None),
+        'cors_after_request': (hook(app, lambda f: f.__name__ == 'cors_headers'), 20000,
+                               cors_request(app)),
+        'after_request_all': (all_hooks, 10000, cors_request(app)),
+        'vivautalii_after_request': (hook(vivautalii.app, lambda f: f.__name__ == 'cors_headers'), 20000,
+                                     cors_request(vivautalii.app)),
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('benchmarks', {}).get(name)
+        if before and result['best_us'] > before['best_us'] * threshold:
+            regressions.append(f"{name}: {before['best_us']}us -> {result['best_us']}us")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply iteration counts')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--baseline', help='earlier --output file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='allowed slowdown vs baseline')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    backend, vivautalii = load_apps()
+    selected = set(args.only.split(',')) if args.only else None
+
+    results = {}
+    for name, (fn, number, context) in benchmarks(backend, vivautalii).items():
+        if fn is None or (selected and name not in selected):
+            continue
+        results[name] = measure(fn, max(1, int(number * args.scale)), args.repeat,
+                                context() if context else None)
+
+    report = {'python': sys.version.split()[0], 'benchmarks': results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import base64
+from datetime import date
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, booking_id):
+    raw = f"{created_at}|{booking_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, booking_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return created_at, int(booking_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+class BookingStore:
+    """Queries over the bookings table.
+
+    Listings use keyset pagination on (created_at, id) backed by the
+    (user_id, created_at) index, so fetching a page costs the same however
+    many bookings a user has. Each view selects only the columns it renders.
+    """
+
+    ACTIVE_STATUSES = ('pending', 'confirmed')
+
+    def __init__(self, get_connection, default_page_size=20, max_page_size=100):
+        self.get_connection = get_connection
+        self.default_page_size = default_page_size
+        self.max_page_size = max_page_size
+
+    def _page_size(self, limit):
+        if not limit or limit <= 0:
+            return self.default_page_size
+        return min(limit, self.max_page_size)
+
+    def _page(self, columns, where, params, cursor, limit):
+        limit = self._page_size(limit)
+        sql = f"SELECT id, created_at, {columns} FROM bookings WHERE {where}"
+        params = list(params)
+        if cursor:
+            created_at, booking_id = decode_cursor(cursor)
+            sql += " AND (created_at, id) < (?, ?)"
+            params += [created_at, booking_id]
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    # ------------------- Writes -------------------
+    def create(self, user_id, destination_id, dest_name, arrive_date, depart_date, travelers,
+               acc_tier, total_cost, deposit_amount, mpesa_phone=None, mpesa_reference=None):
+        conn = self.get_connection()
+        try:
+            cur = conn.execute(
+                "INSERT INTO bookings (user_id, destination_id, dest_name, arrive_date, depart_date, "
+                "travelers, acc_tier, total_cost, deposit_amount, mpesa_phone, mpesa_reference, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending')",
+                (user_id, destination_id, dest_name, arrive_date, depart_date, travelers,
+                 acc_tier, total_cost, deposit_amount, mpesa_phone, mpesa_reference)
+            )
+            conn.commit()
+            return cur.lastrowid
+        finally:
+            conn.close()
+
+    def cancel(self, user_id, booking_id=None, destination=None):
+        """Cancel a booking by id, or the user's latest active booking for a destination.
+
+        Returns the cancelled booking's id, or None if nothing matched.
+        """
+        conn = self.get_connection()
+        try:
+            if booking_id is None:
+                row = conn.execute(
+                    "SELECT id FROM bookings WHERE user_id=? AND dest_name=? AND status IN (?, ?) "
+                    "ORDER BY created_at DESC, id DESC LIMIT 1",
+                    (user_id, destination, *self.ACTIVE_STATUSES)
+                ).fetchone()
+                if not row:
+                    return None
+                booking_id = row['id']
+            cur = conn.execute(
+                "UPDATE bookings SET status='cancelled' WHERE id=? AND user_id=? AND status IN (?, ?)",
+                (booking_id, user_id, *self.ACTIVE_STATUSES)
+            )
+            conn.commit()
+            return booking_id if cur.rowcount else None
+        finally:
+            conn.close()
+
+    # ------------------- Reads -------------------
+    def upcoming(self, user_id, cursor=None, limit=None):
+        rows, next_cursor = self._page(
+            "dest_name, arrive_date, status, paid_deposit",
+            "user_id=? AND status IN (?, ?) AND depart_date >= ?",
+            (user_id, *self.ACTIVE_STATUSES, date.today().isoformat()),
+            cursor, limit
+        )
+        bookings = [{
+            'id': row['id'],
+            'destination': row['dest_name'],
+            'date': row['arrive_date'],
+            'status': row['status'].capitalize(),
+            'fee_paid': bool(row['paid_deposit'])
+        } for row in rows]
+        return bookings, next_cursor
+
+    def history(self, user_id, cursor=None, limit=None):
+        rows, next_cursor = self._page(
+            "dest_name, arrive_date, depart_date",
+            "user_id=? AND status IN ('confirmed', 'completed') AND depart_date < ?",
+            (user_id, date.today().isoformat()),
+            cursor, limit
+        )
+        trips = [{
+            'id': row['id'],
+            'destination': row['dest_name'],
+            'start_date': row['arrive_date'],
+            'end_date': row['depart_date'],
+            'status': 'Completed'
+        } for row in rows]
+        return trips, next_cursor
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, max_size=1024, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def delete_where(self, predicate):
+        """Drop every entry for which predicate(key, value) is true."""
+        with self._lock:
+            doomed = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in doomed:
+                del self._data[k]
+            self.invalidations += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
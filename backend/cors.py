@@ -0,0 +1,101 @@
+import re
+
+from flask import request
+
+
+class CorsPolicy:
+    """CORS origin matching and headers, compiled once from the configured origins.
+
+    Exact origins live in a set. Wildcard-port entries such as
+    'http://localhost:*' are compiled into one regex that only accepts
+    scheme://host or scheme://host:<digits>, so lookalike hosts such as
+    http://localhost.evil.com no longer pass the old startswith() check. '*'
+    allows any origin; it is reflected back so credentials keep working.
+    Match results and preflight headers are memoised per origin. Headers are
+    set, never appended, so each appears once per response.
+    """
+
+    def __init__(self, origins, allow_headers=('Content-Type', 'Authorization', 'X-Request-ID'),
+                 allow_methods=('GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'), allow_credentials=True,
+                 expose_headers=(), max_age=86400, max_cached_origins=1024):
+        origins = [o.strip().rstrip('/') for o in origins if o and o.strip()]
+        self.origins = origins
+        self.allow_any = '*' in origins
+        self.exact = {o for o in origins if '*' not in o}
+        patterns = [re.escape(o[:-2]) + r'(?::\d+)?' for o in origins if o.endswith(':*')]
+        self.pattern = re.compile('^(?:' + '|'.join(patterns) + ')$') if patterns else None
+        self.max_cached_origins = max_cached_origins
+        self._matches = {}
+
+        self.base_headers = {}
+        if allow_credentials:
+            self.base_headers['Access-Control-Allow-Credentials'] = 'true'
+        if expose_headers:
+            self.base_headers['Access-Control-Expose-Headers'] = ', '.join(expose_headers)
+
+        self.preflight_headers = {
+            'Access-Control-Allow-Methods': ', '.join(allow_methods),
+            'Access-Control-Allow-Headers': ', '.join(allow_headers),
+            'Access-Control-Max-Age': str(int(max_age)),
+        }
+        self._preflights = {}
+
+    @classmethod
+    def from_env(cls, value, default='*', **kwargs):
+        return cls((value or default).split(','), **kwargs)
+
+    def allowed(self, origin):
+        if not origin:
+            return False
+        cached = self._matches.get(origin)
+        if cached is not None:
+            return cached
+        ok = self.allow_any or origin in self.exact or \
+            (self.pattern is not None and self.pattern.match(origin) is not None)
+        if len(self._matches) < self.max_cached_origins:
+            self._matches[origin] = ok
+        return ok
+
+    def apply(self, response, origin=None):
+        origin = request.headers.get('Origin') if origin is None else origin
+        headers = response.headers
+        # The answer depends on Origin even when it is refused, so shared caches must key on it.
+        # Edited as a string: response.vary re-parses the header into a HeaderSet on every access.
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Origin'
+        elif 'Origin' not in vary:
+            headers['Vary'] = f"{vary}, Origin"
+        # One membership scan instead of a replace-scan per header set
+        if not self.allowed(origin) or 'Access-Control-Allow-Origin' in headers:
+            return response
+        headers.add('Access-Control-Allow-Origin', origin)
+        for name, value in self.base_headers.items():
+            headers.add(name, value)
+        return response
+
+    def preflight(self, response_class, origin=None):
+        origin = request.headers.get('Origin') if origin is None else origin
+        headers = self._preflights.get(origin)
+        if headers is None:
+            headers = [('Vary', 'Origin')]
+            if self.allowed(origin):
+                headers += [('Access-Control-Allow-Origin', origin), *self.base_headers.items(),
+                            *self.preflight_headers.items()]
+            if len(self._preflights) < self.max_cached_origins:
+                self._preflights[origin] = headers
+        return response_class('', 204, headers)
+
+    def init_app(self, app):
+        """Answer every OPTIONS preflight up front and add CORS headers to every other response."""
+
+        @app.before_request
+        def cors_preflight():
+            if request.method == 'OPTIONS':
+                return self.preflight(app.response_class)
+
+        @app.after_request
+        def cors_headers(response):
+            if request.method != 'OPTIONS':
+                self.apply(response)
+            return response
@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+
+class CredentialsBusy(Exception):
+    pass
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class PasswordHasher:
+    """Password hashing with a tunable cost, run off the request thread.
+
+    scheme is 'bcrypt' (cost = log2 rounds, needs the bcrypt package) or
+    'scrypt' (stdlib hashlib; cost = log2 N with r=8, p=1). Stored values are
+    self-describing ('$2b$12$...' or 'scrypt$15$8$1$salt$hash'), so rows written
+    under an old scheme or cost still verify, and verify() reports that they
+    need rehashing. Rows that are neither are legacy plaintext: they are
+    compared in constant time and always need rehashing.
+
+    Both schemes release the GIL while hashing, so verify_async()/hash_async()
+    run them on a pool of max_workers threads. Other requests keep running,
+    and at most max_workers hashes compete for CPU at once. Once max_pending
+    calls are queued or running, the *_async methods raise CredentialsBusy
+    immediately instead of piling up behind a login flood.
+    """
+
+    SCRYPT_R = 8
+    SCRYPT_P = 1
+
+    def __init__(self, scheme=None, cost=None, max_workers=None, max_pending=64):
+        self.scheme = scheme or ('bcrypt' if bcrypt is not None else 'scrypt')
+        if self.scheme == 'bcrypt' and bcrypt is None:
+            raise ValueError("PASSWORD_SCHEME=bcrypt needs the bcrypt package")
+        if self.scheme not in ('bcrypt', 'scrypt'):
+            raise ValueError(f"Unknown password scheme {self.scheme!r}")
+        self.cost = int(cost) if cost else (12 if self.scheme == 'bcrypt' else 15)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 2,
+                                            thread_name_prefix='passwords')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Verified against when the account does not exist, so a miss costs as much as a hit
+        self._dummy = None
+
+        self.hashed = 0
+        self.verified = 0
+        self.rehashes_needed = 0
+        self.rejected = 0
+
+    # ------------------- Hashing -------------------
+    def _scrypt(self, password, salt, cost, r, p):
+        n = 2 ** cost
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20,
+                              dklen=32)
+
+    def hash(self, password):
+        self.hashed += 1
+        if self.scheme == 'bcrypt':
+            return bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.cost)).decode()
+        salt = os.urandom(16)
+        digest = self._scrypt(password, salt, self.cost, self.SCRYPT_R, self.SCRYPT_P)
+        return f"scrypt${self.cost}${self.SCRYPT_R}${self.SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+    def needs_rehash(self, stored):
+        if self.scheme == 'bcrypt':
+            return not (stored.startswith('$2') and stored.split('$')[2] == f"{self.cost:02d}")
+        return not stored.startswith(f"scrypt${self.cost}${self.SCRYPT_R}${self.SCRYPT_P}$")
+
+    def verify(self, password, stored):
+        """Returns (ok, needs_rehash) for a password against a stored hash or legacy plaintext."""
+        self.verified += 1
+        if stored is None:
+            return False, False
+        if stored.startswith('$2'):
+            if bcrypt is None:
+                raise ValueError("bcrypt hash stored but the bcrypt package is not installed")
+            ok = bcrypt.checkpw(password.encode(), stored.encode())
+        elif stored.startswith('scrypt$'):
+            try:
+                _, cost, r, p, salt, digest = stored.split('$')
+                ok = hmac.compare_digest(self._scrypt(password, _unb64(salt), int(cost), int(r), int(p)),
+                                         _unb64(digest))
+            except ValueError:
+                ok = False
+        else:
+            ok = hmac.compare_digest(password.encode(), stored.encode())
+        rehash = ok and self.needs_rehash(stored)
+        if rehash:
+            self.rehashes_needed += 1
+        return ok, rehash
+
+    def verify_missing(self, password):
+        """Burn one verify's worth of CPU for an unknown account; always (False, False)."""
+        if self._dummy is None:
+            self._dummy = self.hash(secrets.token_urlsafe(24))
+        self.verify(password, self._dummy)
+        return False, False
+
+    # ------------------- Offloaded -------------------
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise CredentialsBusy("Too many sign-in attempts in progress, please try again")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash_async(self, password):
+        return self._submit(self.hash, password)
+
+    def verify_async(self, password, stored):
+        """Future for verify(); stored=None verifies against a dummy hash instead."""
+        if stored is None:
+            return self._submit(self.verify_missing, password)
+        return self._submit(self.verify, password, stored)
+
+    def stats(self):
+        return {
+            'scheme': self.scheme,
+            'cost': self.cost,
+            'hashed': self.hashed,
+            'verified': self.verified,
+            'rehashes_needed': self.rehashes_needed,
+            'rejected': self.rejected
+        }
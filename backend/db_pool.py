@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    """Thin wrapper around a sqlite3 connection that goes back to the pool on close()."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+        self._acquired_at = time.perf_counter()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        self.close()
+        return False
+
+    def __del__(self):
+        # Handlers that bail out early without close() must not leak pool slots
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn)
+            if self._pool.on_release is not None:
+                self._pool.on_release(time.perf_counter() - self._acquired_at)
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections.
+
+    Connections are opened lazily, configured once (WAL + pragmas) when they
+    are created, and handed back to the thread that last used them whenever
+    possible so its page cache stays warm.
+
+    on_acquire(seconds waited) and on_release(seconds held) are optional
+    timing hooks, e.g. for metrics.
+    """
+
+    def __init__(self, database, max_size=8, timeout=5.0, health_check_interval=30.0,
+                 cache_size_kb=16384, mmap_size=268435456, synchronous='NORMAL',
+                 busy_timeout_ms=5000, on_acquire=None, on_release=None):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+
+        self._lock = threading.Condition()
+        self._idle = []        # list of (conn, owner_thread_id, last_used)
+        self._size = 0
+        self._closed = False
+        self._pid = os.getpid()
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+
+    # ------------------- Connection lifecycle -------------------
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout_ms / 1000.0,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        if self.database != ':memory:':
+            cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA synchronous={self.synchronous}")
+        cur.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        cur.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        cur.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self.discarded += 1
+
+    def _take_idle(self):
+        # Prefer the connection this thread used last, otherwise the most recently used one
+        me = threading.get_ident()
+        for i in range(len(self._idle) - 1, -1, -1):
+            if self._idle[i][1] == me:
+                return self._idle.pop(i)
+        return self._idle.pop()
+
+    def _check_fork(self):
+        # Connections opened before a gunicorn fork must never be shared with the child
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._size = 0
+
+    # ------------------- Public API -------------------
+    def acquire(self):
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._lock:
+            self._check_fork()
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn, _, last_used = self._take_idle()
+                    self.hits += 1
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    self.misses += 1
+                    break
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._lock.wait(remaining)
+
+        if conn is not None and time.monotonic() - last_used > self.health_check_interval:
+            if not self._is_healthy(conn):
+                self._discard(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+        if self.on_acquire is not None:
+            self.on_acquire(time.perf_counter() - started)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = True
+        except sqlite3.Error:
+            healthy = False
+
+        with self._lock:
+            if healthy and not self._closed:
+                self._idle.append((conn, threading.get_ident(), time.monotonic()))
+            else:
+                self._size -= 1
+                self._discard(conn)
+            self._lock.notify()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for conn, _, _ in self._idle:
+                self._size -= 1
+                self._discard(conn)
+            self._idle = []
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded
+            }
@@ -0,0 +1,377 @@
+"""Destination data and the pages rendered from it.
+
+Every destination lives in one row of the destinations table. The row holds
+its page names, hero text, and a JSON document with the card sections, map,
+call to action and reviews page headings. The reviews themselves are in the
+reviews table (reviews.py). The destination page and its reviews page
+are rendered from two Jinja templates (templates/destination.html and
+templates/destination_reviews.html), so adding a destination is an INSERT,
+not a new HTML file.
+
+    python destinations.py render --from-seed     # rewrite the committed pages in ../frontend
+    python destinations.py render --output dist   # render the live tables (reviews, image variants) elsewhere
+    python destinations.py load destinations.json # upsert content from a JSON file (--prune drops the rest)
+    python destinations.py check                  # exit 1 if the committed pages differ from the templates
+
+The rendered pages are committed under ../frontend, because the static host
+serves that directory as it is checked in. They are the render of
+destinations.json and reviews.json alone ('render --from-seed'); check
+renders the same way and compares. The app does not depend on them: it
+publishes its own render of the live tables over them.
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from image_pipeline import load_manifest, srcset
+from reviews import ReviewStore
+
+log = logging.getLogger('viva.destinations')
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SEED = os.path.join(BACKEND_DIR, 'destinations.json')
+TEMPLATES_DIR = os.path.join(BACKEND_DIR, 'templates')
+DEFAULT_OUTPUT = os.path.join(BACKEND_DIR, '..', 'frontend')
+
+# Where image_pipeline.py writes variants, relative to the frontend root
+OPTIMIZED_IMAGES = 'images/optimized/'
+PICTURE_TYPES = (('avif', 'image/avif'), ('webp', 'image/webp'))
+
+
+def load_seed(path=DEFAULT_SEED):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def long_date(iso):
+    # '2024-03-15' -> 'March 15, 2024'
+    day = date.fromisoformat(iso)
+    return f"{day:%B} {day.day}, {day.year}"
+
+
+class DestinationStore:
+    """The destinations table: one row per destination, content as JSON."""
+
+    COLUMNS = ('slug', 'name', 'title', 'page', 'reviews_page', 'summary', 'position', 'content')
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+
+    @staticmethod
+    def upsert(cur, destinations):
+        """Insert or update destinations (dicts shaped like destinations.json); returns the rows written.
+
+        Unchanged rows are not touched.
+        """
+        rows = []
+        for position, d in enumerate(destinations):
+            rows.append((d['slug'], d['name'], d['title'], d['page'], d['reviews_page'], d['summary'],
+                         d.get('position', position), json.dumps(d['content'], ensure_ascii=False, sort_keys=True),
+                         time.time()))
+        # The WHERE keeps no-op loads from bumping the table version (and so every page's ETag)
+        cur.executemany('''
+            INSERT INTO destinations (slug, name, title, page, reviews_page, summary, position, content, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(slug) DO UPDATE SET
+                name=excluded.name, title=excluded.title, page=excluded.page, reviews_page=excluded.reviews_page,
+                summary=excluded.summary, position=excluded.position, content=excluded.content,
+                updated_at=excluded.updated_at
+            WHERE name != excluded.name OR title != excluded.title OR page != excluded.page
+                OR reviews_page != excluded.reviews_page OR summary != excluded.summary
+                OR position != excluded.position OR content != excluded.content
+        ''', rows)
+        return cur.rowcount
+
+    def load(self, destinations, prune=False):
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = self.upsert(conn.cursor(), destinations)
+                if prune:
+                    slugs = [d['slug'] for d in destinations]
+                    changed += conn.execute(f"DELETE FROM destinations WHERE slug NOT IN "
+                                            f"({','.join('?' * len(slugs))})", slugs).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        return changed
+
+    @staticmethod
+    def _row(row):
+        d = {column: row[column] for column in DestinationStore.COLUMNS}
+        d['content'] = json.loads(d['content'])
+        d['updated_at'] = row['updated_at']
+        return d
+
+    def all(self):
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT * FROM destinations ORDER BY position, slug").fetchall()
+        finally:
+            conn.close()
+        return [self._row(row) for row in rows]
+
+    def exists(self, slug):
+        conn = self.get_connection()
+        try:
+            return conn.execute("SELECT 1 FROM destinations WHERE slug=?", (slug,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def get(self, slug):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT * FROM destinations WHERE slug=?", (slug,)).fetchone()
+        finally:
+            conn.close()
+        return self._row(row) if row else None
+
+
+class DestinationPages:
+    """Renders every destination's page, reviews page and <main> fragment.
+
+    The templates are compiled once per process. Pages are rendered together
+    whenever the destinations table version changes; refresh() checks at most
+    once every refresh_interval seconds. Rendered pages are published to
+    StaticAssets as in-memory HTML, so they get the same hashed asset URLs,
+    gzip variants, strong ETags and 304s as files on disk. The fragment for
+    each destination is published as fragments/<slug>.html, so a client that
+    already has the shared header, CSS and scripts can swap in another
+    destination's content with one small conditional GET.
+
+    Images found in image_pipeline.py's manifest are rendered as <picture>
+    elements with AVIF/WebP/JPEG srcsets; the rest stay plain lazy <img>s.
+
+    With a review_store, each reviews page carries the destination's rating
+    summary and its first page of highest rated reviews (reviews.js fetches the
+    rest), and a new review re-renders the pages like a content change does.
+    """
+
+    def __init__(self, store, table_versions=None, static_assets=None, templates_dir=TEMPLATES_DIR,
+                 image_manifest=None, refresh_interval=30.0, review_store=None):
+        self.store = store
+        self.review_store = review_store
+        self.table_versions = table_versions
+        self.static_assets = static_assets
+        self.refresh_interval = refresh_interval
+        self.images = load_manifest(image_manifest)['images'] if image_manifest else {}
+
+        self.env = Environment(loader=FileSystemLoader(templates_dir), autoescape=select_autoescape(['html']),
+                               trim_blocks=True, lstrip_blocks=True, auto_reload=False)
+        self.env.globals['picture_sources'] = self.picture_sources
+        self.env.filters['long_date'] = long_date
+
+        # filename -> HTML for the last render
+        self.pages = {}
+        self.version = None
+        self._lock = threading.Lock()
+        self._checked_at = None
+
+        self.renders = 0
+        self.last_render_seconds = None
+
+    def picture_sources(self, image):
+        entry = self.images.get(image)
+        if not entry:
+            return None
+        variants = entry['variants']
+        jpeg = variants.get('jpeg') or []
+        # Intrinsic size (for the aspect ratio before load) of the largest variant actually served
+        widest = max((v for fmt_variants in variants.values() for v in fmt_variants), key=lambda v: v['width'])
+        return {
+            'sources': [(mime, srcset(entry, fmt, OPTIMIZED_IMAGES)) for fmt, mime in PICTURE_TYPES
+                        if variants.get(fmt)],
+            # Browsers without AVIF/WebP get the middle JPEG rather than the full-size original
+            'src': OPTIMIZED_IMAGES + jpeg[len(jpeg) // 2]['file'] if jpeg else f"images/{image}",
+            'srcset': srcset(entry, 'jpeg', OPTIMIZED_IMAGES),
+            'width': widest['width'],
+            'height': widest['height'],
+        }
+
+    def render(self, destinations):
+        """Returns {filename: html} for every destination's page, reviews page and fragment."""
+        main = self.env.get_template('destination_main.html')
+        page = self.env.get_template('destination.html')
+        reviews = self.env.get_template('destination_reviews.html')
+        rendered = {}
+        for d in destinations:
+            fragment = main.render(d=d)
+            rendered[f"fragments/{d['slug']}.html"] = fragment
+            rendered[d['page']] = page.render(d=d, main=Markup(fragment))
+            labels = {tag['key']: tag['label'] for tag in d['content']['reviews']['tags']}
+            rendered[d['reviews_page']] = reviews.render(d=d, labels=labels, **self._reviews(d))
+        return rendered
+
+    def _reviews(self, d):
+        if self.review_store is None:
+            return {'summary': None, 'reviews': [], 'next_cursor': None}
+        items, next_cursor = self.review_store.page(d['slug'], sort='rating')
+        return {'summary': d['review_summary'], 'reviews': items, 'next_cursor': next_cursor}
+
+    def publish(self, version=None):
+        started = time.perf_counter()
+        destinations = self.store.all()
+        if self.review_store is not None:
+            summaries = self.review_store.summaries()
+            for d in destinations:
+                d['review_summary'] = summaries.get(d['slug']) or self.review_store.summary(d['slug'])
+        rendered = self.render(destinations)
+        if self.static_assets is not None:
+            mtimes = {}
+            for d in destinations:
+                for name in (d['page'], d['reviews_page'], f"fragments/{d['slug']}.html"):
+                    mtimes[name] = d['updated_at']
+                if d.get('review_summary') and d['review_summary']['updated_at']:
+                    mtimes[d['reviews_page']] = max(d['updated_at'], d['review_summary']['updated_at'])
+            for name in set(self.pages) - set(rendered):
+                self.static_assets.remove_rendered(name)
+            for name, html in rendered.items():
+                self.static_assets.add_rendered(name, html, mtimes[name])
+        self.pages = rendered
+        self.version = version
+        self.renders += 1
+        self.last_render_seconds = time.perf_counter() - started
+        log.info("Destination pages rendered", extra={
+            "destinations": len(destinations), "pages": len(rendered), "version": version,
+            "duration_ms": round(self.last_render_seconds * 1000, 1)})
+        return rendered
+
+    def refresh(self):
+        """Re-render if the destinations table changed; cheap enough to call on every page request."""
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return False
+        # One thread re-renders; the others keep serving the current pages
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                version = None
+                if self.table_versions:
+                    version = (self.table_versions.get('destinations'),
+                               self.table_versions.get('reviews') if self.review_store else None)
+                if version is not None and version == self.version:
+                    return False
+                self.publish(version)
+            except Exception as e:
+                log.warning("Error refreshing destination pages", extra={"error": str(e)})
+                return False
+            return True
+        finally:
+            self._lock.release()
+
+    def write(self, output_dir):
+        """Write every rendered page under output_dir (for hosting the frontend as static files)."""
+        written = 0
+        for name, html in self.pages.items():
+            path = os.path.join(output_dir, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = html.encode('utf-8')
+            try:
+                with open(path, 'rb') as f:
+                    # Leave unchanged pages alone so their mtimes (and a CDN's copies) stay put
+                    if f.read() == data:
+                        continue
+            except FileNotFoundError:
+                pass
+            tmp = f"{path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            written += 1
+        return written
+
+    def stale(self, output_dir):
+        """Names of rendered pages whose copy under output_dir is missing or differs, plus orphaned fragments."""
+        stale = []
+        for name, html in sorted(self.pages.items()):
+            try:
+                with open(os.path.join(output_dir, *name.split('/')), 'rb') as f:
+                    if f.read() == html.encode('utf-8'):
+                        continue
+            except FileNotFoundError:
+                pass
+            stale.append(name)
+        fragments = os.path.join(output_dir, 'fragments')
+        if os.path.isdir(fragments):
+            stale += sorted(f"fragments/{name}" for name in os.listdir(fragments)
+                            if name.endswith('.html') and f"fragments/{name}" not in self.pages)
+        return stale
+
+    def stats(self):
+        return {
+            'pages': len(self.pages),
+            'version': self.version,
+            'renders': self.renders,
+            'last_render_ms': round(self.last_render_seconds * 1000, 1) if self.last_render_seconds else None
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Viva Utalii destination pages')
+    parser.add_argument('command', choices=['render', 'load', 'check'])
+    parser.add_argument('source', nargs='?', default=DEFAULT_SEED, help='JSON file for load')
+    parser.add_argument('--db', default=os.getenv('DATABASE_URL', 'viva_utalii.db'))
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='frontend directory to render into')
+    parser.add_argument('--prune', action='store_true', help='load: delete destinations missing from the file')
+    parser.add_argument('--from-seed', action='store_true',
+                        help='render from a fresh database of the seed files, without image variants '
+                             '(how the committed pages are built; always on for check)')
+    args = parser.parse_args(argv)
+
+    from_seed = args.from_seed or args.command == 'check'
+    if from_seed:
+        # Local reviews and optimized images (both outside git) must not leak into the committed pages
+        workdir = tempfile.TemporaryDirectory(prefix='viva-pages-')
+        args.db = os.path.join(workdir.name, 'seed.db')
+
+    import migrations
+    migrations.migrate(args.db)
+
+    def connect():
+        conn = sqlite3.connect(args.db, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+    store = DestinationStore(connect)
+
+    if args.command == 'load':
+        changed = store.load(load_seed(args.source), prune=args.prune)
+        print(f"✅ {changed} destination row(s) changed")
+        return 0
+
+    manifest = None if from_seed else os.path.join(args.output, *OPTIMIZED_IMAGES.split('/'), 'manifest.json')
+    pages = DestinationPages(store, image_manifest=manifest, review_store=ReviewStore(connect))
+    pages.publish()
+
+    if args.command == 'check':
+        stale = pages.stale(args.output)
+        for name in stale:
+            print(f"❌ {name} does not match the templates")
+        if stale:
+            print("Run 'python destinations.py render --from-seed' and commit the result")
+            return 1
+        print(f"✅ {len(pages.pages)} committed page(s) match the templates")
+        return 0
+
+    written = pages.write(args.output)
+    print(f"✅ Rendered {len(pages.pages)} page(s) in {pages.last_render_seconds * 1000:.0f} ms; "
+          f"{written} written to {os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+from functools import wraps
+
+from flask import request, make_response
+
+from cache import LRUCache
+
+log = logging.getLogger('viva.http_cache')
+
+
+class TableVersions:
+    """Per-table write counters kept in SQLite and bumped by triggers.
+
+    Every worker sees the same counter, so a write on one worker invalidates
+    ETags and cached bodies everywhere without any cross-process messaging.
+    """
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+
+    def get(self, table):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT version FROM table_versions WHERE name=?", (table,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+
+class ResponseCache:
+    """ETag / Cache-Control / 304 handling for read-mostly GET endpoints."""
+
+    def __init__(self, table_versions, max_size=256, ttl=300):
+        self.table_versions = table_versions
+        self.bodies = LRUCache(max_size=max_size, ttl=ttl)
+        self.not_modified = 0
+
+    def _finish(self, response, etag, cache_control, vary):
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = cache_control
+        if vary:
+            response.vary.update(vary)
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def versioned(self, table, cache_control='public, max-age=60', vary=None):
+        """Cache a view's body per version of `table`.
+
+        A matching If-None-Match gets a 304 without running the view. Otherwise
+        the body is served from the in-process cache until the table changes,
+        along with the view's own X- headers (e.g. X-Next-Cursor).
+        Responses marked Cache-Control: no-store (e.g. fallbacks) are not cached.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+                try:
+                    version = self.table_versions.get(table)
+                except Exception as e:
+                    log.warning("Error reading table version", extra={"table": table, "error": str(e)})
+                    return view(*args, **kwargs)
+
+                etag = f"{table}-{version}-{hashlib.md5(request.full_path.encode()).hexdigest()[:8]}"
+                if request.if_none_match.contains_weak(etag):
+                    self.not_modified += 1
+                    response = make_response('', 304)
+                    response.set_etag(etag, weak=True)
+                    response.headers['Cache-Control'] = cache_control
+                    return response
+
+                key = (view.__name__, request.full_path, version)
+                cached = self.bodies.get(key)
+                if cached is not None:
+                    body, mimetype, headers = cached
+                    response = make_response(body)
+                    response.mimetype = mimetype
+                    response.headers.extend(headers)
+                    return self._finish(response, etag, cache_control, vary)
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or 'no-store' in response.headers.get('Cache-Control', ''):
+                    return response
+                headers = [(name, value) for name, value in response.headers if name.startswith('X-')]
+                self.bodies.set(key, (response.get_data(), response.mimetype, headers))
+                return self._finish(response, etag, cache_control, vary)
+            return wrapper
+        return decorator
+
+    def content_etag(self, cache_control='no-cache', vary=None):
+        """ETag derived from the response body, for small dynamic responses.
+
+        The view still runs every time; a matching client gets a 304 and no body.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                response = make_response(view(*args, **kwargs))
+                if request.method != 'GET' or response.status_code != 200 or response.is_streamed:
+                    return response
+                etag = hashlib.sha1(response.get_data()).hexdigest()[:16]
+                return self._finish(response, etag, cache_control, vary)
+            return wrapper
+        return decorator
+
+    def short_lived(self, seconds, cache_control=None, vary=None):
+        """Reuse a view's body for a few seconds, e.g. health endpoints hit by monitors."""
+        cache_control = cache_control or f'public, max-age={int(seconds)}'
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+                key = ('short_lived', view.__name__, request.full_path)
+                cached = self.bodies.get(key)
+                if cached is not None:
+                    body, mimetype = cached
+                    response = make_response(body)
+                    response.mimetype = mimetype
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    self.bodies.set(key, (response.get_data(), response.mimetype), ttl=seconds)
+                etag = hashlib.sha1(response.get_data()).hexdigest()[:16]
+                return self._finish(response, etag, cache_control, vary)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        stats = self.bodies.stats()
+        stats['not_modified'] = self.not_modified
+        return stats
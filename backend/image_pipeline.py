@@ -0,0 +1,220 @@
+"""Build-time responsive image variants for frontend/images.
+
+    python image_pipeline.py                      # ../frontend/images -> ../frontend/images/optimized
+    python image_pipeline.py --widths 400,800,1400 --formats avif,webp,jpeg --workers 4
+    python image_pipeline.py --force              # reprocess everything
+
+Every source is resized (never upscaled) to each width in every format and
+written as <name>-<width>.<content-hash>.<ext>, so variants can be served with
+a far-future immutable Cache-Control. manifest.json in the output directory
+maps each source to its variants for srcset, and records the source's
+SHA-256 and the settings used. Sources whose hash and settings are unchanged,
+and whose variants still exist, are skipped. Each remaining source is
+decoded once and encoded on a process pool. Variants no longer referenced by
+the manifest are deleted.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(BACKEND_DIR, '..', 'frontend', 'images')
+DEFAULT_OUTPUT = os.path.join(DEFAULT_SOURCE, 'optimized')
+MANIFEST_NAME = 'manifest.json'
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+DEFAULT_WIDTHS = (480, 960, 1600)
+# Format -> (file extension, Pillow save options); listed best-first for <picture> sources
+FORMATS = {
+    'avif': ('avif', {'quality': 50, 'speed': 6}),
+    'webp': ('webp', {'quality': 75, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+# Bump when encoding changes in a way the settings below don't capture
+PIPELINE_VERSION = 1
+
+
+class ImagePipelineError(Exception):
+    pass
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def settings_key(widths, formats):
+    return f"v{PIPELINE_VERSION}:" + ','.join(map(str, widths)) + ':' + ','.join(
+        f"{name}{sorted(FORMATS[name][1].items())}" for name in formats)
+
+
+def target_widths(source_width, widths):
+    # Never upscale; a source narrower than the largest width also gets a variant at its own width
+    chosen = [w for w in widths if w < source_width]
+    if not chosen or source_width <= max(widths):
+        chosen.append(min(source_width, max(widths)))
+    return sorted(set(chosen))
+
+
+def process_image(source_path, name, output_dir, widths, formats):
+    """Encode every variant of one source; runs in a pool worker. Returns the manifest entry."""
+    with Image.open(source_path) as opened:
+        # Apply EXIF rotation, then drop all metadata by re-encoding from pixels only
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    width, height = image.size
+    stem = os.path.splitext(name)[0]
+
+    variants = {fmt: [] for fmt in formats}
+    for target in target_widths(width, widths):
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            extension, options = FORMATS[fmt]
+            frame = resized.convert('RGB') if fmt == 'jpeg' and resized.mode != 'RGB' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, format=fmt.upper(), **options)
+            data = buffer.getvalue()
+            filename = f"{stem}-{target}.{hashlib.sha256(data).hexdigest()[:10]}.{extension}"
+            path = os.path.join(output_dir, filename)
+            if not os.path.exists(path):
+                tmp = f"{path}.tmp{os.getpid()}"
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            variants[fmt].append({'width': target, 'height': resized.size[1], 'file': filename,
+                                  'bytes': len(data)})
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'images': {}}
+
+
+def write_manifest(path, manifest):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def srcset(entry, fmt, prefix=''):
+    """'a-480.<hash>.webp 480w, a-960.<hash>.webp 960w' for one format of a manifest entry."""
+    return ', '.join(f"{prefix}{v['file']} {v['width']}w" for v in entry['variants'].get(fmt, []))
+
+
+def build(source_dir=DEFAULT_SOURCE, output_dir=DEFAULT_OUTPUT, widths=DEFAULT_WIDTHS, formats=tuple(FORMATS),
+          workers=None, force=False):
+    """Bring output_dir up to date with source_dir; returns a summary dict."""
+    if Image is None:
+        raise ImagePipelineError("Pillow is required: pip install Pillow")
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        raise ImagePipelineError(f"Unknown format(s): {', '.join(unknown)}")
+    widths = sorted(set(int(w) for w in widths))
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    previous = manifest.get('images', {})
+    settings = settings_key(widths, formats)
+
+    sources = sorted(f for f in os.listdir(source_dir)
+                     if f.lower().endswith(SOURCE_EXTENSIONS) and os.path.isfile(os.path.join(source_dir, f)))
+    images, pending = {}, {}
+    for name in sources:
+        digest = file_hash(os.path.join(source_dir, name))
+        entry = previous.get(name)
+        if not force and entry and entry.get('source_hash') == digest and entry.get('settings') == settings \
+                and all(os.path.exists(os.path.join(output_dir, v['file']))
+                        for fmt_variants in entry['variants'].values() for v in fmt_variants):
+            images[name] = entry
+        else:
+            pending[name] = digest
+
+    failed = {}
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_image, os.path.join(source_dir, name), name, output_dir, widths,
+                                   formats): name for name in pending}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    failed[name] = str(e)
+                    if name in previous:
+                        images[name] = previous[name]
+                    continue
+                images[name] = {**entry, 'source_hash': pending[name], 'settings': settings}
+
+    manifest = {'formats': list(formats), 'widths': widths, 'images': dict(sorted(images.items()))}
+    write_manifest(manifest_path, manifest)
+
+    # Anything in output_dir the manifest no longer references is a stale variant
+    referenced = {v['file'] for entry in images.values() for fmt_variants in entry['variants'].values()
+                  for v in fmt_variants}
+    removed = 0
+    for filename in os.listdir(output_dir):
+        if filename != MANIFEST_NAME and filename not in referenced:
+            os.remove(os.path.join(output_dir, filename))
+            removed += 1
+
+    return {
+        'sources': len(sources),
+        'processed': len(pending) - len(failed),
+        'skipped': len(sources) - len(pending),
+        'failed': failed,
+        'removed': removed,
+        'source_bytes': sum(os.path.getsize(os.path.join(source_dir, name)) for name in sources),
+        'output_bytes': sum(v['bytes'] for entry in images.values() for fmt_variants in entry['variants'].values()
+                            for v in fmt_variants),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Responsive image variants and srcset manifest')
+    parser.add_argument('--source', default=DEFAULT_SOURCE)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--widths', default=','.join(map(str, DEFAULT_WIDTHS)))
+    parser.add_argument('--formats', default=','.join(FORMATS), help=f"any of: {', '.join(FORMATS)}")
+    parser.add_argument('--workers', type=int, help='pool processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='reprocess unchanged sources too')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        summary = build(args.source, args.output, [int(w) for w in args.widths.split(',')],
+                        [f.strip() for f in args.formats.split(',') if f.strip()], args.workers, args.force)
+    except (ImagePipelineError, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    for name, error in summary['failed'].items():
+        print(f"⚠️ {name}: {error}", file=sys.stderr)
+    print(f"✅ {summary['processed']} processed, {summary['skipped']} unchanged, {summary['removed']} stale removed "
+          f"in {time.perf_counter() - started:.1f}s ({summary['source_bytes'] / 1e6:.1f} MB of sources -> "
+          f"{summary['output_bytes'] / 1e6:.1f} MB across all variants)", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
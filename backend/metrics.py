@@ -0,0 +1,207 @@
+import bisect
+import math
+import threading
+import time
+
+from flask import g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers sub-millisecond cache hits up to the 15s Daraja deadline
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)    # last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter read at scrape time from an existing stats() source.
+
+    fn returns a number, or a dict mapping a label value (or tuple of label
+    values) to a number. Nothing is recorded on the request path.
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), type='gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self.type = type
+
+    def render(self):
+        try:
+            result = self.fn()
+        except Exception:
+            return []
+        lines = self._header()
+        if isinstance(result, dict):
+            for values, value in result.items():
+                values = values if isinstance(values, tuple) else (values,)
+                lines.append(f"{self.name}{_labels(self.labelnames, values)} {_number(value)}")
+        else:
+            lines.append(f"{self.name} {_number(result)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, fn, labelnames, 'gauge'))
+
+    def counter_callback(self, name, documentation, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, fn, labelnames, 'counter'))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def init_request_metrics(app, registry, skip_paths=('/metrics',)):
+    """Per-route latency histogram and request counter.
+
+    Routes are labelled by their URL rule (e.g. /api/mpesa/status/<checkout_id>),
+    not the raw path, so label cardinality stays bounded.
+    """
+    latency = registry.histogram('viva_http_request_duration_seconds',
+                                 'HTTP request latency by route', ('method', 'route', 'status'))
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None and request.path not in skip_paths:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            latency.labels(request.method, route, str(response.status_code)).observe(
+                time.perf_counter() - started)
+        return response
+
+    return latency
@@ -0,0 +1,645 @@
+"""Versioned schema migrations for the SQLite database.
+
+Run once per deploy (e.g. as the Render build/pre-deploy command):
+
+    python migrations.py migrate
+    python migrations.py status
+
+Workers only call ensure_schema(), which reads schema_version and returns when
+the database is current. If it is behind and auto-migration is on (the
+default, for local development), the pending migrations are applied under an
+exclusive file lock so concurrent workers don't race. Every migration also runs
+inside BEGIN IMMEDIATE and re-checks the version, so it is applied exactly once
+even where file locks are unavailable.
+
+To change the schema, append a migration to MIGRATIONS; never edit one that
+has shipped.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: rely on SQLite's own write lock
+    fcntl = None
+
+log = logging.getLogger('viva.migrations')
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+# ------------------- Migrations -------------------
+# Each migration carries its own DDL, so replaying it always builds the schema it shipped with. The
+# helpers below belong to the migrations that call them: later schema work goes in a new migration
+# (with new helpers if needed), not in edits to these or to the stores' query code.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load_json(name):
+    with open(os.path.join(BACKEND_DIR, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _version_triggers(cur, tables):
+    # Write counters that drive ETags for cached read endpoints (read by http_cache.TableVersions)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in tables:
+        cur.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cur.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
+
+
+def m001_core_tables(cur):
+    # IF NOT EXISTS so databases created by the old init_db() are adopted as-is
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS deals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destination TEXT NOT NULL,
+            discount TEXT NOT NULL
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            destination_id TEXT NOT NULL,
+            dest_name TEXT NOT NULL,
+            arrive_date TEXT NOT NULL,
+            depart_date TEXT NOT NULL,
+            travelers INTEGER NOT NULL,
+            acc_tier TEXT NOT NULL,
+            total_cost INTEGER NOT NULL,
+            deposit_amount INTEGER NOT NULL,
+            paid_deposit BOOLEAN DEFAULT FALSE,
+            mpesa_phone TEXT,
+            mpesa_reference TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+
+def m002_service_tables(cur):
+    _version_triggers(cur, ['deals'])
+
+    # Durable newsletter send queue
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS newsletter_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT UNIQUE NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS newsletter_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            sent_at REAL,
+            UNIQUE (job_id, email),
+            FOREIGN KEY (job_id) REFERENCES newsletter_jobs (id)
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_newsletter_deliveries_due "
+                "ON newsletter_deliveries (status, next_attempt_at)")
+
+    # Indexes for per-user and per-status booking listings (a legacy bookings table gets them in m009)
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(bookings)").fetchall()}
+    if 'created_at' in columns:
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user_created ON bookings (user_id, created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_bookings_status_created ON bookings (status, created_at)")
+
+    # STK push requests, with per-status counts kept by triggers
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stk_requests (
+            checkout_request_id TEXT PRIMARY KEY,
+            merchant_request_id TEXT,
+            phone TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            result_code INTEGER,
+            result_desc TEXT,
+            mpesa_receipt TEXT,
+            timestamp TEXT NOT NULL,
+            updated_at TEXT
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stk_requests_status_ts ON stk_requests (status, timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stk_requests_timestamp ON stk_requests (timestamp)")
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stk_request_counts (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_stk_requests_insert AFTER INSERT ON stk_requests
+        BEGIN
+            INSERT OR IGNORE INTO stk_request_counts (status, count) VALUES (NEW.status, 0);
+            UPDATE stk_request_counts SET count = count + 1 WHERE status = NEW.status;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_stk_requests_status AFTER UPDATE OF status ON stk_requests
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE stk_request_counts SET count = count - 1 WHERE status = OLD.status;
+            INSERT OR IGNORE INTO stk_request_counts (status, count) VALUES (NEW.status, 0);
+            UPDATE stk_request_counts SET count = count + 1 WHERE status = NEW.status;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_stk_requests_delete AFTER DELETE ON stk_requests
+        BEGIN
+            UPDATE stk_request_counts SET count = count - 1 WHERE status = OLD.status;
+        END
+    ''')
+
+    # Shared bearer token store
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS auth_tokens (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires ON auth_tokens (expires_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens (user_id)")
+
+
+def m003_seed_data(cur):
+    if cur.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+        cur.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                    ("John Doe", "john@example.com", "password123"))
+        log.info("Test user created", extra={"email": "john@example.com"})
+    if cur.execute("SELECT COUNT(*) FROM deals").fetchone()[0] == 0:
+        cur.executemany("INSERT INTO deals (destination, discount) VALUES (?, ?)", [
+            ("Maasai Mara", "15% off for newsletter subscribers"),
+            ("Zanzibar", "All-inclusive package discount"),
+            ("Diani Beach", "30% OFF flash sale")
+        ])
+        log.info("Sample deals added")
+
+
+def m004_mpesa_callback_journal(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS mpesa_callbacks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            checkout_request_id TEXT UNIQUE NOT NULL,
+            result_code INTEGER NOT NULL,
+            result_desc TEXT,
+            mpesa_receipt TEXT,
+            received_at REAL NOT NULL,
+            applied_at REAL
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_mpesa_callbacks_pending "
+                "ON mpesa_callbacks (id) WHERE applied_at IS NULL")
+
+
+def m005_stk_reconcile_columns(cur):
+    # When the reconciler may next query Daraja about a pending request, and how often it has
+    cur.execute("ALTER TABLE stk_requests ADD COLUMN next_check_at REAL")
+    cur.execute("ALTER TABLE stk_requests ADD COLUMN check_attempts INTEGER NOT NULL DEFAULT 0")
+
+
+def m006_destinations(cur):
+    # Content for the templated destination pages, seeded from destinations.json
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS destinations (
+            slug TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            title TEXT NOT NULL,
+            page TEXT NOT NULL UNIQUE,
+            reviews_page TEXT NOT NULL UNIQUE,
+            summary TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            content TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    _version_triggers(cur, ['destinations'])
+    cur.executemany(
+        "INSERT OR IGNORE INTO destinations (slug, name, title, page, reviews_page, summary, position, content, "
+        "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(d['slug'], d['name'], d['title'], d['page'], d['reviews_page'], d['summary'], d.get('position', position),
+          json.dumps(d['content'], ensure_ascii=False, sort_keys=True), time.time())
+         for position, d in enumerate(_load_json('destinations.json'))])
+
+
+def m007_reviews(cur):
+    # Reviews move out of the destination content into their own table, with trigger-kept aggregates
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destination TEXT NOT NULL,
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            rating INTEGER NOT NULL CHECK (rating BETWEEN 1 AND 5),
+            text TEXT NOT NULL,
+            tags TEXT NOT NULL DEFAULT '[]',
+            source TEXT NOT NULL,
+            helpful INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    # One index per listing order, so every page is a range scan within one destination
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reviews_destination_created "
+                "ON reviews (destination, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reviews_destination_rating "
+                "ON reviews (destination, rating, created_at, id)")
+    # One review per signed-in user per destination (imported reviews have no user)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_destination_user "
+                "ON reviews (destination, user_id)")
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS review_stats (
+            destination TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            stars_1 INTEGER NOT NULL DEFAULT 0,
+            stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0,
+            stars_4 INTEGER NOT NULL DEFAULT 0,
+            stars_5 INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    now = "(julianday('now') - 2440587.5) * 86400.0"
+
+    def apply(row, sign):
+        stars = ', '.join(f"stars_{n} = stars_{n} {sign} ({row}.rating = {n})" for n in range(1, 6))
+        return (f"count = count {sign} 1, rating_sum = rating_sum {sign} {row}.rating, {stars}, "
+                f"updated_at = {now}")
+
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_insert AFTER INSERT ON reviews
+        BEGIN
+            INSERT OR IGNORE INTO review_stats (destination, updated_at) VALUES (NEW.destination, {now});
+            UPDATE review_stats SET {apply('NEW', '+')} WHERE destination = NEW.destination;
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_delete AFTER DELETE ON reviews
+        BEGIN
+            UPDATE review_stats SET {apply('OLD', '-')} WHERE destination = OLD.destination;
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_update AFTER UPDATE OF destination, rating ON reviews
+        BEGIN
+            UPDATE review_stats SET {apply('OLD', '-')} WHERE destination = OLD.destination;
+            INSERT OR IGNORE INTO review_stats (destination, updated_at) VALUES (NEW.destination, {now});
+            UPDATE review_stats SET {apply('NEW', '+')} WHERE destination = NEW.destination;
+        END
+    ''')
+    _version_triggers(cur, ['reviews'])
+
+    cur.executemany(
+        "INSERT INTO reviews (destination, name, rating, text, tags, source, helpful, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(slug, r['name'], r['rating'], r['text'], json.dumps(r.get('tags', [])), r.get('source', 'Viva Utalii'),
+          r.get('helpful', 0), r['date'])
+         for slug, items in _load_json('reviews.json').items() for r in items])
+    for row in cur.execute("SELECT slug, content FROM destinations").fetchall():
+        content = json.loads(row['content'])
+        reviews = content.get('reviews', {})
+        if not any(key in reviews for key in ('items', 'rating', 'count', 'histogram')):
+            continue
+        for key in ('items', 'rating', 'count', 'histogram'):
+            reviews.pop(key, None)
+        cur.execute("UPDATE destinations SET content=? WHERE slug=?",
+                    (json.dumps(content, ensure_ascii=False, sort_keys=True), row['slug']))
+
+
+def _m008_json_text(row, keys):
+    key_list = ', '.join(f"'{key}'" for key in keys)
+    return (f"(SELECT ifnull(group_concat(value, ' '), '') FROM json_tree({row}.content) "
+            f"WHERE type = 'text' AND key IN ({key_list}))")
+
+
+# kind: (source table, rowid code, columns whose update re-indexes the row, index columns as SQL over row {r});
+# search.py reads the same rowid codes
+M008_SEARCH_DOCUMENTS = {
+    'destination': ('destinations', 1, None, (
+        "{r}.slug",
+        "{r}.slug",
+        "CASE WHEN {r}.title = {r}.name THEN {r}.name ELSE {r}.name || ' ' || {r}.title END",
+        _m008_json_text('{r}', ('heading', 'title', 'label')),
+        "{r}.summary || ' ' || " + _m008_json_text('{r}', ('text', 'alt', 'cta', 'subheading')),
+    )),
+    'deal': ('deals', 2, None, (
+        "{r}.id",
+        "NULL",
+        "{r}.destination",
+        "''",
+        "{r}.discount",
+    )),
+    'review': ('reviews', 3, ('destination', 'text', 'tags'), (
+        "{r}.id",
+        "{r}.destination",
+        "''",
+        "(SELECT ifnull(group_concat(value, ' '), '') FROM json_each({r}.tags))",
+        "{r}.text",
+    )),
+}
+
+
+def m008_search_index(cur):
+    # FTS5 index over destinations, deals and reviews, kept current by triggers
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            kind UNINDEXED, ref UNINDEXED, destination UNINDEXED, title, keywords, body,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4'
+        )
+    ''')
+    cur.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('search_index', 0)")
+    bump = "UPDATE table_versions SET version = version + 1 WHERE name = 'search_index';"
+
+    def document(kind, row):
+        _, code, _, columns = M008_SEARCH_DOCUMENTS[kind]
+        values = [f"{row}.rowid * 4 + {code}", f"'{kind}'"] + [column.format(r=row) for column in columns]
+        return (f"INSERT INTO search_index (rowid, kind, ref, destination, title, keywords, body) "
+                f"SELECT {', '.join(values)}")
+
+    for kind, (table, code, watched, _) in M008_SEARCH_DOCUMENTS.items():
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert AFTER INSERT ON {table}
+            BEGIN
+                {document(kind, 'NEW')};
+                {bump}
+            END
+        ''')
+        of = f" OF {', '.join(watched)}" if watched else ''
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update AFTER UPDATE{of} ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = OLD.rowid * 4 + {code};
+                {document(kind, 'NEW')};
+                {bump}
+            END
+        ''')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = OLD.rowid * 4 + {code};
+                {bump}
+            END
+        ''')
+        # Index what is already there
+        cur.execute(f"{document(kind, 'r')} FROM {table} AS r")
+    cur.execute(bump)
+
+
+def m009_rebuild_legacy_bookings(cur):
+    # Databases from before the booking flow have bookings (id, user_id, destination, date, status, fee_paid),
+    # which m001 adopted as-is. Rebuild that table in the current shape, keeping every booking.
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(bookings)").fetchall()}
+    if 'created_at' not in columns:
+        cur.execute('''
+            CREATE TABLE bookings_rebuilt (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                destination_id TEXT NOT NULL,
+                dest_name TEXT NOT NULL,
+                arrive_date TEXT NOT NULL,
+                depart_date TEXT NOT NULL,
+                travelers INTEGER NOT NULL,
+                acc_tier TEXT NOT NULL,
+                total_cost INTEGER NOT NULL,
+                deposit_amount INTEGER NOT NULL,
+                paid_deposit BOOLEAN DEFAULT FALSE,
+                mpesa_phone TEXT,
+                mpesa_reference TEXT,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        # Trip costs were never recorded, so they come across as 0; statuses were capitalised ('Pending')
+        slug = ("COALESCE((SELECT slug FROM destinations d WHERE lower(d.name) = lower(old.destination)), "
+                "lower(old.destination))")
+        cur.execute(f'''
+            INSERT INTO bookings_rebuilt (id, user_id, destination_id, dest_name, arrive_date, depart_date, travelers,
+                                          acc_tier, total_cost, deposit_amount, paid_deposit, status)
+            SELECT old.id, old.user_id, {slug}, old.destination, COALESCE(old.date, ''), COALESCE(old.date, ''), 1,
+                   '', 0, 0, COALESCE(old.fee_paid, FALSE), lower(COALESCE(old.status, 'pending'))
+            FROM bookings old
+        ''')
+        # The old travel_history table held completed trips; they become completed bookings
+        if cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='travel_history'").fetchone():
+            cur.execute(f'''
+                INSERT INTO bookings_rebuilt (user_id, destination_id, dest_name, arrive_date, depart_date, travelers,
+                                              acc_tier, total_cost, deposit_amount, paid_deposit, status)
+                SELECT old.user_id, {slug}, old.destination, COALESCE(old.start_date, ''),
+                       COALESCE(old.end_date, old.start_date, ''), 1, '', 0, 0, TRUE,
+                       lower(COALESCE(old.status, 'completed'))
+                FROM travel_history old
+            ''')
+        cur.execute("DROP TABLE bookings")
+        cur.execute("ALTER TABLE bookings_rebuilt RENAME TO bookings")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user_created ON bookings (user_id, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_bookings_status_created ON bookings (status, created_at)")
+
+
+def m010_stk_request_ids(cur):
+    # STK pushes are answered before Daraja is called; the client follows them by this ID
+    cur.execute("ALTER TABLE stk_requests ADD COLUMN request_id TEXT")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_stk_requests_request_id ON stk_requests (request_id)")
+
+MIGRATIONS = [
+    (1, 'core tables', m001_core_tables),
+    (2, 'service tables and indexes', m002_service_tables),
+    (3, 'seed test user and sample deals', m003_seed_data),
+    (4, 'mpesa callback journal', m004_mpesa_callback_journal),
+    (5, 'stk request reconciliation columns', m005_stk_reconcile_columns),
+    (6, 'destinations', m006_destinations),
+    (7, 'reviews and rating aggregates', m007_reviews),
+    (8, 'full-text search index', m008_search_index),
+    (9, 'rebuild legacy bookings table', m009_rebuild_legacy_bookings),
+    (10, 'stk request ids', m010_stk_request_ids),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ------------------- Runner -------------------
+def _connect(database, busy_timeout_ms=30000):
+    conn = sqlite3.connect(database, timeout=busy_timeout_ms / 1000.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if database != ':memory:':
+        conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at REAL NOT NULL
+        )
+    ''')
+
+
+def current_version(conn):
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        # No schema_version table yet
+        return 0
+    return row[0] or 0
+
+
+def status_version(database):
+    conn = _connect(database)
+    try:
+        return current_version(conn)
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def migration_lock(database):
+    if fcntl is None or database == ':memory:':
+        yield
+        return
+    with open(f"{database}.migrate.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def migrate(database, target=None):
+    """Apply pending migrations up to target (default: latest); returns the versions applied."""
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    with migration_lock(database):
+        conn = _connect(database)
+        try:
+            _ensure_version_table(conn)
+            for version, name, apply in MIGRATIONS:
+                if version > target:
+                    break
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if current_version(conn) >= version:
+                        conn.execute("ROLLBACK")
+                        continue
+                    started = time.perf_counter()
+                    apply(conn.cursor())
+                    conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                                 (version, name, time.time()))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                applied.append(version)
+                log.info("Applied migration", extra={
+                    "version": version, "migration": name,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2)})
+        finally:
+            conn.close()
+    return applied
+
+
+def ensure_schema(database, get_connection=None, auto_migrate=True):
+    """Cheap per-worker check; migrates only when the database is behind."""
+    conn = get_connection() if get_connection else _connect(database)
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    if version >= LATEST_VERSION:
+        return version
+    if not auto_migrate:
+        raise SchemaOutOfDate(f"Database schema is at version {version}, expected {LATEST_VERSION}; "
+                              f"run `python migrations.py migrate`")
+    migrate(database)
+    return LATEST_VERSION
+
+
+def status(database):
+    conn = _connect(database)
+    try:
+        try:
+            rows = conn.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+    finally:
+        conn.close()
+    applied = {row['version']: row for row in rows}
+    return [{
+        'version': version,
+        'name': name,
+        'applied_at': applied[version]['applied_at'] if version in applied else None
+    } for version, name, _ in MIGRATIONS]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Viva Utalii schema migrations')
+    parser.add_argument('command', nargs='?', choices=['migrate', 'status', 'check'], default='migrate')
+    parser.add_argument('--db', default=os.getenv('DATABASE_URL', 'viva_utalii.db'))
+    parser.add_argument('--target', type=int, help='migrate up to this version only')
+    args = parser.parse_args(argv)
+
+    if args.command == 'migrate':
+        applied = migrate(args.db, args.target)
+        print(f"✅ Applied {len(applied)} migration(s); schema is at version "
+              f"{applied[-1] if applied else status_version(args.db)}")
+        return 0
+
+    rows = status(args.db)
+    if args.command == 'status':
+        for row in rows:
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['applied_at'])) \
+                if row['applied_at'] else 'pending'
+            print(f"{row['version']:>4}  {row['name']:<40} {when}")
+        return 0
+
+    # check: non-zero exit when migrations are pending (for deploy scripts)
+    pending = [row['version'] for row in rows if row['applied_at'] is None]
+    if pending:
+        print(f"❌ Pending migrations: {', '.join(map(str, pending))}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Local stand-in for the Safaricom Daraja sandbox.
+
+Run it and point the backend at it:
+
+    python mock_daraja.py --port 8089
+    MPESA_BASE_URL=http://127.0.0.1:8089 python app.py
+
+Or start it in-process with start_mock_server() from a script or benchmark.
+
+STK Query (/mpesa/stkpushquery/v1/query) answers for CheckoutRequestIDs the
+mock issued or registered with state.set_result(id, result_code, desc);
+state.set_processing(id) makes it report "being processed" like Daraja does
+before the customer has responded. Everything else defaults to
+default_result_code.
+"""
+import argparse
+import base64
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockDarajaState:
+    def __init__(self, consumer_key=None, consumer_secret=None, token_ttl=3599, latency=0.0,
+                 default_result_code=0):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.token_ttl = token_ttl
+        self.latency = latency
+        self.default_result_code = default_result_code
+        self.fail_oauth = False
+        self.tokens = set()
+        self.checkouts = {}    # CheckoutRequestID -> (ResultCode, ResultDesc), or None while processing
+        self.lock = threading.Lock()
+        self.counts = {'oauth': 0, 'stkpush': 0, 'stkquery': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def set_result(self, checkout_id, result_code, result_desc=None):
+        with self.lock:
+            self.checkouts[checkout_id] = (result_code, result_desc or (
+                'The service request is processed successfully.' if result_code == 0 else 'Request cancelled by user'))
+
+    def set_processing(self, checkout_id):
+        with self.lock:
+            self.checkouts[checkout_id] = None
+
+
+class MockDarajaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send_json(self, status, body):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _authorized(self):
+        auth = self.headers.get('Authorization', '')
+        return auth.startswith('Bearer ') and auth[7:] in self.state.tokens
+
+    def do_GET(self):
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.path.startswith('/oauth/v1/generate'):
+            self.state.count('oauth')
+            if self.state.fail_oauth:
+                return self._send_json(500, {'errorMessage': 'Mock OAuth failure'})
+            if self.state.consumer_key is not None:
+                expected = base64.b64encode(
+                    f"{self.state.consumer_key}:{self.state.consumer_secret}".encode()).decode()
+                if self.headers.get('Authorization') != f"Basic {expected}":
+                    return self._send_json(400, {'errorMessage': 'Invalid credentials'})
+            token = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.tokens.add(token)
+            return self._send_json(200, {'access_token': token, 'expires_in': str(self.state.token_ttl)})
+        self._send_json(404, {'errorMessage': 'Not found'})
+
+    def do_POST(self):
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        body = self._read_json()
+        if self.path.startswith('/mpesa/stkpush/v1/processrequest'):
+            self.state.count('stkpush')
+            if not self._authorized():
+                return self._send_json(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+            if not body.get('PhoneNumber') or not body.get('Amount'):
+                return self._send_json(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request'})
+            checkout_id = f"ws_CO_{uuid.uuid4().hex[:20]}"
+            self.state.set_result(checkout_id, self.state.default_result_code)
+            return self._send_json(200, {
+                'MerchantRequestID': f"mock-{uuid.uuid4().hex[:12]}",
+                'CheckoutRequestID': checkout_id,
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': 'Success. Request accepted for processing'
+            })
+        if self.path.startswith('/mpesa/stkpushquery/v1/query'):
+            self.state.count('stkquery')
+            if not self._authorized():
+                return self._send_json(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+            checkout_id = body.get('CheckoutRequestID')
+            with self.state.lock:
+                known = checkout_id in self.state.checkouts
+                result = self.state.checkouts.get(checkout_id)
+            if not checkout_id or not body.get('Password'):
+                return self._send_json(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request'})
+            if known and result is None:
+                return self._send_json(500, {'errorCode': '500.001.1001',
+                                             'errorMessage': 'The transaction is being processed'})
+            result_code, result_desc = result if known else (
+                self.state.default_result_code, 'The service request is processed successfully.')
+            return self._send_json(200, {
+                'ResponseCode': '0',
+                'ResponseDescription': 'The service request has been accepted successsfully',
+                'MerchantRequestID': f"mock-{uuid.uuid4().hex[:12]}",
+                'CheckoutRequestID': checkout_id,
+                'ResultCode': str(result_code),
+                'ResultDesc': result_desc
+            })
+        self._send_json(404, {'errorMessage': 'Not found'})
+
+
+def start_mock_server(host='127.0.0.1', port=0, **state_kwargs):
+    """Start the mock in a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), MockDarajaHandler)
+    server.daemon_threads = True
+    server.state = MockDarajaState(**state_kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock Daraja sandbox')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to sleep per request')
+    parser.add_argument('--token-ttl', type=int, default=3599)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), MockDarajaHandler)
+    server.state = MockDarajaState(token_ttl=args.token_ttl, latency=args.latency)
+    print(f"🧪 Mock Daraja listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
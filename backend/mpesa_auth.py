@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+
+import requests
+
+log = logging.getLogger('viva.mpesa.auth')
+
+
+class TokenManager:
+    """Caches the Daraja OAuth token until shortly before it expires.
+
+    - Inside the refresh window the cached token is still returned while a
+      single background thread fetches the next one.
+    - When there is no usable token, concurrent callers share one refresh
+      (single-flight) instead of each hitting the OAuth endpoint.
+    - A failed refresh keeps serving the old token while it is still valid and
+      backs off before trying again, so an OAuth outage doesn't stall every push.
+    """
+
+    def __init__(self, oauth_url, consumer_key, consumer_secret, session=None, timeout=10,
+                 refresh_margin=300, default_ttl=3599, failure_backoff=5, on_request=None):
+        self.oauth_url = oauth_url
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.failure_backoff = failure_backoff
+        # on_request(path, outcome, seconds), same hook as MpesaClient
+        self.on_request = on_request
+
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._last_failure = 0.0
+        self._refresh_lock = threading.Lock()
+
+        self.hits = 0
+        self.refreshes = 0
+        self.background_refreshes = 0
+        self.failures = 0
+
+    # ------------------- Fetching -------------------
+    def _fetch(self):
+        started = time.perf_counter()
+        try:
+            r = self.session.get(self.oauth_url, auth=(self.consumer_key, self.consumer_secret),
+                                 timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self._observe(type(e).__name__, started)
+            raise
+        self._observe(str(r.status_code), started)
+        r.raise_for_status()
+        body = r.json()
+        token = body.get("access_token")
+        if not token:
+            raise ValueError("OAuth response did not contain an access_token")
+        try:
+            ttl = int(body.get("expires_in", self.default_ttl))
+        except (TypeError, ValueError):
+            ttl = self.default_ttl
+        return token, ttl
+
+    def _observe(self, outcome, started):
+        if self.on_request is not None:
+            self.on_request('/oauth/v1/generate', outcome, time.perf_counter() - started)
+
+    def _refresh(self):
+        # Caller must hold _refresh_lock
+        try:
+            token, ttl = self._fetch()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.failures += 1
+            self._last_failure = time.monotonic()
+            log.warning("Error getting access token", extra={"error": str(e)})
+            return False
+
+        now = time.monotonic()
+        margin = min(self.refresh_margin, ttl / 2)
+        self._token = token
+        self._expires_at = now + ttl
+        self._refresh_at = now + ttl - margin
+        self.refreshes += 1
+        return True
+
+    def _background_refresh(self):
+        try:
+            self.background_refreshes += 1
+            self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _in_backoff(self, now):
+        return now - self._last_failure < self.failure_backoff
+
+    # ------------------- Public API -------------------
+    def get_token(self):
+        now = time.monotonic()
+        token = self._token
+
+        if token and now < self._refresh_at:
+            self.hits += 1
+            return token
+
+        if token and now < self._expires_at:
+            # Still valid: serve it and refresh ahead in the background (at most one at a time)
+            if not self._in_backoff(now) and self._refresh_lock.acquire(blocking=False):
+                threading.Thread(target=self._background_refresh, daemon=True).start()
+            self.hits += 1
+            return token
+
+        if self._in_backoff(now):
+            return None
+
+        with self._refresh_lock:
+            # Another caller may have refreshed while we were waiting
+            if self._token and time.monotonic() < self._expires_at:
+                self.hits += 1
+                return self._token
+            if self._in_backoff(time.monotonic()):
+                return None
+            if self._refresh():
+                return self._token
+            return None
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after Daraja rejects it with a 401."""
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'has_token': self._token is not None and now < self._expires_at,
+            'expires_in': max(0, int(self._expires_at - now)),
+            'hits': self.hits,
+            'refreshes': self.refreshes,
+            'background_refreshes': self.background_refreshes,
+            'failures': self.failures
+        }
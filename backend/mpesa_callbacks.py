@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger('viva.mpesa.callbacks')
+
+
+class InvalidCallback(ValueError):
+    pass
+
+
+def parse_callback(data):
+    """Validate a Daraja STK callback body; returns (checkout_id, result_code, result_desc, receipt)."""
+    if not isinstance(data, dict) or not isinstance(data.get("Body"), dict) \
+            or not isinstance(data["Body"].get("stkCallback"), dict):
+        raise InvalidCallback("Invalid callback format")
+    callback = data["Body"]["stkCallback"]
+
+    checkout_id = callback.get("CheckoutRequestID")
+    if not checkout_id or not isinstance(checkout_id, str):
+        raise InvalidCallback("Missing CheckoutRequestID")
+    try:
+        result_code = int(callback.get("ResultCode"))
+    except (TypeError, ValueError):
+        raise InvalidCallback("Missing or invalid ResultCode")
+
+    # Keep only the receipt number from the callback metadata, not the whole payload
+    receipt = None
+    metadata = callback.get("CallbackMetadata") or {}
+    for item in metadata.get("Item", []) if isinstance(metadata, dict) else []:
+        if isinstance(item, dict) and item.get("Name") == "MpesaReceiptNumber":
+            receipt = item.get("Value")
+
+    if result_code == 0:
+        result_desc = "Payment completed successfully"
+    else:
+        result_desc = callback.get("ResultDesc") or "Payment failed"
+    return checkout_id, result_code, str(result_desc)[:500], receipt
+
+
+class CallbackJournal:
+    """Durable journal of Safaricom STK callbacks, applied by a background consumer.
+
+    The route validates the payload with parse_callback(), then append()
+    writes one row (unique per CheckoutRequestID, so redeliveries are
+    dropped) and wakes the consumer, so Daraja is acked straight away. The
+    consumer applies pending rows in batches: one BEGIN IMMEDIATE transaction
+    selects up to batch_size rows, passes them to apply_batch(cur, results)
+    and marks them applied, so a crash mid-batch leaves them pending and
+    consumers in other workers never apply the same row twice. on_applied(results,
+    updated_ids) runs after the commit. Applied rows are kept for
+    retention_seconds so late redeliveries are still recognised as duplicates.
+    """
+
+    def __init__(self, get_connection, apply_batch, on_applied=None, batch_size=100,
+                 poll_interval=5.0, retention_seconds=86400, evict_interval=300):
+        self.get_connection = get_connection
+        self.apply_batch = apply_batch
+        self.on_applied = on_applied
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.evict_interval = evict_interval
+        self._last_evict = time.monotonic()
+
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.appended = 0
+        self.duplicates = 0
+        self.applied = 0
+        self.batches = 0
+        self.errors = 0
+
+    # ------------------- Producer side -------------------
+    def append(self, checkout_id, result_code, result_desc=None, receipt=None):
+        """Journal one callback; returns False when this CheckoutRequestID was already received."""
+        conn = self.get_connection()
+        try:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO mpesa_callbacks "
+                "(checkout_request_id, result_code, result_desc, mpesa_receipt, received_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (checkout_id, result_code, result_desc, receipt, time.time())
+            )
+            conn.commit()
+            added = cur.rowcount > 0
+        finally:
+            conn.close()
+        if not added:
+            self.duplicates += 1
+            return False
+        self.appended += 1
+        self.ensure_started()
+        self._wakeup.set()
+        return True
+
+    # ------------------- Consumer side -------------------
+    def process_batch(self):
+        """Apply one batch of journalled callbacks; returns how many were handled."""
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, checkout_request_id, result_code, result_desc, mpesa_receipt FROM mpesa_callbacks "
+                "WHERE applied_at IS NULL ORDER BY id LIMIT ?",
+                (self.batch_size,)
+            ).fetchall()
+            if not rows:
+                conn.rollback()
+                return 0
+            results = [(row['checkout_request_id'], row['result_code'], row['result_desc'],
+                        row['mpesa_receipt']) for row in rows]
+            cur = conn.cursor()
+            updated = self.apply_batch(cur, results)
+            now = time.time()
+            cur.executemany("UPDATE mpesa_callbacks SET applied_at=? WHERE id=?",
+                            [(now, row['id']) for row in rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        self.applied += len(rows)
+        self.batches += 1
+        if self.on_applied:
+            self.on_applied(results, updated)
+        return len(rows)
+
+    def evict_applied(self):
+        """Delete applied rows older than the retention window; returns how many were removed."""
+        cutoff = time.time() - self.retention_seconds
+        conn = self.get_connection()
+        try:
+            cur = conn.execute("DELETE FROM mpesa_callbacks WHERE applied_at IS NOT NULL AND received_at < ?",
+                               (cutoff,))
+            conn.commit()
+            removed = cur.rowcount
+        finally:
+            conn.close()
+        self._last_evict = time.monotonic()
+        return removed
+
+    def _run(self):
+        while True:
+            try:
+                if self.process_batch():
+                    continue
+                if time.monotonic() - self._last_evict >= self.evict_interval:
+                    self.evict_applied()
+            except Exception:
+                self.errors += 1
+                log.exception("Callback consumer error")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def ensure_started(self):
+        with self._lock:
+            # A thread started before a gunicorn fork does not exist in the worker
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='mpesa-callback-consumer', daemon=True)
+                self._thread.start()
+
+    def backlog(self):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT COUNT(*) FROM mpesa_callbacks WHERE applied_at IS NULL").fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+    def stats(self):
+        return {
+            'backlog': self.backlog(),
+            'appended': self.appended,
+            'duplicates': self.duplicates,
+            'applied': self.applied,
+            'batches': self.batches,
+            'errors': self.errors
+        }
@@ -0,0 +1,214 @@
+import base64
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class MpesaError(Exception):
+    def __init__(self, message, status_code=500, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+class MpesaBusy(MpesaError):
+    pass
+
+
+class MpesaTimeout(MpesaError):
+    pass
+
+
+def build_session(pool_size=10):
+    """requests.Session with a keep-alive pool so pushes reuse the TLS connection to Daraja."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class MpesaClient:
+    """Daraja STK push client with pooled connections and bounded concurrency.
+
+    Calls run on a small worker pool; once max_pending calls are queued or in
+    flight, submit_* raises MpesaBusy immediately instead of tying up another
+    web worker. Each call has an overall deadline. Connection errors and
+    429/502/503/504 responses are retried with jittered exponential backoff;
+    read timeouts are not, since the customer may already have the prompt.
+    """
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, base_url, business_short_code, passkey, callback_url, token_manager,
+                 session=None, max_workers=8, max_pending=32, deadline=15.0, connect_timeout=3.05,
+                 max_retries=2, backoff_base=0.25, backoff_cap=2.0, on_request=None):
+        self.base_url = base_url.rstrip('/')
+        self.business_short_code = business_short_code
+        self.passkey = passkey
+        self.callback_url = callback_url
+        self.token_manager = token_manager
+        self.session = session or build_session(max_workers)
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # on_request(path, outcome, seconds) is called after every HTTP attempt, e.g. for metrics
+        self.on_request = on_request
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mpesa')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.rejected = 0
+
+    # ------------------- Helpers -------------------
+    def password(self, timestamp):
+        raw = self.business_short_code + self.passkey + timestamp
+        return base64.b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def timestamp():
+        return datetime.now().strftime("%Y%m%d%H%M%S")
+
+    def _backoff(self, attempt, deadline_at):
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        remaining = deadline_at - time.monotonic()
+        if delay >= remaining:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _observe(self, path, outcome, started):
+        if self.on_request is not None:
+            self.on_request(path, outcome, time.perf_counter() - started)
+
+    def _post(self, path, payload, deadline=None):
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        self.calls += 1
+        attempt = 0
+        refreshed_token = False
+
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.errors += 1
+                raise MpesaTimeout("M-Pesa request deadline exceeded", 504)
+
+            access_token = self.token_manager.get_token()
+            if not access_token:
+                self.errors += 1
+                raise MpesaError("Failed to get access token", 500)
+
+            started = time.perf_counter()
+            try:
+                resp = self.session.post(
+                    f"{self.base_url}{path}",
+                    headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
+                    json=payload,
+                    timeout=(min(self.connect_timeout, remaining), remaining)
+                )
+            except requests.exceptions.ConnectionError as e:
+                self._observe(path, 'connection_error', started)
+                # Connection failures (incl. ConnectTimeout) happen before Daraja has the request;
+                # a ReadTimeout is deliberately not retried since the push may already be live
+                if attempt < self.max_retries and self._backoff(attempt, deadline_at):
+                    attempt += 1
+                    self.retries += 1
+                    continue
+                self.errors += 1
+                raise MpesaError(f"Network error: {e}", 500)
+            except requests.exceptions.Timeout as e:
+                self._observe(path, 'timeout', started)
+                self.errors += 1
+                raise MpesaTimeout(f"Network error: {e}", 504)
+            except requests.exceptions.RequestException as e:
+                self._observe(path, 'error', started)
+                self.errors += 1
+                raise MpesaError(f"Network error: {e}", 500)
+
+            self._observe(path, str(resp.status_code), started)
+
+            if resp.status_code == 401 and not refreshed_token:
+                # Token revoked early on Daraja's side; fetch a fresh one and resend once
+                self.token_manager.invalidate()
+                refreshed_token = True
+                continue
+
+            if resp.status_code in self.RETRY_STATUSES and attempt < self.max_retries \
+                    and self._backoff(attempt, deadline_at):
+                attempt += 1
+                self.retries += 1
+                continue
+
+            try:
+                body = resp.json()
+            except ValueError:
+                body = {}
+
+            if resp.status_code >= 400:
+                self.errors += 1
+                message = body.get("errorMessage") or f"HTTP {resp.status_code} from M-Pesa"
+                raise MpesaError(message, 400 if resp.status_code < 500 else 502, body)
+            return body
+
+    def _submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise MpesaBusy("Payment service is busy, please try again", 503)
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    # ------------------- Public API -------------------
+    def stk_push(self, phone, amount, account_reference, description, deadline=None):
+        timestamp = self.timestamp()
+        payload = {
+            "BusinessShortCode": self.business_short_code,
+            "Password": self.password(timestamp),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": amount,
+            "PartyA": phone,
+            "PartyB": self.business_short_code,
+            "PhoneNumber": phone,
+            "CallBackURL": self.callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": description
+        }
+        return self._post("/mpesa/stkpush/v1/processrequest", payload, deadline)
+
+    def stk_query(self, checkout_id, deadline=None):
+        """Ask Daraja for the outcome of an STK push (for when its callback never arrived)."""
+        timestamp = self.timestamp()
+        payload = {
+            "BusinessShortCode": self.business_short_code,
+            "Password": self.password(timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_id
+        }
+        return self._post("/mpesa/stkpushquery/v1/query", payload, deadline)
+
+    def submit_stk_push(self, *args, **kwargs):
+        """Run stk_push() on the worker pool; returns a Future or raises MpesaBusy."""
+        return self._submit(self.stk_push, *args, **kwargs)
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'errors': self.errors,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,197 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from rate_limit import TokenBucket
+
+log = logging.getLogger('viva.newsletter')
+
+
+class NewsletterQueue:
+    """Durable newsletter send queue stored in SQLite.
+
+    A job is one newsletter (subject + body) with an idempotency key, so
+    enqueueing the same newsletter twice is a no-op. Each recipient is one
+    delivery row (unique per job and email). A background thread claims
+    batches of due deliveries, sends each batch over a single SMTP connection
+    under a rate limit, and reschedules failures with exponential backoff
+    until max_attempts. Claims are leased, so deliveries held by a worker
+    that died are picked up again once the lease expires; an expired lease
+    counts as an attempt.
+    """
+
+    def __init__(self, get_connection, connect_mailer, batch_size=50, rate_per_second=5.0,
+                 max_attempts=5, backoff_base=30.0, backoff_cap=3600.0, lease_seconds=300,
+                 poll_interval=5.0):
+        self.get_connection = get_connection
+        self.connect_mailer = connect_mailer
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate_per_second)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    # ------------------- Producer side -------------------
+    def enqueue(self, idempotency_key, subject, body, recipients):
+        """Queue a newsletter; returns (job_id, newly_queued_recipient_count)."""
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.execute("INSERT OR IGNORE INTO newsletter_jobs (idempotency_key, subject, body) VALUES (?, ?, ?)",
+                         (idempotency_key, subject, body))
+            job_id = conn.execute("SELECT id FROM newsletter_jobs WHERE idempotency_key=?",
+                                  (idempotency_key,)).fetchone()[0]
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO newsletter_deliveries (job_id, email, next_attempt_at) VALUES (?, ?, ?)",
+                [(job_id, email, now) for email in recipients]
+            )
+            queued = conn.total_changes - before
+            conn.commit()
+        finally:
+            conn.close()
+        if queued:
+            self.ensure_started()
+            self._wakeup.set()
+        return job_id, queued
+
+    # ------------------- Consumer side -------------------
+    def _claim(self):
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT d.id, d.email, d.status, d.attempts, j.subject, j.body FROM newsletter_deliveries d "
+                "JOIN newsletter_jobs j ON j.id = d.job_id "
+                "WHERE d.status IN ('pending', 'sending') AND d.next_attempt_at <= ? "
+                "ORDER BY d.next_attempt_at LIMIT ?",
+                (now, self.batch_size)
+            ).fetchall()
+            claimed, abandoned = [], []
+            for row in rows:
+                row = dict(row)
+                if row['status'] == 'sending':
+                    # The lease ran out, so the worker holding it died mid-send: that counts as an attempt,
+                    # or a message that crashes the sender would be retried forever
+                    row['attempts'] += 1
+                    if row['attempts'] >= self.max_attempts:
+                        abandoned.append((row['attempts'], now, row['id']))
+                        continue
+                claimed.append(row)
+            if abandoned:
+                conn.executemany(
+                    "UPDATE newsletter_deliveries SET status='failed', attempts=?, next_attempt_at=?, "
+                    "last_error='Lease expired before the send finished' WHERE id=?",
+                    abandoned
+                )
+                self.failed += len(abandoned)
+            if claimed:
+                # Lease the batch: other workers skip it until the lease runs out
+                conn.executemany(
+                    "UPDATE newsletter_deliveries SET status='sending', attempts=?, next_attempt_at=? WHERE id=?",
+                    [(row['attempts'], now + self.lease_seconds, row['id']) for row in claimed]
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return claimed
+
+    def _record(self, sent_ids, failures):
+        now = time.time()
+        updates = []
+        for delivery_id, attempts, error in failures:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                updates.append(('failed', attempts, now, error, delivery_id))
+                self.failed += 1
+            else:
+                delay = min(self.backoff_cap, self.backoff_base * (2 ** (attempts - 1)))
+                delay = random.uniform(delay / 2, delay)
+                updates.append(('pending', attempts, now + delay, error, delivery_id))
+                self.retried += 1
+
+        conn = self.get_connection()
+        try:
+            if sent_ids:
+                conn.executemany("UPDATE newsletter_deliveries SET status='sent', sent_at=?, last_error=NULL "
+                                 "WHERE id=?", [(now, delivery_id) for delivery_id in sent_ids])
+            if updates:
+                conn.executemany("UPDATE newsletter_deliveries SET status=?, attempts=?, next_attempt_at=?, "
+                                 "last_error=? WHERE id=?", updates)
+            conn.commit()
+        finally:
+            conn.close()
+        self.sent += len(sent_ids)
+
+    def process_batch(self):
+        """Send one batch over one SMTP connection; returns how many deliveries were handled."""
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        sent_ids, failures = [], []
+        try:
+            with self.connect_mailer() as mailer:
+                for row in rows:
+                    self.bucket.take()
+                    try:
+                        mailer.send(row['email'], row['subject'], row['body'])
+                        sent_ids.append(row['id'])
+                    except Exception as e:
+                        failures.append((row['id'], row['attempts'], str(e)[:500]))
+        except Exception as e:
+            # Connection-level failure: everything not yet sent is retried later
+            done = set(sent_ids) | {f[0] for f in failures}
+            failures += [(row['id'], row['attempts'], f"SMTP connection error: {e}"[:500])
+                         for row in rows if row['id'] not in done]
+
+        self._record(sent_ids, failures)
+        return len(rows)
+
+    def _run(self):
+        while True:
+            try:
+                if self.process_batch():
+                    continue
+            except Exception:
+                log.exception("Newsletter dispatcher error")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def ensure_started(self):
+        with self._lock:
+            # A thread started before a gunicorn fork does not exist in the worker
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='newsletter-dispatcher', daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM newsletter_deliveries GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {
+            'deliveries': {row[0]: row[1] for row in rows},
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed
+        }
@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger('viva.payment_events')
+
+
+class PaymentStatusNotifier:
+    """Lets request handlers block until an STK request leaves 'pending'.
+
+    Waiters on the same CheckoutRequestID share a single Event, so a
+    registration costs one dict entry per checkout ID plus a counter.
+    stk_callback() wakes waiters in this process directly via notify(). Callbacks
+    that land on another gunicorn worker are picked up by one watcher thread,
+    which checks every watched ID in a single query every poll_interval seconds.
+    """
+
+    def __init__(self, fetch_final_statuses, poll_interval=1.0, max_waiters=500):
+        self.fetch_final_statuses = fetch_final_statuses
+        self.poll_interval = poll_interval
+        self.max_waiters = max_waiters
+
+        self._lock = threading.Lock()
+        self._waiters = {}     # checkout_id -> [Event, waiter_count]
+        self._total = 0
+        self._watcher = None
+
+        self.notified = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _ensure_watcher(self):
+        # Caller must hold _lock
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch, name='payment-status-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._waiters:
+                    self._watcher = None
+                    return
+                ids = list(self._waiters)
+            try:
+                finished = self.fetch_final_statuses(ids)
+            except Exception:
+                log.exception("Payment status watcher error")
+                continue
+            for checkout_id in finished:
+                self.notify(checkout_id)
+
+    def notify(self, checkout_id):
+        with self._lock:
+            entry = self._waiters.get(checkout_id)
+        if entry:
+            entry[0].set()
+            self.notified += 1
+
+    def wait(self, checkout_id, timeout):
+        """Block until checkout_id is notified or timeout expires; returns True if notified.
+
+        Raises OverflowError when max_waiters requests are already waiting.
+        """
+        with self._lock:
+            if self._total >= self.max_waiters:
+                self.rejected += 1
+                raise OverflowError("Too many clients waiting for payment status")
+            entry = self._waiters.get(checkout_id)
+            if entry is None:
+                entry = self._waiters[checkout_id] = [threading.Event(), 0]
+            entry[1] += 1
+            self._total += 1
+            self._ensure_watcher()
+
+        try:
+            woke = entry[0].wait(timeout)
+            if not woke:
+                self.timeouts += 1
+            return woke
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                self._total -= 1
+                if entry[1] == 0 and self._waiters.get(checkout_id) is entry:
+                    del self._waiters[checkout_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'waiting': self._total,
+                'watched_requests': len(self._waiters),
+                'notified': self.notified,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected
+            }
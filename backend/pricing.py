@@ -0,0 +1,145 @@
+import json
+import math
+from datetime import date
+
+# Same rates as the trip planner in frontend/plan.html
+DEFAULT_RATES = {
+    "destinations": {
+        "Diani": 25000,
+        "Maasai Mara": 35000,
+        "Amboseli": 28000,
+        "Mt. Kenya": 32000,
+        "Ol Pejeta": 30000,
+        "Nairobi National Park": 12000
+    },
+    "accommodation_daily": {
+        "Luxury": 15000,
+        "Mid-range": 8000,
+        "Budget": 4000
+    },
+    "transport": {
+        "Private Car": {"base": 8000, "per_person": 5000},
+        "Tour Van": {"base": 5000, "per_person": 3000},
+        "Bus": {"base": 2000, "per_person": 1500}
+    },
+    # Month (1-12) -> multiplier on the destination base price
+    "season_multipliers": {
+        "1": 1.3, "2": 1.0, "3": 1.0, "4": 0.8, "5": 0.8, "6": 1.4,
+        "7": 1.4, "8": 1.4, "9": 1.0, "10": 1.0, "11": 1.0, "12": 1.3
+    },
+    "meals_per_night": {"adult": 2000, "child": 1000},
+    "park_fees": {"adult": 1500, "child": 800},
+    "deposit_rate": 0.1
+}
+
+
+class PricingError(ValueError):
+    pass
+
+
+def js_round(value):
+    # Math.round() semantics (halves round up), so quotes match the browser to the shilling
+    return int(math.floor(value + 0.5))
+
+
+class PricingEngine:
+    """Trip quotes computed from a rate table flattened once at startup.
+
+    Every rate lives in a flat list indexed by small integers:
+    destination × month is a precomputed base-price table, and tiers and
+    transports map to one index each. A quote is a handful of dict lookups
+    and arithmetic, so batch quotes and deposit checks in stk_push() and
+    create_booking() stay O(1) per itinerary.
+    """
+
+    def __init__(self, rates=None):
+        rates = rates or DEFAULT_RATES
+        self.rates = rates
+
+        self.destinations = {name: i for i, name in enumerate(rates["destinations"])}
+        self.tiers = {name: i for i, name in enumerate(rates["accommodation_daily"])}
+        self.transports = {name: i for i, name in enumerate(rates["transport"])}
+
+        seasons = [1.0] * 13
+        for month, multiplier in rates["season_multipliers"].items():
+            seasons[int(month)] = float(multiplier)
+        self.season_multipliers = seasons
+
+        # dest_month_cost[d * 13 + month] = base price × season multiplier
+        self.dest_month_cost = []
+        for base in rates["destinations"].values():
+            self.dest_month_cost.extend(base * m for m in seasons)
+
+        self.tier_daily = list(rates["accommodation_daily"].values())
+        self.transport_base = [t["base"] for t in rates["transport"].values()]
+        self.transport_per_person = [t["per_person"] for t in rates["transport"].values()]
+        self.meal_adult = rates["meals_per_night"]["adult"]
+        self.meal_child = rates["meals_per_night"]["child"]
+        self.park_adult = rates["park_fees"]["adult"]
+        self.park_child = rates["park_fees"]["child"]
+        self.deposit_rate = rates["deposit_rate"]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    # ------------------- Quoting -------------------
+    def _lookup(self, itinerary):
+        d = self.destinations.get(itinerary.get("destination"))
+        a = self.tiers.get(itinerary.get("accommodation"))
+        t = self.transports.get(itinerary.get("transport"))
+        if d is None or a is None or t is None:
+            field = "destination" if d is None else "accommodation" if a is None else "transport"
+            raise PricingError(f"Unknown or missing {field}: {itinerary.get(field)!r}")
+        try:
+            start = date.fromisoformat(itinerary["start_date"])
+            end = date.fromisoformat(itinerary["end_date"])
+            adults = int(itinerary.get("adults", 0))
+            children = int(itinerary.get("children", 0) or 0)
+        except (KeyError, TypeError, ValueError):
+            raise PricingError("start_date/end_date must be YYYY-MM-DD and adults/children integers")
+        if adults <= 0 or children < 0:
+            raise PricingError("At least one adult is required")
+        return d, a, t, start, abs((end - start).days), adults, children
+
+    def quote(self, itinerary, breakdown=False):
+        d, a, t, start, nights, adults, children = self._lookup(itinerary)
+
+        destination = self.dest_month_cost[d * 13 + start.month]
+        accommodation = self.tier_daily[a] * nights * (adults + math.ceil(children * 0.5)) if nights > 0 else 0
+        transport = self.transport_base[t] + self.transport_per_person[t] * (adults + children)
+        meals = (adults * self.meal_adult + children * self.meal_child) * (nights or 1)
+        park_fees = adults * self.park_adult + children * self.park_child
+
+        total = js_round(destination + accommodation + transport + meals + park_fees)
+        fee = js_round(total * self.deposit_rate)
+        result = {"total": total, "booking_fee": fee, "balance": total - fee, "nights": nights}
+        if breakdown:
+            result["breakdown"] = {
+                "destination": js_round(destination),
+                "accommodation": js_round(accommodation),
+                "transport": transport,
+                "meals_activities": meals,
+                "park_fees": park_fees,
+                "season_multiplier": self.season_multipliers[start.month]
+            }
+        return result
+
+    def batch_quote(self, itineraries):
+        results = []
+        append = results.append
+        quote = self.quote
+        for itinerary in itineraries:
+            try:
+                append(quote(itinerary))
+            except PricingError as e:
+                append({"error": str(e)})
+        return results
+
+    def check_deposit(self, itinerary, amount):
+        """Return the quote if amount is the correct booking fee, else raise PricingError."""
+        result = self.quote(itinerary)
+        if int(amount) != result["booking_fee"]:
+            raise PricingError(f"Deposit must be KES {result['booking_fee']} for this itinerary")
+        return result
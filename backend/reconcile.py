@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mpesa_client import MpesaError
+from rate_limit import TokenBucket
+
+log = logging.getLogger('viva.mpesa.reconcile')
+
+# Daraja's STK Query error while the customer has not answered the prompt yet
+STILL_PROCESSING = '500.001.1001'
+
+
+class StkReconciler:
+    """Resolves STK pushes whose callback never arrived by asking Daraja (STK Query).
+
+    Every interval seconds the worker thread claims batches of pending
+    requests older than min_age seconds (stk_store.claim_stale_pending leases
+    them, so other gunicorn workers skip them), queries them on a small
+    thread pool of concurrency threads under a shared rate_per_second limit,
+    and writes the final results back in one transaction per batch. Requests
+    Daraja still reports as processing are re-checked with exponential
+    backoff; after max_attempts checks they are left pending for a human.
+    """
+
+    def __init__(self, stk_store, query, on_resolved=None, min_age=120, interval=60.0, batch_size=50,
+                 concurrency=4, rate_per_second=2.0, max_attempts=10, backoff_cap=3600.0):
+        self.stk_store = stk_store
+        self.query = query
+        # on_resolved(checkout_ids) runs after each batch is written, e.g. to wake waiting clients
+        self.on_resolved = on_resolved
+        self.min_age = min_age
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate_per_second)
+        self.max_attempts = max_attempts
+        self.backoff_cap = backoff_cap
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='stk-reconcile')
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.queried = 0
+        self.resolved = 0
+        self.still_processing = 0
+        self.errors = 0
+        self.last_run_at = None
+        self.last_run_seconds = None
+
+    def recheck_after(self, attempts):
+        return min(self.backoff_cap, self.interval * (2 ** (attempts - 1)))
+
+    def _check(self, checkout_id):
+        # Returns a result tuple for apply_results, or None if the request is still open
+        self.bucket.take()
+        self.queried += 1
+        try:
+            body = self.query(checkout_id)
+        except MpesaError as e:
+            if (e.response or {}).get('errorCode') == STILL_PROCESSING:
+                self.still_processing += 1
+            else:
+                self.errors += 1
+                log.warning("STK query failed", extra={"checkout_request_id": checkout_id, "error": str(e)})
+            return None
+        try:
+            result_code = int(body.get('ResultCode'))
+        except (TypeError, ValueError):
+            self.errors += 1
+            log.warning("STK query returned no ResultCode", extra={"checkout_request_id": checkout_id,
+                                                                    "response": body})
+            return None
+        return checkout_id, result_code, str(body.get('ResultDesc') or '')[:500] or None, None
+
+    def run_once(self):
+        """Reconcile every due request now; returns how many were resolved."""
+        started = time.perf_counter()
+        resolved = 0
+        while True:
+            claimed = self.stk_store.claim_stale_pending(self.min_age, self.batch_size, self.recheck_after,
+                                                         self.max_attempts)
+            if not claimed:
+                break
+            results = [r for r in self._executor.map(self._check, [c for c, _ in claimed]) if r]
+            if results:
+                updated = self.stk_store.resolve_pending(results)
+                resolved += len(updated)
+                self.resolved += len(updated)
+                if self.on_resolved:
+                    self.on_resolved(updated)
+            if len(claimed) < self.batch_size:
+                break
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_run_seconds = round(time.perf_counter() - started, 3)
+        if resolved:
+            log.info("Reconciled pending STK requests", extra={"resolved": resolved,
+                                                                "duration_s": self.last_run_seconds})
+        return resolved
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                self.errors += 1
+                log.exception("STK reconciliation error")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def ensure_started(self):
+        with self._lock:
+            # A thread started before a gunicorn fork does not exist in the worker
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='stk-reconciler', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stats(self):
+        due, abandoned = self.stk_store.stale_pending_counts(self.min_age, self.max_attempts)
+        return {
+            'stale_pending': due,
+            'abandoned': abandoned,
+            'runs': self.runs,
+            'queried': self.queried,
+            'resolved': self.resolved,
+            'still_processing': self.still_processing,
+            'errors': self.errors,
+            'last_run_at': self.last_run_at,
+            'last_run_seconds': self.last_run_seconds
+        }
@@ -0,0 +1,165 @@
+"""Finance reports over the bookings table.
+
+    python reports.py --group-by destination,month --output revenue.csv
+    python reports.py --since 2025-01-01 --format parquet --output q1.parquet
+
+Aggregation runs inside SQLite: each chunk of bookings (an id range) is
+reduced with one GROUP BY, and the partial sums are merged in Python. Memory
+is bounded by the number of groups, not the number of bookings, and no chunk
+holds a write lock for long.
+"""
+import argparse
+import csv
+import sqlite3
+import sys
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+GROUP_COLUMNS = {
+    'destination': "dest_name",
+    'tier': "acc_tier",
+    'month': "substr(arrive_date, 1, 7)",
+    'status': "status",
+}
+
+# Every metric is a plain sum, so per-chunk results merge by addition
+METRICS = [
+    ('bookings', "COUNT(*)"),
+    ('travelers', "SUM(travelers)"),
+    ('traveler_nights', "SUM(travelers * MAX(julianday(depart_date) - julianday(arrive_date), 1))"),
+    ('cancelled', "SUM(status = 'cancelled')"),
+    ('revenue', "SUM(CASE WHEN status IN ('confirmed', 'completed') THEN total_cost ELSE 0 END)"),
+    ('pipeline_value', "SUM(CASE WHEN status = 'pending' THEN total_cost ELSE 0 END)"),
+    ('deposits_collected', "SUM(CASE WHEN paid_deposit THEN deposit_amount ELSE 0 END)"),
+    ('deposits_outstanding', "SUM(CASE WHEN NOT paid_deposit AND status = 'pending' "
+                             "THEN deposit_amount ELSE 0 END)"),
+    ('balance_outstanding', "SUM(CASE WHEN status IN ('pending', 'confirmed') "
+                            "THEN total_cost - CASE WHEN paid_deposit THEN deposit_amount ELSE 0 END "
+                            "ELSE 0 END)"),
+]
+
+
+class ReportError(ValueError):
+    pass
+
+
+class BookingReport:
+    def __init__(self, get_connection, chunk_size=100000):
+        self.get_connection = get_connection
+        self.chunk_size = chunk_size
+
+    def _sql(self, group_by, since, until):
+        keys = [f"{GROUP_COLUMNS[g]} AS {g}" for g in group_by]
+        metrics = [f"COALESCE({expr}, 0) AS {name}" for name, expr in METRICS]
+        where = ["id >= ?", "id < ?"]
+        params = []
+        if since:
+            where.append("arrive_date >= ?")
+            params.append(since)
+        if until:
+            where.append("arrive_date < ?")
+            params.append(until)
+        sql = f"SELECT {', '.join(keys + metrics)} FROM bookings WHERE {' AND '.join(where)}"
+        if group_by:
+            sql += f" GROUP BY {', '.join(GROUP_COLUMNS[g] for g in group_by)}"
+        return sql, params
+
+    def aggregate(self, group_by=('destination', 'tier', 'month'), since=None, until=None):
+        """Return rows of group keys plus metrics, sorted by group key."""
+        group_by = list(group_by)
+        unknown = [g for g in group_by if g not in GROUP_COLUMNS]
+        if unknown:
+            raise ReportError(f"Unknown group-by column(s): {', '.join(unknown)}")
+        sql, params = self._sql(group_by, since, until)
+        width = len(group_by)
+
+        totals = {}
+        conn = self.get_connection()
+        try:
+            low, high = conn.execute("SELECT MIN(id), MAX(id) FROM bookings").fetchone()
+            if low is None:
+                return []
+            for start in range(low, high + 1, self.chunk_size):
+                for row in conn.execute(sql, [start, start + self.chunk_size] + params):
+                    row = tuple(row)
+                    key, values = row[:width], row[width:]
+                    if not group_by and not values[0]:
+                        continue
+                    current = totals.get(key)
+                    totals[key] = values if current is None else tuple(map(sum, zip(current, values)))
+        finally:
+            conn.close()
+
+        names = group_by + [name for name, _ in METRICS]
+        rows = []
+        for key in sorted(totals, key=lambda k: tuple('' if v is None else str(v) for v in k)):
+            row = dict(zip(names, key + totals[key]))
+            row['traveler_nights'] = int(row['traveler_nights'])
+            rows.append(row)
+        return rows
+
+
+def columns_for(group_by):
+    return list(group_by) + [name for name, _ in METRICS]
+
+
+# ------------------- Export -------------------
+def write_csv(rows, columns, out):
+    writer = csv.DictWriter(out, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def write_parquet(rows, columns, path):
+    if pyarrow is None:
+        raise ReportError("Parquet export needs pyarrow (pip install pyarrow)")
+    table = pyarrow.table({c: [row[c] for row in rows] for c in columns})
+    pyarrow.parquet.write_table(table, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bookings revenue, deposit and occupancy report')
+    parser.add_argument('--db', default='viva_utalii.db')
+    parser.add_argument('--group-by', default='destination,tier,month',
+                        help=f"comma-separated, any of: {', '.join(GROUP_COLUMNS)} (empty for grand totals)")
+    parser.add_argument('--since', help='only trips arriving on/after this date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='only trips arriving before this date (YYYY-MM-DD)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--output', help='output file (CSV defaults to stdout)')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    def connect():
+        conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    group_by = [g.strip() for g in args.group_by.split(',') if g.strip()]
+    started = time.perf_counter()
+    try:
+        rows = BookingReport(connect, chunk_size=args.chunk_size).aggregate(group_by, args.since, args.until)
+        columns = columns_for(group_by)
+        if args.format == 'parquet':
+            if not args.output:
+                raise ReportError("--output is required for Parquet")
+            write_parquet(rows, columns, args.output)
+        elif args.output:
+            with open(args.output, 'w', newline='') as f:
+                write_csv(rows, columns, f)
+        else:
+            write_csv(rows, columns, sys.stdout)
+    except (ReportError, sqlite3.Error) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(f"✅ {len(rows)} rows in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
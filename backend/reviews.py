@@ -0,0 +1,184 @@
+"""Traveller reviews and their per-destination rating aggregates.
+
+Reviews are listed newest first or highest rated first, with keyset
+pagination over indexes that lead with the destination. Each destination's
+count, rating sum and star histogram live in review_stats. Triggers on the
+reviews table keep that row up to date on every insert, delete and rating
+change, so a summary is one primary-key lookup however many reviews exist.
+"""
+import base64
+import json
+import os
+import sqlite3
+import time
+
+from bookings import InvalidCursor
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SEED = os.path.join(BACKEND_DIR, 'reviews.json')
+
+# Reviews written on the site rather than imported from elsewhere
+SITE_SOURCE = 'Viva Utalii'
+SOURCE_ICONS = {
+    'Google Reviews': 'fab fa-google',
+    'TripAdvisor': 'fas fa-map-marked-alt',
+    'Booking.com': 'fas fa-concierge-bell',
+    'SafariBookings': 'fas fa-globe',
+    SITE_SOURCE: 'fas fa-user-check',
+}
+SORTS = {
+    # sort: (ORDER BY, keyset comparison)
+    'recent': ("created_at DESC, id DESC", "(created_at, id) < (?, ?)"),
+    'rating': ("rating DESC, created_at DESC, id DESC", "(rating, created_at, id) < (?, ?, ?)"),
+}
+MIN_TEXT_LENGTH = 10
+MAX_TEXT_LENGTH = 2000
+MAX_TAGS = 5
+
+
+class InvalidReview(ValueError):
+    pass
+
+
+class DuplicateReview(ValueError):
+    pass
+
+
+def load_seed(path=DEFAULT_SEED):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def encode_cursor(sort, row):
+    key = [row['created_at'], row['id']]
+    if sort == 'rating':
+        key.insert(0, row['rating'])
+    raw = '|'.join(map(str, [sort] + key)).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    """Returns the keyset values for `sort`; a cursor from another sort order is rejected."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        if parts[0] != sort or len(parts) != (4 if sort == 'rating' else 3):
+            raise ValueError(cursor)
+        key = parts[1:]
+        key[-1] = int(key[-1])
+        if sort == 'rating':
+            key[0] = int(key[0])
+        return key
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+class ReviewStore:
+    """The reviews table and the review_stats aggregates maintained from it."""
+
+    def __init__(self, get_connection, default_page_size=12, max_page_size=50):
+        self.get_connection = get_connection
+        self.default_page_size = default_page_size
+        self.max_page_size = max_page_size
+
+    # ------------------- Writes -------------------
+    def create(self, destination, user_id, name, rating, text, tags=()):
+        try:
+            rating = int(rating)
+        except (TypeError, ValueError):
+            raise InvalidReview("rating must be a whole number from 1 to 5")
+        if not 1 <= rating <= 5:
+            raise InvalidReview("rating must be a whole number from 1 to 5")
+        text = text.strip() if isinstance(text, str) else ''
+        if not MIN_TEXT_LENGTH <= len(text) <= MAX_TEXT_LENGTH:
+            raise InvalidReview(f"text must be {MIN_TEXT_LENGTH} to {MAX_TEXT_LENGTH} characters")
+        if not isinstance(tags, (list, tuple)) or len(tags) > MAX_TAGS \
+                or not all(isinstance(t, str) and 0 < len(t) <= 30 for t in tags):
+            raise InvalidReview(f"tags must be a list of at most {MAX_TAGS} short strings")
+
+        conn = self.get_connection()
+        try:
+            try:
+                cur = conn.execute(
+                    "INSERT INTO reviews (destination, user_id, name, rating, text, tags, source, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (destination, user_id, name, rating, text, json.dumps([t.lower() for t in tags]),
+                     SITE_SOURCE, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+                )
+                conn.commit()
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                raise DuplicateReview("You have already reviewed this destination")
+            return cur.lastrowid
+        finally:
+            conn.close()
+
+    # ------------------- Reads -------------------
+    @staticmethod
+    def _review(row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'date': row['created_at'][:10],
+            'rating': row['rating'],
+            'text': row['text'],
+            'tags': json.loads(row['tags']),
+            'source': row['source'],
+            'source_icon': SOURCE_ICONS.get(row['source'], 'fas fa-comment'),
+            'helpful': row['helpful']
+        }
+
+    def page(self, destination, sort='recent', cursor=None, limit=None):
+        """One page of a destination's reviews; returns (reviews, next_cursor)."""
+        if sort not in SORTS:
+            raise ValueError(f"sort must be one of: {', '.join(SORTS)}")
+        order, after = SORTS[sort]
+        limit = min(limit, self.max_page_size) if limit and limit > 0 else self.default_page_size
+        sql = "SELECT * FROM reviews WHERE destination=?"
+        params = [destination]
+        if cursor:
+            sql += f" AND {after}"
+            params += decode_cursor(sort, cursor)
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit + 1)
+
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(sort, rows[-1])
+        return [self._review(row) for row in rows], next_cursor
+
+    @staticmethod
+    def _summary(row):
+        count = row['count'] if row else 0
+        histogram = {str(n): row[f'stars_{n}'] if row else 0 for n in range(5, 0, -1)}
+        return {
+            'count': count,
+            'average': round(row['rating_sum'] / count, 2) if count else None,
+            'histogram': histogram,
+            'percentages': {star: round(100 * n / count) if count else 0 for star, n in histogram.items()},
+            'updated_at': row['updated_at'] if row else None
+        }
+
+    def summary(self, destination):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT * FROM review_stats WHERE destination=?", (destination,)).fetchone()
+        finally:
+            conn.close()
+        return self._summary(row)
+
+    def summaries(self):
+        """{destination: summary} for every destination that has had a review."""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT * FROM review_stats").fetchall()
+        finally:
+            conn.close()
+        return {row['destination']: self._summary(row) for row in rows}
@@ -0,0 +1,208 @@
+"""Full-text search over destinations, deals and reviews (SQLite FTS5).
+
+Everything searchable lives in one FTS5 table, search_index, so a query is
+ranked across all three with a single BM25 pass. The title column is
+weighted most, keywords next and body least. The index is kept in step by
+triggers on the source tables (created by migration 8), so nothing else has
+to remember to update it. Those triggers also bump the 'search_index' row of table_versions, which
+keys the result cache: popular queries are answered from memory until the
+next write to any source table.
+
+Each source row maps to one index row whose rowid is the source rowid * 4 + a
+per-kind code. Updates and deletes then find their index row by rowid instead
+of scanning the FTS table. The kind is also recoverable from the rowid, which
+lets ranking and kind filters skip reading the stored columns.
+
+BM25 must score every match before the best can be picked. A word that
+appears in a large share of reviews therefore ranks every destination and
+deal, but only the newest max_ranked_reviews matching reviews. That keeps a
+broad query's cost flat as reviews accumulate.
+"""
+import html
+import re
+import time
+
+from cache import LRUCache
+
+TERM_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+# snippet() markers; the text is HTML-escaped before they become <mark> tags
+MARK_START, MARK_END = '\x02', '\x03'
+
+# Broad queries rank every matching destination and deal, but only this many of the newest matching reviews
+MAX_RANKED_REVIEWS = 2000
+
+# kind -> rowid code: an index row's rowid is its source row's rowid * 4 + the code (see migration 8)
+CODES = {'destination': 1, 'deal': 2, 'review': 3}
+DOCUMENTS = tuple(CODES)
+
+# Column weights follow (kind, ref, destination, title, keywords, body). Destination documents are long
+# (every card on the page), so BM25's length normalisation is offset to rank them above single reviews. The kind is read from the rowid
+# rather than the kind column, which would cost a row fetch for every match.
+BOOSTS = {'destination': 3.0, 'deal': 1.5}
+RANK = ("bm25(search_index, 0.0, 0.0, 0.0, 10.0, 4.0, 1.0) * CASE search_index.rowid % 4 "
+        + ' '.join(f"WHEN {CODES[kind]} THEN {boost}" for kind, boost in BOOSTS.items()) + " ELSE 1.0 END")
+
+
+def match_expression(query, prefix=True, operator=' ', columns=None):
+    """FTS5 MATCH expression for free text; None when it has no searchable terms.
+
+    Terms are quoted, so punctuation and FTS5 syntax in the input are inert.
+    With prefix, the last term also matches longer words (as-you-type). A
+    last term of one character is dropped instead: the prefix index starts at
+    two, and expanding a single letter would walk a large part of the index.
+    """
+    terms = TERM_RE.findall(query.lower())[:MAX_TERMS]
+    if prefix and terms and len(terms[-1]) < 2:
+        terms.pop()
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if prefix:
+        quoted[-1] += '*'
+    expression = operator.join(quoted)
+    if columns:
+        expression = f"{{{' '.join(columns)}}} : ({expression})"
+    return expression
+
+
+def _snippet(text):
+    return html.escape(text, quote=False).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+class SearchIndex:
+    """Queries over search_index, with an LRU of results per index version."""
+
+    def __init__(self, get_connection, table_versions, max_results=20, cache_size=512, cache_ttl=300,
+                 max_ranked_reviews=MAX_RANKED_REVIEWS):
+        self.get_connection = get_connection
+        self.table_versions = table_versions
+        self.max_results = max_results
+        self.max_ranked_reviews = max_ranked_reviews
+        self.cache = LRUCache(max_size=cache_size, ttl=cache_ttl)
+
+        self.searches = 0
+        self.suggestions = 0
+        self.index_queries = 0
+        self.index_seconds = 0.0
+
+    def _cached(self, key, compute):
+        try:
+            version = self.table_versions.get('search_index')
+        except Exception:
+            return compute()
+        key = key + (version,)
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            self.cache.set(key, result)
+        return result
+
+    def _query(self, run):
+        started = time.perf_counter()
+        conn = self.get_connection()
+        try:
+            rows = run(conn)
+            destinations = {row['slug']: row for row in conn.execute(
+                "SELECT slug, name, page, reviews_page FROM destinations").fetchall()}
+        finally:
+            conn.close()
+        self.index_queries += 1
+        self.index_seconds += time.perf_counter() - started
+        return rows, destinations
+
+    @staticmethod
+    def _links(row, destinations):
+        """(title, url) for a hit, from the destination it belongs to."""
+        if row['kind'] == 'deal':
+            # Deals name a destination loosely ('Diani Beach' for Diani)
+            page = next((d['page'] for d in destinations.values()
+                         if d['name'] in row['title'] or row['title'] in d['name']), None)
+            return row['title'], page
+        destination = destinations.get(row['destination'])
+        if destination is None:
+            return row['title'], None
+        if row['kind'] == 'review':
+            return f"Review of {destination['name']}", destination['reviews_page']
+        return destination['name'], destination['page']
+
+    def search(self, query, kinds=None, limit=None):
+        """Ranked hits for free text, best first, each with an HTML snippet (matches in <mark>)."""
+        self.searches += 1
+        limit = min(limit, self.max_results) if limit and limit > 0 else self.max_results
+        kinds = tuple(sorted(set(kinds) & set(DOCUMENTS))) if kinds else tuple(DOCUMENTS)
+        expression = match_expression(query)
+        if expression is None or not kinds:
+            return []
+
+        def ranked(conn, expression):
+            sql = (f"SELECT kind, ref, destination, title, snippet(search_index, -1, ?, ?, '…', 16) AS snippet, "
+                   f"{RANK} AS score FROM search_index WHERE search_index MATCH ?")
+            params = [MARK_START, MARK_END, expression]
+            if len(kinds) < len(DOCUMENTS):
+                sql += f" AND rowid % 4 IN ({', '.join(str(CODES[kind]) for kind in kinds)})"
+            if 'review' in kinds:
+                # BM25 has to score every match, so for a word in most reviews, bound the work by
+                # ranking only the newest ones (walking matches in rowid order is cheap)
+                cutoff = conn.execute(
+                    "SELECT rowid FROM search_index WHERE search_index MATCH ? AND rowid % 4 = ? "
+                    "ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                    (expression, CODES['review'], self.max_ranked_reviews)).fetchone()
+                if cutoff:
+                    sql += " AND (rowid % 4 != ? OR rowid > ?)"
+                    params += [CODES['review'], cutoff[0]]
+            sql += " ORDER BY score LIMIT ?"
+            return conn.execute(sql, params + [limit]).fetchall()
+
+        def compute():
+            rows, destinations = self._query(lambda conn: ranked(conn, expression))
+            if not rows and ' ' in expression:
+                # Nothing has every word; rank whatever has any of them
+                rows, destinations = self._query(
+                    lambda conn: ranked(conn, match_expression(query, operator=' OR ')))
+            hits = []
+            for row in rows:
+                title, url = self._links(row, destinations)
+                hits.append({
+                    'kind': row['kind'],
+                    'id': row['ref'],
+                    'title': title,
+                    'snippet': _snippet(row['snippet']),
+                    'url': url,
+                    'score': round(-row['score'], 3)
+                })
+            return hits
+        return self._cached(('search', expression, kinds, limit), compute)
+
+    def suggest(self, prefix, limit=8):
+        """Destination and deal titles for a search box, matched on the words typed so far."""
+        self.suggestions += 1
+        limit = min(limit, self.max_results) if limit and limit > 0 else 8
+        expression = match_expression(prefix, columns=('title', 'keywords'))
+        if expression is None:
+            return []
+
+        def compute():
+            rows, destinations = self._query(lambda conn: conn.execute(
+                f"SELECT kind, ref, destination, title FROM search_index WHERE search_index MATCH ? "
+                f"AND rowid % 4 IN ({CODES['destination']}, {CODES['deal']}) ORDER BY {RANK} LIMIT ?",
+                (expression, limit * 2)).fetchall())
+            suggestions, seen = [], set()
+            for row in rows:
+                title, url = self._links(row, destinations)
+                if title in seen:
+                    continue
+                seen.add(title)
+                suggestions.append({'kind': row['kind'], 'title': title, 'url': url})
+            return suggestions[:limit]
+        return self._cached(('suggest', expression, limit), compute)
+
+    def stats(self):
+        return {
+            'searches': self.searches,
+            'suggestions': self.suggestions,
+            'index_queries': self.index_queries,
+            'avg_index_query_ms': round(self.index_seconds / self.index_queries * 1000, 2)
+            if self.index_queries else None,
+            'cache': self.cache.stats()
+        }
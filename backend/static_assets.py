@@ -0,0 +1,299 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import time
+
+from flask import Blueprint, abort, current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger('viva.static')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# src="..." / href="..." in HTML and url(...) in CSS
+HTML_REF_RE = re.compile(r'''(?P<attr>\b(?:src|href)=)(?P<quote>["'])(?P<url>[^"'#?]+)(?P<rest>[^"']*)(?P=quote)''')
+CSS_REF_RE = re.compile(r'''url\((?P<quote>["']?)(?P<url>[^"')#?]+)(?P<rest>[^"')]*)(?P=quote)\)''')
+# srcset="a-480.jpg 480w, a-960.jpg 960w": each candidate URL is rewritten on its own
+SRCSET_RE = re.compile(r'''(?P<attr>\bsrcset=)(?P<quote>["'])(?P<value>[^"']+)(?P=quote)''')
+
+
+class Asset:
+    __slots__ = ('path', 'name', 'mimetype', 'size', 'mtime', 'digest', 'hashed_name', 'data', 'encoded')
+
+    def __init__(self, path, name, mimetype, size, mtime, digest, hashed_name, data=None):
+        self.path = path
+        self.name = name
+        self.mimetype = mimetype
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+        self.hashed_name = hashed_name
+        # Rewritten HTML/CSS and rendered pages are served from memory; everything else straight from disk
+        self.data = data
+        # 'br' / 'gzip' -> compressed bytes
+        self.encoded = {}
+
+
+class StaticAssets:
+    """Serves the frontend directory with precompressed, content-hashed, cacheable responses.
+
+    Every file is hashed once at startup. HTML and CSS references to other
+    local files are rewritten to /assets/<name>.<hash><ext> URLs, which are
+    served with an immutable one-year Cache-Control. Pages keep their plain
+    URLs and are revalidated with strong ETags. Text assets get gzip (and
+    brotli, when installed) variants, built once and chosen by
+    Accept-Encoding. Files on disk go through send_file, which handles Range
+    and conditional requests, and lets gunicorn sendfile() the body through
+    wsgi.file_wrapper. With USE_X_SENDFILE, nginx/Apache sends it instead.
+    """
+
+    def __init__(self, root, url_prefix='', min_compress_size=512, gzip_level=9, brotli_quality=11,
+                 reload=False):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip('/')
+        self.min_compress_size = min_compress_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # Re-scan when a file's mtime changes (development only; costs a stat per request)
+        self.reload = reload
+        self.assets = {}
+        self.by_hash = {}
+        # name -> (HTML, mtime) from add_rendered(); survives rebuilds and wins over a file of the same name
+        self.rendered = {}
+
+        self.served = 0
+        self.not_modified = 0
+        self.encoded_hits = {'br': 0, 'gzip': 0}
+
+    # ------------------- Build -------------------
+    def _walk(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), path
+
+    @staticmethod
+    def _hashed_name(name, digest):
+        stem, ext = posixpath.splitext(name)
+        return f"{stem}.{digest[:10]}{ext}"
+
+    def _hashed_url(self, base, url):
+        # Hashed URL for a reference to a local file; None for pages, externals and unknowns
+        if url.startswith(('/', 'data:')) or ':' in url.split('/')[0]:
+            return None
+        target = self.assets.get(posixpath.normpath(posixpath.join(base, url)))
+        if target is None or target.mimetype == 'text/html':
+            return None
+        return self.asset_url(target.name)
+
+    def _rewrite(self, name, text, pattern):
+        # Point references to local files at their hashed URLs; pages, externals and unknowns stay as they are
+        base = posixpath.dirname(name)
+
+        def replace(match):
+            url = match.group('url')
+            hashed = self._hashed_url(base, url)
+            if hashed is None:
+                return match.group(0)
+            return match.group(0).replace(url, hashed, 1)
+
+        def replace_srcset(match):
+            candidates = []
+            for candidate in match.group('value').split(','):
+                url, _, descriptor = candidate.strip().partition(' ')
+                hashed = self._hashed_url(base, url)
+                candidates.append(f"{hashed or url} {descriptor}".strip())
+            return f"{match.group('attr')}{match.group('quote')}{', '.join(candidates)}{match.group('quote')}"
+
+        text = pattern.sub(replace, text)
+        if pattern is HTML_REF_RE:
+            text = SRCSET_RE.sub(replace_srcset, text)
+        return text
+
+    def rewrite_html(self, name, text):
+        """HTML text as it would be served from root/name, with local references pointing at hashed URLs."""
+        return self._rewrite(name, text, HTML_REF_RE)
+
+    def _add(self, name, path, data=None, mtime=None):
+        if path is None:
+            size, mtime = len(data), mtime or time.time()
+        else:
+            stat = os.stat(path)
+            size, mtime = stat.st_size, stat.st_mtime
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if data is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            digest = digest.hexdigest()
+        else:
+            digest = hashlib.sha256(data).hexdigest()
+        asset = Asset(path, name, mimetype, len(data) if data is not None else size, mtime,
+                      digest, self._hashed_name(name, digest), data)
+
+        if mimetype.startswith(COMPRESSIBLE_TYPES) and asset.size >= self.min_compress_size:
+            if data is None:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+            else:
+                raw = data
+            candidates = {'gzip': gzip.compress(raw, self.gzip_level, mtime=0)}
+            if brotli is not None:
+                candidates['br'] = brotli.compress(raw, quality=self.brotli_quality)
+            # Keep only variants that actually save bytes
+            asset.encoded = {enc: body for enc, body in candidates.items() if len(body) < asset.size}
+
+        old = self.assets.get(name)
+        if old is not None:
+            self.by_hash.pop(old.hashed_name, None)
+        self.assets[name] = asset
+        self.by_hash[asset.hashed_name] = asset
+        return asset
+
+    def build(self):
+        """(Re)scan root: hash binaries first, then CSS, then HTML so rewritten references resolve."""
+        started = time.perf_counter()
+        self.assets, self.by_hash = {}, {}
+        files = list(self._walk())
+
+        def kind(name):
+            return {'.css': 1, '.html': 2, '.htm': 2}.get(posixpath.splitext(name)[1].lower(), 0)
+
+        for rank in (0, 1, 2):
+            for name, path in files:
+                if kind(name) != rank:
+                    continue
+                if rank == 0:
+                    self._add(name, path)
+                    continue
+                with open(path, encoding='utf-8', errors='surrogateescape') as f:
+                    text = self._rewrite(name, f.read(), CSS_REF_RE if rank == 1 else HTML_REF_RE)
+                self._add(name, path, text.encode('utf-8', errors='surrogateescape'))
+        for name, (html, mtime) in self.rendered.items():
+            self._add(name, None, self.rewrite_html(name, html).encode('utf-8'), mtime)
+
+        log.info("Static assets built", extra={
+            "root": self.root, "files": len(self.assets),
+            "compressed": sum(1 for a in self.assets.values() if a.encoded),
+            "brotli": brotli is not None, "duration_ms": round((time.perf_counter() - started) * 1000, 1)})
+        return self
+
+    def add_rendered(self, name, html, mtime=None):
+        """Serve generated HTML at root/name as if it were a page on disk (hashed references, gzip, ETag)."""
+        self.rendered[name] = (html, mtime)
+        return self._add(name, None, self.rewrite_html(name, html).encode('utf-8'), mtime)
+
+    def remove_rendered(self, name):
+        if self.rendered.pop(name, None) is None:
+            return
+        # Also hides a pre-rendered copy of the page on disk, which is just as stale
+        asset = self.assets.pop(name, None)
+        if asset is not None:
+            self.by_hash.pop(asset.hashed_name, None)
+
+    def _fresh(self, asset):
+        if not self.reload or asset.path is None:
+            return asset
+        try:
+            if os.stat(asset.path).st_mtime == asset.mtime:
+                return asset
+        except OSError:
+            return None
+        # Hashes of dependants change too, so rebuild everything (development only)
+        self.build()
+        return self.assets.get(asset.name)
+
+    # ------------------- Serving -------------------
+    def asset_url(self, name):
+        """Hashed, immutable URL for a file under root (the plain URL if it is unknown)."""
+        asset = self.assets.get(name.lstrip('/'))
+        if asset is None:
+            return f"{self.url_prefix}/{name.lstrip('/')}"
+        return f"{self.url_prefix}/assets/{asset.hashed_name}"
+
+    def _encoding_for(self, asset):
+        if not asset.encoded or request.range is not None:
+            return None
+        accept = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.encoded and accept[encoding]:
+                return encoding
+        return None
+
+    def serve(self, asset, cache_control):
+        asset = self._fresh(asset)
+        if asset is None:
+            abort(404)
+        self.served += 1
+        encoding = self._encoding_for(asset)
+
+        if encoding is not None or asset.data is not None:
+            body = asset.encoded[encoding] if encoding else asset.data
+            response = current_app.response_class(body, mimetype=asset.mimetype)
+            response.set_etag(f"{asset.digest[:32]}-{encoding}" if encoding else asset.digest[:32])
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.last_modified = asset.mtime
+            response.make_conditional(request, accept_ranges=encoding is None, complete_length=len(body))
+        else:
+            response = send_file(asset.path, mimetype=asset.mimetype, etag=asset.digest[:32],
+                                 last_modified=asset.mtime, conditional=True, max_age=None)
+
+        if asset.encoded:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            self.encoded_hits[encoding] += 1
+        if response.status_code == 304:
+            self.not_modified += 1
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def init_app(self, app):
+        """Register the 'frontend' blueprint: /, /<file> and /assets/<name>.<hash><ext>."""
+        blueprint = Blueprint('frontend', __name__)
+
+        @blueprint.route('/', methods=['GET', 'HEAD'])
+        def frontend_index():
+            asset = self.assets.get('index.html')
+            if asset is None:
+                abort(404)
+            return self.serve(asset, 'no-cache')
+
+        @blueprint.route('/assets/<path:hashed_name>', methods=['GET', 'HEAD'])
+        def frontend_hashed(hashed_name):
+            asset = self.by_hash.get(hashed_name)
+            if asset is None:
+                abort(404)
+            return self.serve(asset, IMMUTABLE)
+
+        @blueprint.route('/<path:filename>', methods=['GET', 'HEAD'])
+        def frontend_file(filename):
+            # Only files found by build() are served, so paths can't escape root
+            asset = self.assets.get(filename)
+            if asset is None:
+                abort(404)
+            return self.serve(asset, 'no-cache')
+
+        app.register_blueprint(blueprint, url_prefix=self.url_prefix or None)
+        app.jinja_env.globals['asset_url'] = self.asset_url
+
+    def stats(self):
+        return {
+            'files': len(self.assets),
+            'compressed': sum(1 for a in self.assets.values() if a.encoded),
+            'served': self.served,
+            'not_modified': self.not_modified,
+            'encoded': dict(self.encoded_hits)
+        }
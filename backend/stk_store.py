@@ -0,0 +1,279 @@
+import time
+from datetime import datetime, timedelta
+
+
+class StkRequestStore:
+    """SQLite-backed store for STK push requests, shared by every gunicorn worker.
+
+    Only the fields the API returns are kept (no raw callback payloads).
+    Per-status counts are maintained by triggers, so pending_count() is a
+    single primary-key lookup instead of a scan.
+
+    A push is recorded as 'submitting' under its own request_id before Daraja
+    is called, so the client can be answered at once. While it is submitting,
+    checkout_request_id holds the request_id; accepted() swaps in Daraja's
+    CheckoutRequestID and moves it to 'pending'. get() finds a request by
+    either ID.
+    """
+
+    FINAL_STATUSES = ('success', 'failed')
+    OPEN_STATUSES = ('submitting', 'pending')
+
+    def __init__(self, get_connection, ttl_seconds=86400, evict_interval=300):
+        self.get_connection = get_connection
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+        self._last_evict = time.monotonic()
+
+    @staticmethod
+    def _row_to_dict(row):
+        return {
+            'request_id': row['request_id'],
+            # Until Daraja accepts the push the row is keyed by its request_id; there is no CheckoutRequestID yet
+            'checkout_request_id': row['checkout_request_id']
+            if row['checkout_request_id'] != row['request_id'] else None,
+            'merchant_request_id': row['merchant_request_id'],
+            'phone': row['phone'],
+            'amount': row['amount'],
+            'status': row['status'],
+            'result_code': row['result_code'],
+            'result_desc': row['result_desc'],
+            'mpesa_receipt': row['mpesa_receipt'],
+            'timestamp': row['timestamp'],
+            'updated_at': row['updated_at']
+        }
+
+    # ------------------- Writes -------------------
+    def add(self, checkout_id, phone, amount, merchant_request_id=None):
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO stk_requests "
+                "(checkout_request_id, merchant_request_id, phone, amount, status, timestamp) "
+                "VALUES (?, ?, ?, ?, 'pending', ?)",
+                (checkout_id, merchant_request_id, phone, amount, datetime.now().isoformat())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self.maybe_evict()
+
+    def add_submitting(self, request_id, phone, amount):
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                "INSERT INTO stk_requests (checkout_request_id, request_id, phone, amount, status, timestamp) "
+                "VALUES (?, ?, ?, ?, 'submitting', ?)",
+                (request_id, request_id, phone, amount, datetime.now().isoformat())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self.maybe_evict()
+
+    def accepted(self, request_id, checkout_id, merchant_request_id=None):
+        """Daraja took the push: key the request by its CheckoutRequestID from now on."""
+        conn = self.get_connection()
+        try:
+            cur = conn.execute(
+                "UPDATE stk_requests SET checkout_request_id=?, merchant_request_id=?, status='pending', "
+                "updated_at=? WHERE request_id=? AND status='submitting'",
+                (checkout_id, merchant_request_id, datetime.now().isoformat(), request_id)
+            )
+            conn.commit()
+            return cur.rowcount > 0
+        finally:
+            conn.close()
+
+    def submit_failed(self, request_id, error):
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                "UPDATE stk_requests SET status='failed', result_desc=?, updated_at=? "
+                "WHERE request_id=? AND status='submitting'",
+                (error, datetime.now().isoformat(), request_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def update_status(self, checkout_id, status, result_code=None, result_desc=None, mpesa_receipt=None):
+        """Record a final status; returns False if the request is unknown."""
+        conn = self.get_connection()
+        try:
+            cur = conn.execute(
+                "UPDATE stk_requests SET status=?, result_code=?, result_desc=?, "
+                "mpesa_receipt=COALESCE(?, mpesa_receipt), updated_at=? "
+                "WHERE checkout_request_id=?",
+                (status, result_code, result_desc, mpesa_receipt, datetime.now().isoformat(), checkout_id)
+            )
+            conn.commit()
+            updated = cur.rowcount > 0
+        finally:
+            conn.close()
+        self.maybe_evict()
+        return updated
+
+    @staticmethod
+    def apply_results(cur, results, only_pending=False):
+        """Record many (checkout_id, result_code, result_desc, mpesa_receipt) results on the caller's cursor.
+
+        Does not commit, so the caller can make it part of a larger transaction.
+        Returns the checkout IDs that matched a stored request.
+        """
+        now = datetime.now().isoformat()
+        updated = []
+        for checkout_id, result_code, result_desc, mpesa_receipt in results:
+            cur.execute(
+                "UPDATE stk_requests SET status=?, result_code=?, result_desc=?, "
+                "mpesa_receipt=COALESCE(?, mpesa_receipt), updated_at=? "
+                "WHERE checkout_request_id=?" + (" AND status='pending'" if only_pending else ""),
+                ('success' if result_code == 0 else 'failed', result_code, result_desc, mpesa_receipt,
+                 now, checkout_id)
+            )
+            if cur.rowcount > 0:
+                updated.append(checkout_id)
+        return updated
+
+    def resolve_pending(self, results):
+        """apply_results() in one transaction, leaving requests that already got a callback alone."""
+        conn = self.get_connection()
+        try:
+            updated = self.apply_results(conn.cursor(), results, only_pending=True)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return updated
+
+    def claim_stale_pending(self, older_than_seconds, limit, recheck_after, max_attempts):
+        """Lease up to limit pending requests older than older_than_seconds for a status check.
+
+        Claimed rows are not handed out again (to this or another worker) for
+        recheck_after(attempts) seconds; rows checked max_attempts times are
+        left alone. Returns [(checkout_id, attempts)], oldest first.
+        """
+        cutoff = (datetime.now() - timedelta(seconds=older_than_seconds)).isoformat()
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT checkout_request_id, check_attempts FROM stk_requests "
+                "WHERE status='pending' AND timestamp < ? AND check_attempts < ? "
+                "AND (next_check_at IS NULL OR next_check_at <= ?) "
+                "ORDER BY timestamp LIMIT ?",
+                (cutoff, max_attempts, now, limit)
+            ).fetchall()
+            claimed = [(row['checkout_request_id'], row['check_attempts'] + 1) for row in rows]
+            conn.executemany(
+                "UPDATE stk_requests SET check_attempts=?, next_check_at=? WHERE checkout_request_id=?",
+                [(attempts, now + recheck_after(attempts), checkout_id) for checkout_id, attempts in claimed]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return claimed
+
+    def evict_expired(self):
+        """Delete finished requests older than the TTL; returns how many were removed.
+
+        Submissions that never got an answer (the worker died mid-call) go too.
+        """
+        cutoff = (datetime.now() - timedelta(seconds=self.ttl_seconds)).isoformat()
+        statuses = self.FINAL_STATUSES + ('submitting',)
+        placeholders = ','.join('?' for _ in statuses)
+        conn = self.get_connection()
+        try:
+            cur = conn.execute(
+                f"DELETE FROM stk_requests WHERE status IN ({placeholders}) AND timestamp < ?",
+                (*statuses, cutoff)
+            )
+            conn.commit()
+            removed = cur.rowcount
+        finally:
+            conn.close()
+        self._last_evict = time.monotonic()
+        return removed
+
+    def maybe_evict(self):
+        if time.monotonic() - self._last_evict >= self.evict_interval:
+            self.evict_expired()
+
+    # ------------------- Reads -------------------
+    def get(self, checkout_id):
+        """Look a request up by CheckoutRequestID or by the request_id returned when it was submitted."""
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT * FROM stk_requests WHERE checkout_request_id=? OR request_id=?",
+                               (checkout_id, checkout_id)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def finished_ids(self, checkout_ids):
+        """Return the subset of checkout_ids no longer awaiting an outcome under that ID.
+
+        A request that has left 'submitting' counts: it is now keyed by Daraja's CheckoutRequestID.
+        """
+        if not checkout_ids:
+            return []
+        placeholders = ','.join('?' for _ in checkout_ids)
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(
+                f"SELECT checkout_request_id FROM stk_requests "
+                f"WHERE checkout_request_id IN ({placeholders}) AND status IN (?, ?)",
+                (*checkout_ids, *self.OPEN_STATUSES)
+            ).fetchall()
+        finally:
+            conn.close()
+        still_open = {row['checkout_request_id'] for row in rows}
+        return [checkout_id for checkout_id in checkout_ids if checkout_id not in still_open]
+
+    def recent(self, limit=100):
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT * FROM stk_requests ORDER BY timestamp DESC LIMIT ?",
+                                (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(row) for row in rows]
+
+    def count_by_status(self):
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT status, count FROM stk_request_counts").fetchall()
+        finally:
+            conn.close()
+        return {row['status']: row['count'] for row in rows}
+
+    def pending_count(self):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT count FROM stk_request_counts WHERE status='pending'").fetchone()
+        finally:
+            conn.close()
+        return row['count'] if row else 0
+
+    def count(self):
+        return sum(self.count_by_status().values())
+
+    def stale_pending_counts(self, older_than_seconds, max_attempts):
+        """(awaiting reconciliation, given up on) among pending requests older than older_than_seconds."""
+        cutoff = (datetime.now() - timedelta(seconds=older_than_seconds)).isoformat()
+        conn = self.get_connection()
+        try:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(check_attempts < ?), 0), COALESCE(SUM(check_attempts >= ?), 0) "
+                "FROM stk_requests WHERE status='pending' AND timestamp < ?",
+                (max_attempts, max_attempts, cutoff)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0], row[1]
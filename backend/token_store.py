@@ -0,0 +1,130 @@
+import hashlib
+import secrets
+import threading
+import time
+
+
+def _digest(token):
+    # Only a hash of the bearer token is stored, so a leaked database can't be replayed
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class MemoryTokenStore:
+    """Process-local token store, for tests and single-process development."""
+
+    def __init__(self, ttl=86400, sweep_interval=300):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._tokens = {}    # digest -> (user_id, expires_at)
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def issue(self, user_id):
+        token = secrets.token_hex(16)
+        with self._lock:
+            self._tokens[_digest(token)] = (user_id, time.time() + self.ttl)
+        self.maybe_sweep()
+        return token
+
+    def get_user_id(self, token):
+        with self._lock:
+            entry = self._tokens.get(_digest(token))
+        if entry and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    def revoke(self, token):
+        with self._lock:
+            self._tokens.pop(_digest(token), None)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (uid, _) in self._tokens.items() if uid == user_id]:
+                del self._tokens[key]
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._tokens.items() if exp <= now]
+            for key in expired:
+                del self._tokens[key]
+            self._last_sweep = now
+        return len(expired)
+
+    def maybe_sweep(self):
+        if time.time() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def count(self):
+        with self._lock:
+            return len(self._tokens)
+
+
+class SqliteTokenStore:
+    """Token store shared by every gunicorn worker through the application database."""
+
+    def __init__(self, get_connection, ttl=86400, sweep_interval=300):
+        self.get_connection = get_connection
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.time()
+
+    def issue(self, user_id):
+        token = secrets.token_hex(16)
+        conn = self.get_connection()
+        try:
+            conn.execute("INSERT INTO auth_tokens (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+                         (_digest(token), user_id, time.time() + self.ttl))
+            conn.commit()
+        finally:
+            conn.close()
+        self.maybe_sweep()
+        return token
+
+    def get_user_id(self, token):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT user_id FROM auth_tokens WHERE token_hash=? AND expires_at > ?",
+                               (_digest(token), time.time())).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def revoke(self, token):
+        conn = self.get_connection()
+        try:
+            conn.execute("DELETE FROM auth_tokens WHERE token_hash=?", (_digest(token),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def revoke_user(self, user_id):
+        conn = self.get_connection()
+        try:
+            conn.execute("DELETE FROM auth_tokens WHERE user_id=?", (user_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def sweep(self):
+        conn = self.get_connection()
+        try:
+            cur = conn.execute("DELETE FROM auth_tokens WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            removed = cur.rowcount
+        finally:
+            conn.close()
+        self._last_sweep = time.time()
+        return removed
+
+    def maybe_sweep(self):
+        if time.time() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def count(self):
+        conn = self.get_connection()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM auth_tokens WHERE expires_at > ?",
+                                (time.time(),)).fetchone()[0]
+        finally:
+            conn.close()
@@ -1,17 +1,32 @@
 from flask import Flask, request, jsonify, session
+import logging
 import sqlite3
 import os
-from flask_cors import CORS
 import secrets
 import requests
 import base64
 from datetime import datetime
 from dotenv import load_dotenv
+from app_logging import init_request_logging, setup_logging
+from cors import CorsPolicy
+from db_pool import ConnectionPool
+import migrations
 
 # Load environment variables
 load_dotenv()
 
+# JSON lines via a background queue; LOG_SAMPLE_RATE thins INFO/DEBUG on the hot-path loggers
+setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    sample_rate=float(os.getenv('LOG_SAMPLE_RATE', '1.0')),
+    sampled_loggers=['viva.access', 'viva.mpesa', 'viva.auth']
+)
+log = logging.getLogger('viva.app')
+mpesa_log = logging.getLogger('viva.mpesa')
+auth_log = logging.getLogger('viva.auth')
+
 app = Flask(__name__)
+init_request_logging(app)
 
 # Get configuration from environment variables
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'supersecretkey')
@@ -26,25 +41,22 @@ app.config.update(
 
 DB = os.getenv('DATABASE_URL', 'viva_utalii.db')
 
-# DYNAMIC CORS CONFIGURATION FROM .env
-cors_origins = os.getenv('CORS_ORIGINS', '')
-if cors_origins:
-    # Split the comma-separated origins from .env
-    allowed_origins = [origin.strip() for origin in cors_origins.split(',')]
-else:
-    # Fallback to default development origins
-    allowed_origins = ['http://127.0.0.1:*', 'http://localhost:*']
-
-print(f"🌐 CORS Allowed Origins: {allowed_origins}")
-
-# ULTIMATE CORS FIX - Using environment configuration
-CORS(app, 
-     origins=allowed_origins,
-     supports_credentials=True,
-     allow_headers=['*'],
-     methods=['*']
+# Shared SQLite connection pool (WAL + tuned pragmas applied once per connection)
+db_pool = ConnectionPool(
+    DB,
+    max_size=int(os.getenv('DB_POOL_SIZE', '8')),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+    cache_size_kb=int(os.getenv('DB_CACHE_SIZE_KB', '16384')),
+    mmap_size=int(os.getenv('DB_MMAP_SIZE', '268435456')),
+    synchronous=os.getenv('DB_SYNCHRONOUS', 'NORMAL')
 )
 
+# CORS origins from .env (comma-separated; 'http://host:*' allows any port on that host)
+cors_policy = CorsPolicy.from_env(os.getenv('CORS_ORIGINS'), default='http://127.0.0.1:*,http://localhost:*',
+                                  expose_headers=('X-Request-ID',))
+cors_policy.init_app(app)
+log.info("CORS allowed origins", extra={"origins": cors_policy.origins})
+
 # ------------------- M-Pesa Daraja credentials (HARDCODED) -------------------
 CONSUMER_KEY = "MYO5kqmnAhdpKIbNlNoQnSweJ0KgxMImMGNiEG61Uc7XOAwD"
 CONSUMER_SECRET = "VkrHkM3xur8GzLPklzxsKgE0DQx9H8FYnv08bFeCVjThl6kW3Q8hq2T13EQgmmz7"
@@ -56,82 +68,19 @@ CALLBACK_URL = os.getenv('MPESA_CALLBACK_URL', 'https://siphonal-corny-dawson.ng
 stk_requests = {}  # key: CheckoutRequestID, value: {'phone':..., 'amount':..., 'status':...}
 
 def get_db_connection():
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Checked out from the pool; conn.close() hands it back instead of closing it
+    return db_pool.acquire()
 
 def init_db():
+    # Normally just a schema_version check; pending migrations run once, under a file lock
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL
-            )
-        ''')
-        
-        # Add deals table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS deals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                destination TEXT NOT NULL,
-                discount TEXT NOT NULL
-            )
-        ''')
-        
-        # Add bookings table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                destination_id TEXT NOT NULL,
-                dest_name TEXT NOT NULL,
-                arrive_date TEXT NOT NULL,
-                depart_date TEXT NOT NULL,
-                travelers INTEGER NOT NULL,
-                acc_tier TEXT NOT NULL,
-                total_cost INTEGER NOT NULL,
-                deposit_amount INTEGER NOT NULL,
-                paid_deposit BOOLEAN DEFAULT FALSE,
-                mpesa_phone TEXT,
-                mpesa_reference TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Add a test user if none exists
-        cur.execute("SELECT COUNT(*) FROM users")
-        if cur.fetchone()[0] == 0:
-            cur.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-                       ("John Doe", "john@example.com", "password123"))
-            print("✅ Test user created: john@example.com / password123")
-        
-        # Add sample deals
-        cur.execute("SELECT COUNT(*) FROM deals")
-        if cur.fetchone()[0] == 0:
-            sample_deals = [
-                ("Maasai Mara", "15% off for newsletter subscribers"),
-                ("Zanzibar", "All-inclusive package discount"),
-                ("Diani Beach", "30% OFF flash sale")
-            ]
-            cur.executemany("INSERT INTO deals (destination, discount) VALUES (?, ?)", sample_deals)
-            print("✅ Sample deals added")
-        
-        conn.commit()
-        conn.close()
-        print("✅ Database initialized successfully!")
-        
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
+        version = migrations.ensure_schema(DB, lambda: get_db_connection(), auto_migrate=DB_AUTO_MIGRATE)
+        log.info("Database schema ready", extra={"schema_version": version})
+    except Exception:
+        log.exception("Database initialization error")
 
-# Initialize database
-print("🔄 Starting database initialization...")
+# Set DB_AUTO_MIGRATE=false in production and run `python migrations.py migrate` once per deploy
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', 'True').lower() == 'true'
 init_db()
 
 # Store active sessions in memory
@@ -150,7 +99,7 @@ def get_user():
             if row:
                 return {'id': row[0], 'name': row[1], 'email': row[2]}
         except Exception as e:
-            print(f"Error getting user from session: {e}")
+            auth_log.warning("Error getting user from session", exc_info=True)
     
     # Fallback to checking Authorization header
     auth_header = request.headers.get('Authorization')
@@ -167,7 +116,7 @@ def get_user():
                 if row:
                     return {'id': row[0], 'name': row[1], 'email': row[2]}
             except Exception as e:
-                print(f"Error getting user from token: {e}")
+                auth_log.warning("Error getting user from token", exc_info=True)
     
     return None
 
@@ -179,52 +128,22 @@ def get_access_token():
         r.raise_for_status()
         return r.json().get("access_token")
     except requests.exceptions.RequestException as e:
-        print(f"Error getting access token: {e}")
+        mpesa_log.warning("Error getting access token", extra={"error": str(e)})
         return None
 
 def daraja_timestamp():
     return datetime.now().strftime("%Y%m%d%H%M%S")
 
 
-@app.before_request
-def handle_options():
-    if request.method == 'OPTIONS':
-        response = jsonify({'status': 'preflight'})
-        origin = request.headers.get('Origin')
-        if origin in allowed_origins or any(origin.startswith(allowed.replace(':*', '')) for allowed in allowed_origins if ':*' in allowed):
-            response.headers.add('Access-Control-Allow-Origin', origin)
-        response.headers.add('Access-Control-Allow-Headers', '*')
-        response.headers.add('Access-Control-Allow-Methods', '*')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        return response
-
-@app.after_request
-def after_request(response):
-    """Add CORS headers to all responses"""
-    origin = request.headers.get('Origin')
-    if origin in allowed_origins or any(origin and origin.startswith(allowed.replace(':*', '')) for allowed in allowed_origins if ':*' in allowed):
-        response.headers.add('Access-Control-Allow-Origin', origin)
-    response.headers.add('Access-Control-Allow-Headers', '*')
-    response.headers.add('Access-Control-Allow-Methods', '*')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    response.headers.add('Access-Control-Max-Age', '86400')
-    return response
-
 # ------------------- M-Pesa Routes -------------------
 @app.route("/api/mpesa/stkpush", methods=['POST', 'OPTIONS'])
 def stk_push():
-    print(f"🎯 STK Push request received from origin: {request.headers.get('Origin')}")
-    
     if request.method == 'OPTIONS':
-        response = jsonify({'status': 'preflight_ok'})
-        origin = request.headers.get('Origin')
-        if origin in allowed_origins or any(origin and origin.startswith(allowed.replace(':*', '')) for allowed in allowed_origins if ':*' in allowed):
-            response.headers.add('Access-Control-Allow-Origin', origin)
-        return response
+        return '', 200
         
     try:
         data = request.get_json()
-        print(f"📦 STK Push data: {data}")
+        mpesa_log.debug("STK push request", extra={"origin": request.headers.get('Origin'), "payload": data})
         
         # Validate required fields
         if not data:
@@ -247,7 +166,6 @@ def stk_push():
             return jsonify({"success": False, "error": "Invalid amount"}), 400
 
         # Get access token
-        print("🔑 Getting M-Pesa access token...")
         access_token = get_access_token()
         if not access_token:
             return jsonify({"success": False, "error": "Failed to get access token"}), 500
@@ -277,7 +195,7 @@ def stk_push():
             "TransactionDesc": desc
         }
 
-        print(f"📤 Sending STK push to M-Pesa: {payload}")
+        mpesa_log.debug("Sending STK push", extra={"payload": payload})
 
         try:
             resp = requests.post(
@@ -288,7 +206,7 @@ def stk_push():
             )
             resp.raise_for_status()
             result = resp.json()
-            print(f"📥 M-Pesa response: {result}")
+            mpesa_log.info("STK push response", extra={"phone": phone, "amount": amount, "response": result})
             
             # Check if request was successful
             if "ResponseCode" in result and result["ResponseCode"] == "0":
@@ -313,27 +231,27 @@ def stk_push():
                 })
             else:
                 error_message = result.get("errorMessage", "STK push failed")
-                print(f"❌ M-Pesa error: {error_message}")
+                mpesa_log.warning("STK push rejected", extra={"phone": phone, "error": error_message})
                 return jsonify({
                     "success": False,
                     "error": error_message
                 }), 400
                 
         except requests.exceptions.RequestException as e:
-            print(f"❌ Network error: {e}")
+            mpesa_log.warning("STK push network error", extra={"phone": phone, "error": str(e)})
             return jsonify({
                 "success": False, 
                 "error": f"Network error: {str(e)}"
             }), 500
         except Exception as e:
-            print(f"❌ Unexpected error: {e}")
+            mpesa_log.exception("Unexpected STK push error")
             return jsonify({
                 "success": False, 
                 "error": f"Unexpected error: {str(e)}"
             }), 500
             
     except Exception as e:
-        print(f"❌ Request processing error: {e}")
+        mpesa_log.exception("STK push request processing error")
         return jsonify({
             "success": False, 
             "error": f"Request processing error: {str(e)}"
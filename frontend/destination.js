@@ -0,0 +1,292 @@
+// Initialize when page loads
+document.addEventListener('DOMContentLoaded', function() {
+  console.log('=== AUTHENTICATION DEBUG ===');
+
+  // Login required card elements
+  const loginRequiredOverlay = document.getElementById('login-required-overlay');
+  const closeLoginCard = document.getElementById('closeLoginCard');
+  const goToLoginFromCard = document.getElementById('goToLoginFromCard');
+
+  // Login required card functionality
+  if (closeLoginCard) {
+    closeLoginCard.addEventListener('click', () => {
+      loginRequiredOverlay.style.display = 'none';
+    });
+  }
+
+  if (goToLoginFromCard) {
+    goToLoginFromCard.addEventListener('click', () => {
+      window.location.href = 'login.html';
+    });
+  }
+
+  // Close login card when clicking outside
+  if (loginRequiredOverlay) {
+    loginRequiredOverlay.addEventListener('click', (e) => {
+      if (e.target === loginRequiredOverlay) {
+        loginRequiredOverlay.style.display = 'none';
+      }
+    });
+  }
+
+  // Enhanced user login detection
+  function userIsLoggedIn() {
+    // Check multiple possible localStorage keys
+    const possibleUserKeys = ['vivaUtalii_user', 'user_data', 'auth_user', 'currentUser', 'userLoggedIn'];
+    const possibleTokenKeys = ['vivaUtalii_token', 'auth_token', 'token', 'access_token', 'userToken'];
+
+    let userData = null;
+    let token = null;
+
+    // Find user data in localStorage
+    for (const key of possibleUserKeys) {
+      const data = localStorage.getItem(key);
+      if (data) {
+        userData = data;
+        console.log(`✓ Found user data in localStorage: ${key}`);
+        break;
+      }
+    }
+
+    // Find token in localStorage
+    for (const key of possibleTokenKeys) {
+      const data = localStorage.getItem(key);
+      if (data) {
+        token = data;
+        console.log(`✓ Found token in localStorage: ${key}`);
+        break;
+      }
+    }
+
+    // Also check sessionStorage as fallback
+    if (!userData) {
+      for (const key of possibleUserKeys) {
+        const data = sessionStorage.getItem(key);
+        if (data) {
+          userData = data;
+          console.log(`✓ Found user data in sessionStorage: ${key}`);
+          break;
+        }
+      }
+    }
+
+    if (!token) {
+      for (const key of possibleTokenKeys) {
+        const data = sessionStorage.getItem(key);
+        if (data) {
+          token = data;
+          console.log(`✓ Found token in sessionStorage: ${key}`);
+          break;
+        }
+      }
+    }
+
+    // Special case: check if userLoggedIn is a string "true"
+    if (userData === "true" || token === "true") {
+      console.log('✓ Found boolean true value for login status');
+      return true;
+    }
+
+    // Parse JSON data if possible
+    try {
+      if (userData && typeof userData === 'string') {
+        const parsed = JSON.parse(userData);
+        if (parsed && typeof parsed === 'object') {
+          userData = parsed;
+          console.log('✓ Successfully parsed user data JSON');
+        }
+      }
+    } catch (e) {
+      console.log('User data is not JSON, using as-is');
+    }
+
+    const isLoggedIn = !!(userData && token);
+    console.log('Final login status:', isLoggedIn ? 'LOGGED IN' : 'NOT LOGGED IN');
+    console.log('All localStorage keys:', Object.keys(localStorage));
+    console.log('================================');
+
+    return isLoggedIn;
+  }
+
+  // Function to update UI based on login status
+  function updateAuthUI() {
+    const authButtonsContainer = document.getElementById('auth-buttons');
+    const navLinks = document.querySelector('.nav-links');
+    const mobileDropdown = document.getElementById('mobileDropdown');
+    const isLoggedIn = userIsLoggedIn();
+
+    // Clear existing Plan Your Trip button
+    authButtonsContainer.innerHTML = '';
+
+    // Remove existing profile link from nav if exists
+    const existingProfileLink = document.querySelector('.profile-nav-link');
+    if (existingProfileLink) {
+      existingProfileLink.parentElement.remove();
+    }
+
+    // Create the ONE Plan Your Trip button
+    const planBtn = document.createElement('button');
+    planBtn.className = 'trip-btn';
+    planBtn.id = 'topPlanBtn';
+    planBtn.textContent = 'Plan Your Trip';
+
+    if (isLoggedIn) {
+      // User is logged in: Direct redirect to plan.html
+      planBtn.addEventListener('click', function() {
+        console.log('✓ User is logged in, redirecting to plan.html');
+        window.location.href = 'plan.html';
+      });
+
+      // Add Profile link to navigation menu
+      const profileLi = document.createElement('li');
+      const profileLink = document.createElement('a');
+      profileLink.className = 'profile-nav-link';
+      profileLink.textContent = 'Profile';
+      profileLink.href = 'profile.html';
+      profileLi.appendChild(profileLink);
+      navLinks.appendChild(profileLi);
+
+    } else {
+      // User is logged out: Show login overlay
+      planBtn.addEventListener('click', function() {
+        console.log('✗ User is not logged in, showing login card');
+        if (loginRequiredOverlay) {
+          loginRequiredOverlay.style.display = 'flex';
+        } else {
+          console.error('Login overlay element not found!');
+          window.location.href = 'login.html';
+        }
+      });
+    }
+
+    authButtonsContainer.appendChild(planBtn);
+
+    // Update mobile dropdown
+    if (mobileDropdown) {
+      const mobileNav = mobileDropdown.querySelector('nav');
+
+      // Remove existing mobile plan link if exists
+      const existingMobilePlan = mobileDropdown.querySelector('#mobilePlan');
+      if (existingMobilePlan) existingMobilePlan.remove();
+
+      // Remove profile link if exists
+      const existingMobileProfile = mobileDropdown.querySelector('#mobileProfile');
+      if (existingMobileProfile) existingMobileProfile.remove();
+
+      // Add plan link for mobile
+      const planLink = document.createElement('a');
+      planLink.href = '#';
+      planLink.textContent = 'Plan Your Trip';
+      planLink.id = 'mobilePlan';
+      mobileNav.appendChild(planLink);
+
+      // Add profile link for mobile if logged in
+      if (isLoggedIn) {
+        const profileLink = document.createElement('a');
+        profileLink.href = 'profile.html';
+        profileLink.textContent = 'Profile';
+        profileLink.id = 'mobileProfile';
+        mobileNav.appendChild(profileLink);
+      }
+    }
+
+    // Add event listeners for mobile dropdown links
+    const mobilePlanLink = document.getElementById('mobilePlan');
+    if (mobilePlanLink) {
+      mobilePlanLink.addEventListener('click', function(e) {
+        e.preventDefault();
+        if (isLoggedIn) {
+          // Direct redirect when logged in
+          console.log('✓ Mobile: User is logged in, redirecting to plan.html');
+          window.location.href = 'plan.html';
+        } else {
+          // Show login overlay when not logged in
+          console.log('✗ Mobile: User is not logged in, showing login card');
+          if (loginRequiredOverlay) {
+            loginRequiredOverlay.style.display = 'flex';
+          } else {
+            window.location.href = 'login.html';
+          }
+        }
+      });
+    }
+  }
+
+  // Function to handle plan trip button clicks (for bottom CTA)
+  function handlePlanTripClick() {
+    console.log('Plan Trip button clicked - checking authentication...');
+    const isLoggedIn = userIsLoggedIn();
+
+    if (isLoggedIn) {
+      console.log('✓ User is logged in, redirecting to plan.html');
+      window.location.href = 'plan.html';
+    } else {
+      console.log('✗ User is not logged in, showing login card');
+      if (loginRequiredOverlay) {
+        loginRequiredOverlay.style.display = 'flex';
+      } else {
+        console.error('Login overlay element not found!');
+        window.location.href = 'login.html';
+      }
+    }
+  }
+
+  // Initialize UI
+  updateAuthUI();
+
+  // Bottom CTA logic
+  const bottomStartBtn = document.getElementById('bottomStartBtn');
+  bottomStartBtn.addEventListener('click', handlePlanTripClick);
+
+  // Reviews button - the page template sets data-reviews-page on <body>
+  document.getElementById('reviewsBtn').addEventListener('click', function(){
+    window.location.href = document.body.dataset.reviewsPage;
+  });
+
+  // Hamburger & mobile dropdown logic (collapse under header)
+  const hamburgerToggle = document.getElementById('hamburgerToggle');
+  const mobileDropdown = document.getElementById('mobileDropdown');
+
+  hamburgerToggle && hamburgerToggle.addEventListener('click', function(e){
+    if (!mobileDropdown) return;
+    const isOpen = mobileDropdown.classList.contains('open');
+    if (isOpen) {
+      mobileDropdown.classList.remove('open');
+      mobileDropdown.setAttribute('aria-hidden','true');
+      hamburgerToggle.setAttribute('aria-expanded','false');
+    } else {
+      mobileDropdown.classList.add('open');
+      mobileDropdown.setAttribute('aria-hidden','false');
+      hamburgerToggle.setAttribute('aria-expanded','true');
+    }
+  });
+
+  // Close mobile dropdown on outside click or Escape
+  document.addEventListener('click', function(e){
+    if (!mobileDropdown || !mobileDropdown.classList.contains('open')) return;
+    const target = e.target;
+    const insideDropdown = mobileDropdown.contains(target);
+    const clickedHamburger = hamburgerToggle.contains(target);
+    if (!insideDropdown && !clickedHamburger) {
+      mobileDropdown.classList.remove('open');
+      mobileDropdown.setAttribute('aria-hidden','true');
+      hamburgerToggle.setAttribute('aria-expanded','false');
+    }
+  });
+
+  document.addEventListener('keydown', function(e){
+    if (e.key === 'Escape' && mobileDropdown && mobileDropdown.classList.contains('open')) {
+      mobileDropdown.classList.remove('open');
+      mobileDropdown.setAttribute('aria-hidden','true');
+      hamburgerToggle.setAttribute('aria-expanded','false');
+    }
+  });
+
+  // Listen for storage changes (in case user logs in/out in another tab)
+  window.addEventListener('storage', function(e) {
+    if (e.key.includes('user') || e.key.includes('token') || e.key.includes('auth')) {
+      console.log('Authentication state changed, updating UI...');
+      updateAuthUI();
+    }
+  });
+});
@@ -0,0 +1,210 @@
+// Simple animation for cards when they come into view
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.querySelector('.reviews-grid');
+    const loadMore = document.querySelector('.load-more');
+    const loadMoreButton = document.getElementById('loadMoreReviews');
+    const slug = document.body.dataset.slug;
+
+    const observer = new IntersectionObserver((entries) => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                entry.target.style.animationPlayState = 'running';
+                observer.unobserve(entry.target);
+            }
+        });
+    }, { threshold: 0.1 });
+
+    function animateCard(card) {
+        card.style.animationPlayState = 'paused';
+        observer.observe(card);
+    }
+
+    container.querySelectorAll('.review-card').forEach(animateCard);
+
+    // Filter buttons functionality
+    const filterButtons = document.querySelectorAll('.filters .filter-btn');
+
+    // Labels for review tags, as shown on the tag filter buttons
+    const tagLabels = {};
+    filterButtons.forEach(button => {
+        tagLabels[button.getAttribute('data-filter')] = button.textContent.trim();
+    });
+
+    // The page is rendered with the first page of highest rated reviews; the rest come from the API
+    let currentSort = container.dataset.sort || 'rating';
+    let currentFilter = 'all';
+    let nextCursor = container.dataset.nextCursor || null;
+
+    // Function to filter reviews
+    function filterReviews(filterType) {
+        container.querySelectorAll('.review-card').forEach(card => {
+            const tags = card.getAttribute('data-tags').split(',');
+            // Tag filters come from the destination's review tags
+            const shouldShow = filterType === 'all' || tags.includes(filterType);
+            card.style.display = shouldShow ? 'block' : 'none';
+        });
+    }
+
+    // Function to sort reviews
+    function sortReviews(sortType) {
+        const cards = Array.from(container.querySelectorAll('.review-card'));
+
+        if (sortType === 'rating') {
+            // Sort by rating (highest first)
+            cards.sort((a, b) => {
+                const ratingA = parseFloat(a.getAttribute('data-rating'));
+                const ratingB = parseFloat(b.getAttribute('data-rating'));
+                return ratingB - ratingA;
+            });
+        } else if (sortType === 'recent') {
+            // Sort by date (most recent first)
+            cards.sort((a, b) => {
+                const dateA = new Date(a.getAttribute('data-date'));
+                const dateB = new Date(b.getAttribute('data-date'));
+                return dateB - dateA;
+            });
+        }
+
+        // Re-append cards in sorted order
+        cards.forEach(card => {
+            container.appendChild(card);
+        });
+    }
+
+    // Build a card like the server-rendered ones from an API review
+    function element(tag, className, text) {
+        const el = document.createElement(tag);
+        if (className) el.className = className;
+        if (text !== undefined) el.textContent = text;
+        return el;
+    }
+
+    function icon(className) {
+        return element('i', className);
+    }
+
+    function stars(rating) {
+        const wrapper = element('div', 'review-stars');
+        for (let i = 1; i <= 5; i++) {
+            wrapper.appendChild(icon(i <= rating ? 'fas fa-star' : i - 1 < rating ? 'fas fa-star-half-alt' : 'far fa-star'));
+        }
+        return wrapper;
+    }
+
+    function longDate(iso) {
+        const [year, month, day] = iso.split('-').map(Number);
+        return new Date(year, month - 1, day).toLocaleDateString('en-US', { year: 'numeric', month: 'long', day: 'numeric' });
+    }
+
+    function reviewCard(review) {
+        const card = element('div', 'review-card');
+        card.dataset.id = review.id;
+        card.dataset.rating = review.rating;
+        card.dataset.date = review.date;
+        card.dataset.tags = review.tags.join(',');
+
+        const header = element('div', 'review-header');
+        const avatar = element('div', 'avatar');
+        avatar.appendChild(icon('fas fa-user'));
+        const info = element('div', 'reviewer-info');
+        info.appendChild(element('div', 'reviewer-name', review.name));
+        info.appendChild(element('div', 'review-date', longDate(review.date)));
+        header.append(avatar, info, stars(review.rating));
+
+        const tags = element('div', 'review-tags');
+        review.tags.forEach(tag => {
+            tags.appendChild(element('span', 'tag', tagLabels[tag] || tag.charAt(0).toUpperCase() + tag.slice(1)));
+        });
+
+        const source = element('div', 'review-source');
+        const origin = element('div', 'source');
+        origin.append(icon(review.source_icon), ` ${review.source}`);
+        const helpful = element('div', 'helpful');
+        const helpfulButton = element('button', 'helpful-btn');
+        helpfulButton.append(icon('far fa-thumbs-up'), ` Helpful (${review.helpful})`);
+        helpful.appendChild(helpfulButton);
+        source.append(origin, helpful);
+
+        card.append(header, element('div', 'review-text', review.text), tags, source);
+        return card;
+    }
+
+    async function fetchReviews(sort, cursor) {
+        const params = new URLSearchParams({ sort });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${window.BACKEND_URL}/api/destinations/${encodeURIComponent(slug)}/reviews?${params}`);
+        if (!response.ok) throw new Error(`Reviews request failed: ${response.status}`);
+        return { reviews: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+    }
+
+    // Append (or, for a new sort order, replace) cards with a page from the API
+    async function loadReviews(sort, cursor) {
+        loadMoreButton.disabled = true;
+        try {
+            const page = await fetchReviews(sort, cursor);
+            if (!cursor) container.replaceChildren();
+            page.reviews.forEach(review => {
+                const card = reviewCard(review);
+                container.appendChild(card);
+                animateCard(card);
+            });
+            currentSort = sort;
+            nextCursor = page.nextCursor;
+            loadMore.hidden = !nextCursor;
+            filterReviews(currentFilter);
+        } catch (error) {
+            console.warn('Could not load reviews:', error);
+        } finally {
+            loadMoreButton.disabled = false;
+        }
+    }
+
+    // Add event listeners to filter buttons
+    filterButtons.forEach(button => {
+        button.addEventListener('click', function() {
+            // Remove active class from all buttons
+            filterButtons.forEach(btn => btn.classList.remove('active'));
+
+            // Add active class to clicked button
+            this.classList.add('active');
+
+            // Get filter type from data attribute
+            const filterType = this.getAttribute('data-filter');
+
+            if (filterType === 'rating' || filterType === 'recent') {
+                currentFilter = 'all';
+                if (nextCursor && filterType !== currentSort) {
+                    // Not everything is loaded, so the server has to do the sorting
+                    loadReviews(filterType, null);
+                    return;
+                }
+                currentSort = filterType;
+                filterReviews(currentFilter);
+                sortReviews(filterType);
+            } else {
+                // Apply filter to the reviews loaded so far
+                currentFilter = filterType;
+                filterReviews(currentFilter);
+            }
+        });
+    });
+
+    loadMoreButton.addEventListener('click', function() {
+        if (nextCursor) loadReviews(currentSort, nextCursor);
+    });
+
+    // Helpful button functionality (the grid is delegated so fetched cards work too)
+    container.addEventListener('click', function(event) {
+        const button = event.target.closest('.helpful-btn');
+        if (!button) return;
+        const countElement = button.querySelector('span');
+        if (!countElement) {
+            const count = parseInt(button.innerHTML.match(/\((\d+)\)/)[1]);
+            button.innerHTML = `<i class="far fa-thumbs-up"></i> Helpful <span>(${count + 1})</span>`;
+        } else {
+            const count = parseInt(countElement.textContent.match(/\((\d+)\)/)[1]);
+            countElement.textContent = `(${count + 1})`;
+        }
+        button.style.color = '#FFD700';
+    });
+});
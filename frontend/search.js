@@ -0,0 +1,98 @@
+// Search box: suggestions while typing, ranked results on submit (/api/search)
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-search]').forEach(function(search) {
+        const form = search.querySelector('form');
+        const input = form.querySelector('input[name="q"]');
+        const suggestions = search.querySelector('.search-suggestions');
+        const results = search.querySelector('.search-results');
+        let timer = null;
+        let latest = 0;
+
+        async function api(path, query) {
+            const response = await fetch(`${window.BACKEND_URL}${path}?${new URLSearchParams({ q: query })}`);
+            if (!response.ok) throw new Error(`Search request failed: ${response.status}`);
+            return response.json();
+        }
+
+        function link(item) {
+            const a = document.createElement('a');
+            a.href = item.url || '#';
+            a.textContent = item.title;
+            return a;
+        }
+
+        function showSuggestions(items) {
+            suggestions.replaceChildren(...items.filter(item => item.url).map(item => {
+                const li = document.createElement('li');
+                li.appendChild(link(item));
+                return li;
+            }));
+            suggestions.hidden = suggestions.children.length === 0;
+        }
+
+        function showResults(items) {
+            if (items.length === 0) {
+                const li = document.createElement('li');
+                li.textContent = 'No matches. Try another word.';
+                results.replaceChildren(li);
+            } else {
+                results.replaceChildren(...items.map(item => {
+                    const li = document.createElement('li');
+                    const kind = document.createElement('span');
+                    kind.className = 'search-kind';
+                    kind.textContent = item.kind;
+                    const snippet = document.createElement('p');
+                    // Escaped by the server; only the <mark> tags around matches are markup
+                    snippet.innerHTML = item.snippet;
+                    li.append(link(item), kind, snippet);
+                    return li;
+                }));
+            }
+            results.hidden = false;
+        }
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (query.length < 2) {
+                showSuggestions([]);
+                return;
+            }
+            // Wait for a pause in typing, and ignore answers that arrive after a newer request
+            timer = setTimeout(async function() {
+                const request = ++latest;
+                try {
+                    const data = await api('/api/search/suggest', query);
+                    if (request === latest) showSuggestions(data.suggestions);
+                } catch (error) {
+                    console.warn('Search suggestions unavailable:', error);
+                }
+            }, 150);
+        });
+
+        form.addEventListener('submit', async function(event) {
+            event.preventDefault();
+            clearTimeout(timer);
+            latest++;
+            showSuggestions([]);
+            const query = input.value.trim();
+            if (!query) {
+                results.hidden = true;
+                return;
+            }
+            try {
+                const data = await api('/api/search', query);
+                showResults(data.results);
+            } catch (error) {
+                console.warn('Search unavailable:', error);
+            }
+        });
+
+        input.addEventListener('keydown', function(event) {
+            if (event.key === 'Escape') showSuggestions([]);
+        });
+        document.addEventListener('click', function(event) {
+            if (!search.contains(event.target)) showSuggestions([]);
+        });
+    });
+});